@@ -1,5 +1,8 @@
+import argparse
 import asyncio
+import os
 import signal
+import socket
 import sys
 
 COMMANDS = [
@@ -7,6 +10,20 @@ COMMANDS = [
     ("frontend", ["python3", "src/frontend/main.py"]),
 ]
 
+# production mode: (app, host, port), served by workers of serving.py
+SERVED_APPS = [
+    ("backend", "0.0.0.0", 5000),
+    ("frontend", "0.0.0.0", 4200),
+]
+MIGRATE_COMMAND = ["python3", "src/backend/migrations.py"]
+
+RESTART_BACKOFF_SECONDS = 0.5
+RESTART_BACKOFF_MAX_SECONDS = 30
+# a worker that stayed up this long was healthy, its next crash starts the backoff over
+HEALTHY_UPTIME_SECONDS = 30
+# how long a new worker gets to come up before the old one is stopped on reload
+RELOAD_STARTUP_SECONDS = 2
+
 
 async def stream(prefix, stream):
     while line := await stream.readline():
@@ -22,7 +39,147 @@ async def run(name, cmd):
     return await proc.wait()
 
 
-async def main():
+class WorkerSlot:
+    """One worker of an app that is kept running: restarted with backoff when it
+    crashes, and replaced by a fresh one on reload.
+
+    Args:
+        name (str): App the worker serves, "backend" or "frontend"
+        index (int): Number of the worker within its app, used in the log prefix
+        cmd (list[str]): Command that starts the worker
+        sock (socket.socket): Listening socket the worker inherits
+    """
+
+    def __init__(self, name, index, cmd, sock):
+        self.name = name
+        self.prefix = f"{name}:{index}"
+        self.cmd = cmd
+        self.sock = sock
+        self.proc = None
+        self._output = None
+        self._reloading = asyncio.Lock()
+        self.stopping = False
+
+    async def spawn(self):
+        proc = await asyncio.create_subprocess_exec(
+            *self.cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            pass_fds=(self.sock.fileno(),),
+        )
+        output = asyncio.gather(stream(self.prefix, proc.stdout), stream(self.prefix, proc.stderr))
+        return proc, output
+
+    async def supervise(self):
+        loop = asyncio.get_running_loop()
+        failures = 0
+        replacement = None
+
+        while not self.stopping:
+            proc, output = replacement or await self.spawn()
+            replacement = None
+            self.proc = proc
+            started_at = loop.time()
+
+            code = await proc.wait()
+            await output
+            if self.stopping:
+                break
+            if self.proc is not proc:
+                # replaced on reload, the new worker is already running
+                replacement = (self.proc, self._output)
+                continue
+
+            uptime = loop.time() - started_at
+            failures = 1 if uptime >= HEALTHY_UPTIME_SECONDS else failures + 1
+            delay = min(RESTART_BACKOFF_MAX_SECONDS, RESTART_BACKOFF_SECONDS * 2 ** (failures - 1))
+            print(f"[{self.prefix}] exited with code {code} after {uptime:.1f}s, restarting in {delay:.1f}s", flush=True)
+            await asyncio.sleep(delay)
+
+    async def reload(self):
+        """Starts a new worker, gives it time to come up and gracefully stops the old one"""
+        async with self._reloading:
+            old = self.proc
+            if self.stopping or old is None or old.returncode is not None:
+                return
+
+            new, output = await self.spawn()
+            self.proc, self._output = new, output
+            await asyncio.sleep(RELOAD_STARTUP_SECONDS)
+
+            if self.proc is not new:
+                # replaced again in the meantime, nothing would supervise this one
+                if new.returncode is None:
+                    new.send_signal(signal.SIGTERM)
+                return
+            if new.returncode is not None and old.returncode is None and not self.stopping:
+                print(f"[{self.prefix}] new worker exited with code {new.returncode} on reload, keeping the old one", flush=True)
+                self.proc, self._output = old, None
+                return
+            if old.returncode is None:
+                old.send_signal(signal.SIGTERM)
+
+    def stop(self):
+        self.stopping = True
+        if self.proc is not None and self.proc.returncode is None:
+            self.proc.send_signal(signal.SIGTERM)
+
+
+def bind(host, port):
+    sock = socket.create_server((host, port), backlog=1024)
+    sock.set_inheritable(True)
+    return sock
+
+
+async def serve_production(workers, threads):
+    """Runs every app as `workers` pre-forked processes with `threads` threads each.
+
+    The listening sockets are bound here once and shared by all workers of an app.
+    SIGHUP reloads the workers one at a time, SIGINT/SIGTERM stops everything.
+    """
+    # migrations run once up front instead of racing each other in every worker
+    code = await run("migrate", MIGRATE_COMMAND)
+    if code != 0:
+        print(f"[migrate] failed with code {code}, not starting", flush=True)
+        return code
+
+    slots = []
+    for name, host, port in SERVED_APPS:
+        sock = bind(host, port)
+        cmd = ["python3", "serving.py", name, "--fd", str(sock.fileno()), "--host", host, "--threads", str(threads)]
+        slots.extend(WorkerSlot(name, index, cmd, sock) for index in range(1, workers + 1))
+
+    reloading = asyncio.Lock()
+    reload_queued = False
+
+    async def reload():
+        # a HUP during a reload queues one more (there may be newer code to pick up),
+        # any further ones are covered by that
+        nonlocal reload_queued
+        if reloading.locked():
+            if reload_queued:
+                return
+            reload_queued = True
+        async with reloading:
+            reload_queued = False
+            print("[main] reloading workers", flush=True)
+            for slot in slots:
+                await slot.reload()
+            print("[main] reload done", flush=True)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: [slot.stop() for slot in slots])
+    loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(reload()))
+
+    await asyncio.gather(*(slot.supervise() for slot in slots))
+    return 0
+
+
+async def main(args):
+    if args.production:
+        return await serve_production(args.workers, args.threads)
+
     tasks = [asyncio.create_task(run(name, cmd)) for name, cmd in COMMANDS]
 
     loop = asyncio.get_running_loop()
@@ -31,5 +188,14 @@ async def main():
 
     await asyncio.gather(*tasks)
 
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Runs the backend and the frontend")
+    parser.add_argument("--production", action="store_true",
+                        default=os.getenv("SERVE_MODE", "development") == "production",
+                        help="serve with multiple worker processes instead of the Flask dev servers")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVE_WORKERS", os.cpu_count() or 2)),
+                        help="worker processes per app (production mode)")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("SERVE_THREADS", "16")),
+                        help="threads per worker (production mode)")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,111 @@
+"""One production worker of the backend or the frontend.
+
+Started by `main.py --production`, which binds the listening socket once and hands
+the same socket to every worker of an app (pre-fork): the kernel spreads incoming
+connections over the workers, so an app can use more than one core.
+
+Each worker serves its app with a fixed pool of threads. On SIGTERM (or SIGINT) it
+stops accepting connections, lets the requests it's in the middle of finish and
+exits, which is what makes a reload graceful.
+
+    python3 serving.py backend --fd 3 --threads 8
+"""
+import argparse
+import importlib
+import os
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+APP_DIRECTORIES = {
+    "backend": os.path.join(ROOT, "src", "backend"),
+    "frontend": os.path.join(ROOT, "src", "frontend"),
+}
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """Closes a kept alive connection after it has been idle for `timeout` seconds,
+    so idle clients can't hold on to the worker's threads forever."""
+
+    timeout = 5
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """A WSGI server that handles requests on a fixed amount of threads.
+
+    Args:
+        threads (int): Size of the thread pool, connections beyond that wait their turn
+        *args, **kwargs: Passed on to werkzeug's `BaseWSGIServer`
+    """
+
+    multithread = True
+
+    def __init__(self, *args, threads=8, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def serve_forever(self, poll_interval=0.5):
+        try:
+            super().serve_forever(poll_interval)
+        finally:
+            # waits for the requests that were already accepted
+            self._pool.shutdown(wait=True)
+
+
+def load_app(name):
+    """Imports `main.py` of the backend or frontend and returns its Flask app"""
+    sys.path.insert(0, APP_DIRECTORIES[name])
+    sys.modules.pop("main", None)
+    return importlib.import_module("main").app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs one production worker")
+    parser.add_argument("app", choices=sorted(APP_DIRECTORIES))
+    parser.add_argument("--fd", type=int, required=True, help="listening socket inherited from main.py")
+    parser.add_argument("--host", default="0.0.0.0", help="address the socket is bound to")
+    parser.add_argument("--threads", type=int, default=8, help="requests handled at the same time")
+    parser.add_argument("--keepalive", type=float, default=5, help="seconds an idle connection is kept open")
+    args = parser.parse_args()
+
+    KeepAliveRequestHandler.timeout = args.keepalive
+    app = load_app(args.app)
+
+    server = PooledWSGIServer(
+        args.host, 0, app,
+        threads=args.threads,
+        handler=KeepAliveRequestHandler,
+        fd=args.fd,
+    )
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever() to return, so it can't run on this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    print(f"Worker {os.getpid()} serving {args.app} on port {server.port} with {args.threads} threads", flush=True)
+    server.serve_forever()
+    server.server_close()
+    print(f"Worker {os.getpid()} stopped", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
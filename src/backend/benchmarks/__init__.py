@@ -0,0 +1,3 @@
+"""Benchmark suite for the backend: a synthetic database, the hot endpoints run against
+it and a JSON report. See `__main__.py` for how to run it.
+"""
@@ -0,0 +1,147 @@
+"""Runs the backend benchmarks against a freshly generated database.
+
+    python3 src/backend/benchmarks                                  # default dataset, every scenario
+    python3 src/backend/benchmarks --users 200 --logs 500000 --requests 500
+    python3 src/backend/benchmarks --scenario logs --scenario "logs search"
+    python3 src/backend/benchmarks --output baseline.json
+    python3 src/backend/benchmarks --compare baseline.json --max-regression 0.2
+
+`--db` keeps the database somewhere and `--reuse` uses an existing one. With
+`--compare` it exits with status 1 if any scenario's p95 regressed too much.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+# run as `python3 src/backend/benchmarks`, the backend modules are one level up and
+# the ones it shares with the frontend in src/common
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(BACKEND_DIR), "common"))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def run_scenario(session, name, spec, requests, warmup):
+    """Runs one scenario `warmup` + `requests` times, returns its summary"""
+    from benchmarks import report
+
+    if spec["setup"]:
+        spec["setup"](session)
+    for _ in range(warmup):
+        spec["run"](session)
+
+    durations = []
+    failures = 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        request_started = time.perf_counter()
+        response = spec["run"](session)
+        durations.append((time.perf_counter() - request_started) * 1000)
+        if response.status_code not in spec["expect"]:
+            failures += 1
+    return report.summarize(durations, time.perf_counter() - started, failures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help="where to put the database (default: a temporary file)")
+    parser.add_argument("--reuse", action="store_true", help="use the database at --db as it is if it exists")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--projects", type=int, default=250)
+    parser.add_argument("--logs", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--bcrypt-rounds", type=int, default=12, help="cost factor of the users' password hash")
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per scenario")
+    parser.add_argument("--warmup", type=int, default=10, help="untimed requests per scenario before those")
+    parser.add_argument("--scenario", action="append", help="only run this scenario (can be repeated)")
+    parser.add_argument("--list", action="store_true", help="list the scenarios and exit")
+    parser.add_argument("--output", help="write the report here instead of stdout")
+    parser.add_argument("--compare", help="report of an earlier run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95 slowdown against --compare (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stderr)
+    log = logging.getLogger("benchmarks")
+
+    scratch = None
+    db_path = args.db
+    if db_path is None:
+        scratch = tempfile.TemporaryDirectory(prefix="loperlog-benchmark-")
+        db_path = os.path.join(scratch.name, "mono.db")
+    db_path = os.path.abspath(db_path)
+
+    # has to happen before the backend is imported, it reads these once
+    os.environ["LOPERLOG_DB_PATH"] = db_path
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    # hash in the request thread, so the login numbers are the hashing itself
+    os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+    # and at the generated cost, or the first login would rehash every user's password
+    os.environ.setdefault("PASSWORD_HASH_ROUNDS", str(args.bcrypt_rounds))
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    from benchmarks import report, scenarios, synthetic
+
+    if args.list:
+        print("\n".join(scenarios.SCENARIOS))
+        return 0
+
+    selected = args.scenario or list(scenarios.SCENARIOS)
+    unknown = [name for name in selected if name not in scenarios.SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)} (see --list)")
+
+    try:
+        if args.reuse and os.path.exists(db_path):
+            log.info(f"Reusing {db_path}")
+            dataset = {"reused": True}
+        else:
+            dataset = synthetic.generate(
+                db_path, args.users, args.projects, args.logs, args.seed, args.bcrypt_rounds, log
+            )
+
+        import main as backend
+        backend.app.logger.setLevel(logging.WARNING)
+        backend.dbHandler.prepare(backend.app.logger)
+        session = scenarios.Session(backend.app, db_path, args.seed)
+
+        results = {}
+        for name in selected:
+            log.info(f"Running {name}")
+            results[name] = run_scenario(session, name, scenarios.SCENARIOS[name], args.requests, args.warmup)
+    finally:
+        if scratch is not None:
+            scratch.cleanup()
+
+    result = {
+        "meta": {**report.metadata(), "requests": args.requests, "warmup": args.warmup},
+        "dataset": dataset,
+        "scenarios": results,
+        "peak_rss_kib": report.peak_rss_kib(),
+    }
+
+    report.print_table(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = report.compare(result, baseline, args.max_regression)
+        for name, before, after, change in regressions:
+            log.error(f"{name}: p95 went from {before:.2f}ms to {after:.2f}ms ({change:+.0%})")
+        if regressions:
+            return 1
+        log.info(f"No scenario regressed by more than {args.max_regression:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
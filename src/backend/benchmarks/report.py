@@ -0,0 +1,91 @@
+"""Turning the timings into numbers, and comparing them against an earlier run."""
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+from shared import PROJECT_ROOT
+
+
+def peak_rss_kib():
+    """Returns the most memory this process has had resident so far, in KiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def summarize(durations, elapsed, failures):
+    """Returns the latency percentiles and throughput of one scenario.
+
+    Args:
+        durations (list): Milliseconds each request took
+        elapsed (float): Seconds all of them took together
+        failures (int): Requests that didn't get the expected status code
+
+    Returns:
+        dict: count, failures, p50/p95/p99/mean/max in milliseconds and requests per second
+    """
+    if len(durations) > 1:
+        cuts = statistics.quantiles(durations, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = durations[0]
+    return {
+        "count": len(durations),
+        "failures": failures,
+        "p50_ms": round(p50, 3),
+        "p95_ms": round(p95, 3),
+        "p99_ms": round(p99, 3),
+        "mean_ms": round(statistics.fmean(durations), 3),
+        "max_ms": round(max(durations), 3),
+        "throughput_rps": round(len(durations) / elapsed, 1) if elapsed else None,
+    }
+
+
+def metadata():
+    """Returns what the numbers were measured on"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+def compare(current, baseline, max_regression, metric="p95_ms"):
+    """Finds the scenarios that got slower than `baseline` by more than `max_regression`.
+
+    Args:
+        current (dict): Report of this run
+        baseline (dict): Report of the run to compare with
+        max_regression (float): Allowed slowdown, 0.2 is 20%
+        metric (str): Which number is compared
+
+    Returns:
+        list: (scenario, baseline value, current value, relative change) for every regression
+    """
+    regressions = []
+    for name, result in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name, {}).get(metric)
+        if not before:
+            continue
+        change = result[metric] / before - 1
+        if change > max_regression:
+            regressions.append((name, before, result[metric], change))
+    return regressions
+
+
+def print_table(report, out=sys.stderr):
+    print(f"{'scenario':<36}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'failed':>8}", file=out)
+    for name, result in report["scenarios"].items():
+        print(
+            f"{name:<36}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+            f"{result['throughput_rps'] or 0:>9.1f}{result['failures']:>8}",
+            file=out
+        )
+    print(f"peak RSS: {report['peak_rss_kib'] / 1024:.1f} MiB", file=out)
@@ -0,0 +1,155 @@
+"""The requests the benchmark times, one `@scenario` each. They run in order: reads,
+then logins, then writes, so the reads see the database as it was generated.
+"""
+import json
+import random
+import sqlite3 as sql
+from datetime import datetime, timedelta
+import pyotp
+from query_plan_check import FILTER_VALUES
+from benchmarks.synthetic import PASSWORD
+
+SCENARIOS = {}
+
+BULK_ENTRIES = 100
+
+
+def scenario(name, expect=(200,), setup=None):
+    """Registers the decorated function as the scenario `name`.
+
+    Args:
+        name (str): Name it's reported under and selected by
+        expect (tuple): Status codes that count as a success
+        setup (callable | None): Called with the session once before the scenario runs
+    """
+    def register(fn):
+        SCENARIOS[name] = {"run": fn, "expect": expect, "setup": setup}
+        return fn
+    return register
+
+
+class Session:
+    """A logged in test client, with the user that has the most entries and their biggest project"""
+
+    def __init__(self, app, db_path, seed=1):
+        self.app = app
+        self.rng = random.Random(seed)
+        self.etags = {}
+
+        conn = sql.connect(db_path)
+        try:
+            self.user_id, self.username, self.email, self.totp_secret = conn.execute(
+                """
+                SELECT u.user_id, u.username, u.email, u.totp_secret
+                FROM users u JOIN log_entries l ON l.user_id = u.user_id
+                GROUP BY u.user_id ORDER BY COUNT(*) DESC LIMIT 1
+                """
+            ).fetchone()
+            self.project_id, self.log_id = conn.execute(
+                """
+                SELECT project_id, MIN(log_id) FROM log_entries WHERE user_id = ?
+                GROUP BY project_id ORDER BY COUNT(*) DESC LIMIT 1
+                """,
+                (self.user_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+
+        self.client = app.test_client()
+        response = self.login(self.client)
+        if response.status_code != 200:
+            raise RuntimeError(f"Could not log in as {self.username}: {response.status_code} {response.get_data(as_text=True)}")
+
+    def login(self, client):
+        """Logs `client` in with the password and a TOTP code, returns the last response"""
+        response = client.post("/api/login", data={"email": self.email, "password": PASSWORD})
+        if response.status_code != 200:
+            return response
+        return client.post("/api/login/verify_2fa", data={
+            "user_id": response.get_json()["user_id"],
+            "totp_code": pyotp.TOTP(self.totp_secret).now(),
+        })
+
+    def log_entry(self):
+        """Returns the fields of a new log entry, somewhere in the generated year"""
+        start_time = datetime(2025, 1, 1) + timedelta(minutes=self.rng.randrange(365 * 24 * 60))
+        minutes = self.rng.randint(15, 240)
+        return {
+            "start_time": start_time.isoformat(sep=" "),
+            "end_time": (start_time + timedelta(minutes=minutes)).isoformat(sep=" "),
+            "time_worked_minutes": minutes,
+            "developer_notes": f"benchmark entry {self.rng.getrandbits(32):08x}",
+        }
+
+
+@scenario("projects")
+def list_projects(session):
+    return session.client.get("/api/projects")
+
+
+@scenario("logs")
+def list_logs(session):
+    return session.client.get(f"/api/{session.project_id}/logs")
+
+
+@scenario("logs columnar")
+def list_logs_columnar(session):
+    return session.client.get(f"/api/{session.project_id}/logs", query_string={"shape": "columnar", "limit": 500})
+
+
+def _filter_scenario(key):
+    def run(session):
+        value = session.username if key == "username" else FILTER_VALUES[key]
+        return session.client.get(f"/api/{session.project_id}/logs", query_string={key: value})
+    return run
+
+
+# one per filter in filters.py, with the same values the query plan check uses
+for _key in FILTER_VALUES:
+    scenario(f"logs filter {_key}")(_filter_scenario(_key))
+
+
+@scenario("logs search")
+def search_logs(session):
+    return session.client.get(f"/api/{session.project_id}/logs", query_string={"q": "refactor"})
+
+
+def _fetch_etag(session):
+    session.etags["logs"] = session.client.get(f"/api/{session.project_id}/logs").headers["ETag"]
+
+
+@scenario("logs not modified", expect=(304,), setup=_fetch_etag)
+def logs_not_modified(session):
+    return session.client.get(f"/api/{session.project_id}/logs", headers={"If-None-Match": session.etags["logs"]})
+
+
+@scenario("insights")
+def insights(session):
+    return session.client.get("/api/insights", query_string={"from": "2025-01-01", "to": "2025-12-31"})
+
+
+@scenario("login with 2fa")
+def login(session):
+    # a client of its own, so the session's cookie stays as it is
+    return session.login(session.app.test_client())
+
+
+@scenario("add log", expect=(201,))
+def add_log(session):
+    return session.client.post(f"/api/{session.project_id}/logs", data=session.log_entry())
+
+
+@scenario("update log")
+def update_log(session):
+    return session.client.put(f"/api/{session.project_id}/logs/{session.log_id}", data={
+        "developer_notes": f"edited by the benchmark {session.rng.getrandbits(32):08x}",
+    })
+
+
+@scenario("bulk add logs", expect=(201,))
+def bulk_add_logs(session):
+    return session.client.post(
+        f"/api/{session.project_id}/logs/bulk",
+        data=json.dumps([session.log_entry() for _ in range(BULK_ENTRIES)]),
+        content_type="application/json"
+    )
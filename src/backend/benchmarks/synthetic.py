@@ -0,0 +1,140 @@
+"""Generates a `mono.db` full of made up, but realistically lopsided, data: a few users
+and projects get most of the entries, mostly on weekday office hours. Every user has
+the password `PASSWORD`.
+"""
+import json
+import logging
+import math
+import os
+import random
+import sqlite3 as sql
+import time
+from datetime import datetime, timedelta
+import bcrypt
+import pyotp
+import migrations
+
+PASSWORD = "benchmark"
+START = datetime(2025, 1, 1)
+DAYS = 365
+
+# made up words with a Zipf-like frequency, plus the ones the filter benchmarks look for
+VOCABULARY = ["refactor", "fix", "test", "deploy", "review", "cache", "query", "index"] + [
+    f"{a}{b}" for a in ("par", "lex", "ren", "sto", "net", "log", "auth", "sync") for b in ("er", "ing", "ed", "s", "ion")
+]
+
+
+def _weights(count, exponent):
+    """Zipf weights: the n-th most popular of `count` things is picked 1 / n^exponent as often"""
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def _notes(rng, word_weights):
+    length = max(3, int(rng.lognormvariate(math.log(25), 0.6)))
+    return " ".join(rng.choices(VOCABULARY, weights=word_weights, k=length))
+
+
+def _commits(rng):
+    if rng.random() >= 0.4:
+        return None
+    return json.dumps([f"{rng.getrandbits(160):040x}" for _ in range(rng.randint(1, 3))])
+
+
+def generate(path, users=50, projects=250, logs=50000, seed=1, bcrypt_rounds=12, log=None):
+    """Creates a fresh database at `path` and fills it.
+
+    Args:
+        path (str): Where to create it, an existing file is replaced
+        users (int): Amount of users
+        projects (int): Amount of projects, handed out to users by a Zipf distribution
+        logs (int): Amount of log entries, handed out to projects by a Pareto distribution
+        seed (int): Seed of the random generator, the same seed gives the same database
+        bcrypt_rounds (int): Cost factor of the (shared) password hash
+        log (logging.Logger | None): Where to report progress to
+
+    Returns:
+        dict: what was generated, with how long it took
+    """
+    log = log or logging.getLogger("benchmarks")
+    rng = random.Random(seed)
+    started = time.perf_counter()
+
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sql.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA foreign_keys = ON")
+    migrations.migrate(conn, log)
+
+    # one hash for everyone, hashing per user would take minutes at a realistic cost
+    password_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(bcrypt_rounds)).decode()
+
+    conn.execute("BEGIN")
+    conn.executemany(
+        "INSERT INTO users (user_id, username, email, password_hash, totp_secret, last_login) VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (user_id, f"user{user_id:05d}", f"user{user_id:05d}@example.com", password_hash,
+             pyotp.random_base32(), START.isoformat(sep=" "))
+            for user_id in range(1, users + 1)
+        ]
+    )
+
+    owners = rng.choices(range(1, users + 1), weights=_weights(users, 1.1), k=projects)
+    conn.executemany(
+        "INSERT INTO projects (project_id, project_name, repository_url, created_by, description) VALUES (?, ?, ?, ?, ?)",
+        [
+            (project_id, f"Project {project_id}", f"https://github.com/user{owner:05d}/project-{project_id}",
+             owner, f"Benchmark project {project_id}")
+            for project_id, owner in enumerate(owners, start=1)
+        ]
+    )
+
+    project_weights = [rng.paretovariate(1.2) for _ in range(projects)]
+    # weekends get a fifth of the work of a weekday
+    day_weights = [1.0 if (START + timedelta(days=day)).weekday() < 5 else 0.2 for day in range(DAYS)]
+    word_weights = _weights(len(VOCABULARY), 1.0)
+
+    def entries():
+        log_projects = rng.choices(range(1, projects + 1), weights=project_weights, k=logs)
+        log_days = rng.choices(range(DAYS), weights=day_weights, k=logs)
+        for project_id, day in zip(log_projects, log_days):
+            hour = min(max(rng.gauss(10, 2), 6), 20)
+            start_time = START + timedelta(days=day, hours=hour)
+            minutes = int(min(max(rng.lognormvariate(math.log(75), 0.6), 5), 600))
+            end_time = start_time + timedelta(minutes=minutes)
+            logged_at = end_time + timedelta(seconds=rng.randint(0, 900))
+            yield (
+                owners[project_id - 1],
+                project_id,
+                start_time.isoformat(sep=" ", timespec="seconds"),
+                end_time.isoformat(sep=" ", timespec="seconds"),
+                logged_at.isoformat(sep=" ", timespec="seconds"),
+                minutes,
+                _notes(rng, word_weights),
+                _commits(rng),
+            )
+
+    conn.executemany(
+        """
+        INSERT INTO log_entries (
+            user_id, project_id, start_time, end_time, log_timestamp,
+            time_worked_minutes, developer_notes, related_commits
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        entries()
+    )
+    conn.execute("COMMIT")
+    conn.execute("ANALYZE")
+    conn.close()
+
+    summary = {
+        "users": users,
+        "projects": projects,
+        "logs": logs,
+        "seed": seed,
+        "bcrypt_rounds": bcrypt_rounds,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    log.info(f"Generated {path}: {users} users, {projects} projects, {logs} log entries in {summary['seconds']}s")
+    return summary
@@ -0,0 +1,68 @@
+import os
+
+# Values can't be bound as parameters in a PRAGMA, so anything that comes from the
+# environment is checked against these before it ends up in a statement.
+JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+SYNCHRONOUS_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+DEFAULTS = {
+    "DB_JOURNAL_MODE": "WAL",
+    "DB_SYNCHRONOUS": "NORMAL",
+    "DB_MMAP_SIZE": 256 * 1024 * 1024,
+    # negative values are in KiB rather than pages, so this is ~64MB per connection
+    "DB_CACHE_SIZE": -64000,
+    "DB_BUSY_TIMEOUT_MS": 5000,
+}
+
+
+def _choice(name, allowed):
+    value = str(os.getenv(name, DEFAULTS[name])).strip().upper()
+    if value not in allowed:
+        raise ValueError(f"{name} must be one of {', '.join(sorted(allowed))}, got '{value}'")
+    return value
+
+
+def _integer(name):
+    value = os.getenv(name, DEFAULTS[name])
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer, got '{value}'")
+
+
+def storage_settings():
+    """Reads the storage settings for mono.db from the environment.
+
+    Supported variables (defaults in brackets):
+    - DB_JOURNAL_MODE (WAL)
+    - DB_SYNCHRONOUS (NORMAL)
+    - DB_MMAP_SIZE (268435456 bytes)
+    - DB_CACHE_SIZE (-64000, as in 64000 KiB)
+    - DB_BUSY_TIMEOUT_MS (5000)
+
+    Returns:
+        dict: the validated settings
+
+    Raises:
+        ValueError: if any of the variables holds an invalid value
+    """
+    return {
+        "journal_mode": _choice("DB_JOURNAL_MODE", JOURNAL_MODES),
+        "synchronous": _choice("DB_SYNCHRONOUS", SYNCHRONOUS_MODES),
+        "mmap_size": _integer("DB_MMAP_SIZE"),
+        "cache_size": _integer("DB_CACHE_SIZE"),
+        "busy_timeout": _integer("DB_BUSY_TIMEOUT_MS"),
+    }
+
+
+def connection_pragmas(settings=None):
+    """Builds the PRAGMA statements that every new connection has to run"""
+    settings = settings or storage_settings()
+    return [
+        f"PRAGMA busy_timeout = {settings['busy_timeout']};",
+        f"PRAGMA journal_mode = {settings['journal_mode']};",
+        f"PRAGMA synchronous = {settings['synchronous']};",
+        f"PRAGMA mmap_size = {settings['mmap_size']};",
+        f"PRAGMA cache_size = {settings['cache_size']};",
+        "PRAGMA foreign_keys = ON;",
+    ]
@@ -1,117 +1,85 @@
 import sqlite3 as sql
 from logging import Logger
 from flask import jsonify
-from shared import DB_PATH
+from db_pool import get_connection
+from db_writer import run_write
+from cache import LRUCache, MISSING
+from exceptions import UserSkillIssueException
+import migrations
+import hashlib
+import html
 import json
 
+PROJECT_CACHE_SIZE = 4096
+# keeps other worker processes, which never see our invalidations, from serving stale projects forever
+PROJECT_CACHE_TTL_SECONDS = 30
 
-def prepare(log: Logger):
-    """Prepares the database by populating it with the required data.
+_project_cache = LRUCache(maxsize=PROJECT_CACHE_SIZE, ttl=PROJECT_CACHE_TTL_SECONDS)
+
+# Columns of the log_entries_fts full text index (created by migration 3) and their
+# bm25 weights. A matching commit hash says more than the project name showing up in
+# every entry of a project.
+SEARCH_COLUMNS = ("developer_notes", "project_name", "related_commits")
+SEARCH_WEIGHTS = (1.0, 0.5, 2.0)
+SEARCH_SNIPPET_TOKENS = 16
+# snippet() doesn't escape anything, so matches are marked with control characters
+# that get turned into <mark> tags after the rest of the snippet has been escaped
+_SNIPPET_START = "\x02"
+_SNIPPET_END = "\x03"
 
-    If any databases or data exist, it will not fail, just continue on.
 
-    This is a transactional function, which can allow for rollbacks in case
-    this app decides to think for itself.
+def prepare(log: Logger):
+    """Prepares the database by applying every schema migration it hasn't seen yet.
+
+    See `migrations.py` for the schema itself and how to change it.
     """
 
-    conn = sql.connect(DB_PATH)
-    cur = conn.cursor()
-    log.info("Connected to database")
-    
-    try:
-        cur.execute("PRAGMA foreign_keys = ON;")
-        
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                totp_secret TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                last_login DATETIME
-            );
-            """
-        )
-        log.info("Users table ready")
+    with get_connection() as conn:
+        log.info("Connected to database")
+        migrations.migrate(conn, log)
 
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS projects (
-                project_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                project_name TEXT NOT NULL,
-                repository_url TEXT,
-                created_by INTEGER NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                description TEXT,
-                FOREIGN KEY (created_by) REFERENCES users(user_id) ON DELETE CASCADE
-            );
-            """
-        )
-        log.info("Projects table ready")
+        journal_mode = conn.execute("PRAGMA journal_mode;").fetchone()[0]
+        log.info(f"Database journal mode: {journal_mode}")
 
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS log_entries (
-                log_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                project_id INTEGER NOT NULL,
-                start_time DATETIME NOT NULL,
-                end_time DATETIME NOT NULL,
-                log_timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                time_worked_minutes INTEGER NOT NULL,
-                developer_notes TEXT NOT NULL,
-                related_commits TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
-                FOREIGN KEY (project_id) REFERENCES projects(project_id) ON DELETE CASCADE
-            );
-            """
-        )
-        log.info("Log entries table ready")
+    log.info("Database connection returned to pool")
 
-        cur.execute(
-            """
-            CREATE INDEX IF NOT EXISTS idx_log_entries_user 
-            ON log_entries(user_id);
-            """
-        )
-        cur.execute(
-            """
-            CREATE INDEX IF NOT EXISTS idx_log_entries_project 
-            ON log_entries(project_id);
-            """
-        )
-        cur.execute(
-            """
-            CREATE INDEX IF NOT EXISTS idx_log_entries_timestamp 
-            ON log_entries(log_timestamp);
-            """
-        )
-        log.info("Indexes created")
-
-        conn.commit()
-        log.info("Database schema committed successfully")
-        
-    except sql.Error as e:
-        conn.rollback()
-        log.error(f"Database preparation failed: {e}")
-        raise
-    
+
+def check_search_query(search):
+    """Checks that `search` is a valid FTS5 query (phrases, prefixes, AND/OR/NOT, column filters...)
+
+    The syntax doesn't depend on what's in the index, so this is checked against an
+    empty in-memory table with the same columns instead of the real one.
+
+    Raises:
+        UserSkillIssueException: if the query can't be parsed
+    """
+    conn = sql.connect(":memory:")
+    try:
+        conn.execute(f"CREATE VIRTUAL TABLE q USING fts5({', '.join(SEARCH_COLUMNS)})")
+        conn.execute("SELECT rowid FROM q WHERE q MATCH ?", (search,)).fetchall()
+    except sql.OperationalError as e:
+        raise UserSkillIssueException(f"Invalid search query: {e}", error_code="BAD_SEARCH")
     finally:
         conn.close()
-        log.info("Database connection closed")
 
 
+def _highlight_snippet(snippet):
+    escaped = html.escape(snippet or "")
+    return escaped.replace(_SNIPPET_START, "<mark>").replace(_SNIPPET_END, "</mark>")
 
-def fetch_devlogs(user_id=None, project_id=None, filters=None):
-    """Fetch all log entries, optionally filtered by user_id, project_id, and additional filters"""
-    conn = sql.connect(DB_PATH)
-    conn.row_factory = sql.Row
-    cur = conn.cursor()
 
-    query = """
-        SELECT 
+def _build_devlogs_query(user_id=None, project_id=None, filters=None, limit=None, after=None, search=None):
+    """Builds the log listing query shared by `fetch_devlogs` and `iter_devlogs`.
+
+    Without `search` entries are ordered newest first and `after` is a
+    (log_timestamp, log_id) key. With `search` only entries matching the FTS5 query
+    are returned, best match first, each with a `search_rank` (bm25, lower is
+    better) and a highlighted `snippet`, and `after` is a (search_rank, log_id) key.
+
+    Returns:
+        tuple: (query, params)
+    """
+    columns = """
             l.log_id,
             l.user_id,
             u.username,
@@ -124,52 +92,209 @@ def fetch_devlogs(user_id=None, project_id=None, filters=None):
             p.repository_url,
             l.developer_notes,
             l.related_commits
-        FROM log_entries l
-        JOIN users u ON l.user_id = u.user_id
-        JOIN projects p ON l.project_id = p.project_id
     """
-    
+
     conditions = []
     params = []
-    
+
+    if search:
+        weights = ", ".join(str(weight) for weight in SEARCH_WEIGHTS)
+        query = f"""
+            SELECT {columns}, f.search_rank, f.snippet
+            FROM (
+                SELECT
+                    rowid AS log_id,
+                    bm25(log_entries_fts, {weights}) AS search_rank,
+                    snippet(log_entries_fts, 0, char(2), char(3), '...', {SEARCH_SNIPPET_TOKENS}) AS snippet
+                FROM log_entries_fts
+                WHERE log_entries_fts MATCH ?
+            ) f
+            JOIN log_entries l ON l.log_id = f.log_id
+            JOIN users u ON l.user_id = u.user_id
+            JOIN projects p ON l.project_id = p.project_id
+        """
+        params.append(search)
+    else:
+        query = f"""
+            SELECT {columns}
+            FROM log_entries l
+            JOIN users u ON l.user_id = u.user_id
+            JOIN projects p ON l.project_id = p.project_id
+        """
+
     if user_id:
         conditions.append("l.user_id = ?")
         params.append(user_id)
-    
+
     if project_id:
         conditions.append("l.project_id = ?")
         params.append(project_id)
-    
+
     # Apply additional filters if provided
     if filters:
         from filters import apply_filters_to_query
         query, conditions, params = apply_filters_to_query(query, conditions, params, filters)
-    
+
+    if after:
+        if search:
+            conditions.append("(f.search_rank, l.log_id) > (?, ?)")
+        else:
+            conditions.append("(l.log_timestamp, l.log_id) < (?, ?)")
+        params.extend(after)
+
     if conditions:
         query += " WHERE " + " AND ".join(conditions)
-    
-    query += " ORDER BY l.log_timestamp DESC"
-    
-    cur.execute(query, params)
-    rows = cur.fetchall()
-    conn.close()
 
-    return [dict(row) for row in rows]
+    if search:
+        query += " ORDER BY f.search_rank, l.log_id"
+    else:
+        query += " ORDER BY l.log_timestamp DESC, l.log_id DESC"
+
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    return query, params
+
+
+def fetch_devlogs(user_id=None, project_id=None, filters=None, limit=None, after=None, search=None):
+    """Fetch all log entries, optionally filtered by user_id, project_id, and additional filters
+
+    Entries are ordered newest first by (log_timestamp, log_id). `limit` caps the
+    amount of entries, and `after` (a (log_timestamp, log_id) tuple) only returns
+    entries that sort after that key, which is what keyset pagination uses.
+
+    `search` switches to full text search, see `_build_devlogs_query`.
+    """
+    if search:
+        check_search_query(search)
+
+    query, params = _build_devlogs_query(user_id, project_id, filters, limit, after, search)
+
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        rows = cur.fetchall()
+
+    logs = [dict(row) for row in rows]
+    if search:
+        for entry in logs:
+            entry["snippet"] = _highlight_snippet(entry["snippet"])
+    return logs
+
+
+# Listed with every log entry, but the same for every entry of a user / project
+USER_FIELDS = ("username",)
+PROJECT_FIELDS = ("project_name", "repository_url")
+
+
+def columnar_devlogs(logs):
+    """Turns listed log entries into `columns` and `rows`, with the users and projects
+    listed once by id instead of on every entry. The ids are strings, like JSON keys
+    end up anyway.
+
+    Args:
+        logs (list[dict]): Log entries as returned by `fetch_devlogs`
+
+    Returns:
+        dict: {"columns": [...], "rows": [[...], ...], "users": {"<user_id>": {"username"}},
+        "projects": {"<project_id>": {"project_name", "repository_url"}}}
+    """
+    factored_out = USER_FIELDS + PROJECT_FIELDS
+    columns = [key for key in logs[0] if key not in factored_out] if logs else []
+    users = {}
+    projects = {}
+    rows = []
+    for log in logs:
+        user_id, project_id = str(log["user_id"]), str(log["project_id"])
+        if user_id not in users:
+            users[user_id] = {field: log[field] for field in USER_FIELDS}
+        if project_id not in projects:
+            projects[project_id] = {field: log[field] for field in PROJECT_FIELDS}
+        rows.append([log[column] for column in columns])
+
+    return {"columns": columns, "rows": rows, "users": users, "projects": projects}
+
+
+def iter_devlogs(user_id=None, project_id=None, filters=None, batch_size=500):
+    """Same as `fetch_devlogs`, but yields the entries one by one.
+
+    Rows are pulled from the cursor `batch_size` at a time, so memory use stays the
+    same no matter how many entries match. The query is built (and the filters
+    validated) straight away, while the connection is only checked out once the
+    iteration starts and is returned when it finishes or gets closed.
+    """
+    query, params = _build_devlogs_query(user_id, project_id, filters)
+
+    def rows():
+        with get_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(query, params)
+            try:
+                while True:
+                    batch = cur.fetchmany(batch_size)
+                    if not batch:
+                        break
+                    for row in batch:
+                        yield dict(row)
+            finally:
+                cur.close()
+
+    return rows()
+
+
+def fetch_devlog_page(user_id=None, project_id=None, filters=None, limit=50, after=None, search=None):
+    """Fetch one page of log entries using keyset pagination.
+
+    Returns:
+        tuple: (entries, key of the next page or None if this is the last page). The key
+        is (log_timestamp, log_id), or (search_rank, log_id) when searching.
+    """
+    # one extra row tells us if there is another page without a COUNT(*)
+    logs = fetch_devlogs(
+        user_id=user_id,
+        project_id=project_id,
+        filters=filters,
+        limit=limit + 1,
+        after=after,
+        search=search
+    )
+
+    if len(logs) <= limit:
+        return logs, None
+
+    logs = logs[:limit]
+    sort_key = "search_rank" if search else "log_timestamp"
+    return logs, (logs[-1][sort_key], logs[-1]["log_id"])
+
+
+def _related_commits_value(related_commits):
+    """Returns the commits as stored: a JSON array string, or None if there are none (or they aren't valid JSON)"""
+    if not related_commits:
+        return None
+    if isinstance(related_commits, list):
+        return json.dumps(related_commits)
+    if isinstance(related_commits, str):
+        try:
+            json.loads(related_commits)
+            return related_commits
+        except json.JSONDecodeError:
+            return None
+    return None
 
 
 def add_log(data, user_id):
     """Add a new log entry with project information"""
-    conn = sql.connect(DB_PATH)
-    cur = conn.cursor()
+    def write(conn):
+        cur = conn.cursor()
 
-    try:
         project_id = data.get("project_id")
-        
+
         if not project_id:
             project_name = data.get("project_name")
             if not project_name:
                 raise ValueError("Either project_id or project_name is required")
-            
+
             cur.execute(
                 """
                 INSERT INTO projects (project_name, repository_url, created_by)
@@ -179,22 +304,12 @@ def add_log(data, user_id):
             )
             project_id = cur.lastrowid
 
-        related_commits = data.get("related_commits")
-        if related_commits:
-            if isinstance(related_commits, list):
-                related_commits = json.dumps(related_commits)
-            elif isinstance(related_commits, str):
-                try:
-                    json.loads(related_commits)
-                except json.JSONDecodeError:
-                    related_commits = None
-        else:
-            related_commits = None
+        related_commits = _related_commits_value(data.get("related_commits"))
 
         cur.execute(
             """
             INSERT INTO log_entries (
-                user_id, project_id, start_time, end_time, 
+                user_id, project_id, start_time, end_time,
                 time_worked_minutes, developer_notes, related_commits
             )
             VALUES (?, ?, ?, ?, ?, ?, ?)
@@ -210,210 +325,336 @@ def add_log(data, user_id):
             ),
         )
 
-        log_id = cur.lastrowid
-        conn.commit()
-        return log_id
-        
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+        return cur.lastrowid, project_id
 
+    log_id, project_id = run_write(write)
+    _project_cache.invalidate(project_id)
+    return log_id
 
-def remove_log(log_id, user_id=None):
-    """Remove a log entry, optionally verify ownership"""
-    conn = sql.connect(DB_PATH)
-    cur = conn.cursor()
 
-    if user_id:
-        cur.execute(
-            "DELETE FROM log_entries WHERE log_id = ? AND user_id = ?",
-            (log_id, user_id)
+_BULK_INSERT_LOG_SQL = """
+    INSERT INTO log_entries (
+        user_id, project_id, start_time, end_time,
+        time_worked_minutes, developer_notes, related_commits, log_timestamp
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+"""
+
+
+def add_logs(entries, user_id, project_id):
+    """Adds many log entries to one project in a single transaction.
+
+    If the `executemany` gets rejected, they're inserted one at a time instead so the
+    rest still go in and the bad ones can be reported.
+
+    Args:
+        entries (list[tuple[int, dict]]): (index, entry) pairs, the index is what a failure is reported with
+        user_id (int): Owner of the entries
+        project_id (int): Project the entries are added to
+
+    Returns:
+        tuple[int, list[tuple[int, str]]]: amount of entries added, and the index and
+        cause of every entry that was rejected
+    """
+    rows = [
+        (
+            index,
+            (
+                user_id,
+                project_id,
+                data["start_time"],
+                data["end_time"],
+                data["time_worked_minutes"],
+                data.get("developer_notes", ""),
+                _related_commits_value(data.get("related_commits")),
+                data.get("log_timestamp") or None,
+            ),
         )
-    else:
-        cur.execute("DELETE FROM log_entries WHERE log_id = ?", (log_id,))
+        for index, data in entries
+    ]
+    if not rows:
+        return 0, []
+
+    def write(conn):
+        try:
+            conn.executemany(_BULK_INSERT_LOG_SQL, [params for _, params in rows])
+            return len(rows), []
+        except sql.Error:
+            conn.rollback()
+
+        added, failed = 0, []
+        conn.execute("BEGIN")
+        for index, params in rows:
+            conn.execute("SAVEPOINT bulk_log")
+            try:
+                conn.execute(_BULK_INSERT_LOG_SQL, params)
+                added += 1
+            except sql.Error as e:
+                conn.execute("ROLLBACK TO bulk_log")
+                failed.append((index, str(e)))
+            conn.execute("RELEASE bulk_log")
+        return added, failed
+
+    result = run_write(write)
+    _project_cache.invalidate(project_id)
+    return result
 
-    row_count = cur.rowcount
 
-    if row_count != 0:
-        conn.commit()
-    conn.close()
+def remove_log(log_id, user_id=None):
+    """Remove a log entry, optionally verify ownership"""
+    def write(conn):
+        cur = conn.cursor()
 
-    return row_count
+        if user_id:
+            cur.execute(
+                "DELETE FROM log_entries WHERE log_id = ? AND user_id = ?",
+                (log_id, user_id)
+            )
+        else:
+            cur.execute("DELETE FROM log_entries WHERE log_id = ?", (log_id,))
+
+        return cur.rowcount
+
+    return run_write(write)
 
 
 def fetch_one_devlog(log_id, user_id=None):
     """Fetch a single log entry with joined data"""
-    conn = sql.connect(DB_PATH)
-    conn.row_factory = sql.Row
-    cur = conn.cursor()
-
-    if user_id:
-        cur.execute("""
-            SELECT 
-                l.log_id,
-                l.user_id,
-                u.username,
-                l.project_id,
-                p.project_name,
-                l.start_time,
-                l.end_time,
-                l.log_timestamp,
-                l.time_worked_minutes,
-                p.repository_url,
-                l.developer_notes,
-                l.related_commits
-            FROM log_entries l
-            JOIN users u ON l.user_id = u.user_id
-            JOIN projects p ON l.project_id = p.project_id
-            WHERE l.log_id = ? AND l.user_id = ?
-        """, (log_id, user_id))
-    else:
-        cur.execute("""
-            SELECT 
-                l.log_id,
-                l.user_id,
-                u.username,
-                l.project_id,
-                p.project_name,
-                l.start_time,
-                l.end_time,
-                l.log_timestamp,
-                l.time_worked_minutes,
-                p.repository_url,
-                l.developer_notes,
-                l.related_commits
-            FROM log_entries l
-            JOIN users u ON l.user_id = u.user_id
-            JOIN projects p ON l.project_id = p.project_id
-            WHERE l.log_id = ?
-        """, (log_id,))
-    
-    row = cur.fetchone()
-    conn.close()
+    with get_connection() as conn:
+        cur = conn.cursor()
+
+        if user_id:
+            cur.execute("""
+                SELECT
+                    l.log_id,
+                    l.user_id,
+                    u.username,
+                    l.project_id,
+                    p.project_name,
+                    l.start_time,
+                    l.end_time,
+                    l.log_timestamp,
+                    l.time_worked_minutes,
+                    p.repository_url,
+                    l.developer_notes,
+                    l.related_commits
+                FROM log_entries l
+                JOIN users u ON l.user_id = u.user_id
+                JOIN projects p ON l.project_id = p.project_id
+                WHERE l.log_id = ? AND l.user_id = ?
+            """, (log_id, user_id))
+        else:
+            cur.execute("""
+                SELECT
+                    l.log_id,
+                    l.user_id,
+                    u.username,
+                    l.project_id,
+                    p.project_name,
+                    l.start_time,
+                    l.end_time,
+                    l.log_timestamp,
+                    l.time_worked_minutes,
+                    p.repository_url,
+                    l.developer_notes,
+                    l.related_commits
+                FROM log_entries l
+                JOIN users u ON l.user_id = u.user_id
+                JOIN projects p ON l.project_id = p.project_id
+                WHERE l.log_id = ?
+            """, (log_id,))
+
+        row = cur.fetchone()
 
     return dict(row) if row else None
 
 
 def get_user_by_email(email):
-    conn = sql.connect(DB_PATH)
-    conn.row_factory = sql.Row
-    cur = conn.cursor()
-
-    cur.execute("SELECT * FROM users WHERE email = ?", (email,))
-    row = cur.fetchone()
+    with get_connection() as conn:
+        cur = conn.cursor()
 
-    conn.close()
+        cur.execute("SELECT * FROM users WHERE email = ?", (email,))
+        row = cur.fetchone()
 
     return dict(row) if row else None
 
 
 def update_log(log_id, data, user_id):
     """Update an existing log entry"""
-    conn = sql.connect(DB_PATH)
-    cur = conn.cursor()
+    def write(conn):
+        cur = conn.cursor()
 
-    cur.execute(
-        "SELECT log_id FROM log_entries WHERE log_id = ? AND user_id = ?",
-        (log_id, user_id)
-    )
-    if not cur.fetchone():
-        return 0
+        cur.execute(
+            "SELECT log_id FROM log_entries WHERE log_id = ? AND user_id = ?",
+            (log_id, user_id)
+        )
+        if not cur.fetchone():
+            return 0
 
-    update_fields = []
-    params = []
+        update_fields = []
+        params = []
 
-    if 'start_time' in data:
-        update_fields.append("start_time = ?")
-        params.append(data['start_time'])
+        if 'start_time' in data:
+            update_fields.append("start_time = ?")
+            params.append(data['start_time'])
 
-    if 'end_time' in data:
-        update_fields.append("end_time = ?")
-        params.append(data['end_time'])
+        if 'end_time' in data:
+            update_fields.append("end_time = ?")
+            params.append(data['end_time'])
 
-    if 'time_worked_minutes' in data:
-        update_fields.append("time_worked_minutes = ?")
-        params.append(data['time_worked_minutes'])
+        if 'time_worked_minutes' in data:
+            update_fields.append("time_worked_minutes = ?")
+            params.append(data['time_worked_minutes'])
 
-    if 'developer_notes' in data:
-        update_fields.append("developer_notes = ?")
-        params.append(data['developer_notes'])
+        if 'developer_notes' in data:
+            update_fields.append("developer_notes = ?")
+            params.append(data['developer_notes'])
 
-    if 'project_id' in data:
-        update_fields.append("project_id = ?")
-        params.append(data['project_id'])
+        if 'project_id' in data:
+            update_fields.append("project_id = ?")
+            params.append(data['project_id'])
 
-    if 'related_commits' in data:
-        import json
-        related_commits = data['related_commits']
-        if isinstance(related_commits, list):
-            related_commits = json.dumps(related_commits)
-        elif isinstance(related_commits, str):
-            json.loads(related_commits)
-        update_fields.append("related_commits = ?")
-        params.append(related_commits)
+        if 'related_commits' in data:
+            related_commits = data['related_commits']
+            if isinstance(related_commits, list):
+                related_commits = json.dumps(related_commits)
+            elif isinstance(related_commits, str):
+                json.loads(related_commits)
+            update_fields.append("related_commits = ?")
+            params.append(related_commits)
 
-    if not update_fields:
-        return 0
+        if not update_fields:
+            return 0
 
-    params.append(log_id)
-    params.append(user_id)
+        params.append(log_id)
+        params.append(user_id)
 
-    # bandit is flagging this. note to self: false positive. no sql injection is happening. 
-    query = f"UPDATE log_entries SET {', '.join(update_fields)} WHERE log_id = ? AND user_id = ?"
-    cur.execute(query, params)
+        # bandit is flagging this. note to self: false positive. no sql injection is happening.
+        query = f"UPDATE log_entries SET {', '.join(update_fields)} WHERE log_id = ? AND user_id = ?"
+        cur.execute(query, params)
 
-    row_count = cur.rowcount
-    conn.commit()
-    conn.close()
-    return row_count
+        return cur.rowcount
+
+    return run_write(write)
 
 
 def fetch_projects(user_id=None):
     """Fetch all projects, optionally filtered by creator"""
-    conn = sql.connect(DB_PATH)
-    conn.row_factory = sql.Row
-    cur = conn.cursor()
-
-    if user_id:
-        cur.execute("""
-            SELECT 
-                project_id,
-                project_name,
-                repository_url,
-                created_by,
-                created_at,
-                description
-            FROM projects
-            WHERE created_by = ?
-            ORDER BY created_at DESC
-        """, (user_id,))
-    else:
-        cur.execute("""
-            SELECT 
-                project_id,
-                project_name,
-                repository_url,
-                created_by,
-                created_at,
-                description
-            FROM projects
-            ORDER BY created_at DESC
-        """)
-    
-    rows = cur.fetchall()
-    conn.close()
+    with get_connection() as conn:
+        cur = conn.cursor()
+
+        if user_id:
+            cur.execute("""
+                SELECT
+                    project_id,
+                    project_name,
+                    repository_url,
+                    created_by,
+                    created_at,
+                    description
+                FROM projects
+                WHERE created_by = ?
+                ORDER BY created_at DESC
+            """, (user_id,))
+        else:
+            cur.execute("""
+                SELECT
+                    project_id,
+                    project_name,
+                    repository_url,
+                    created_by,
+                    created_at,
+                    description
+                FROM projects
+                ORDER BY created_at DESC
+            """)
+
+        rows = cur.fetchall()
 
     return [dict(row) for row in rows]
 
 
+def fetch_project(project_id):
+    """Fetch a single project by id, or None if it does not exist.
+
+    This is a primary key lookup and the result (including "does not exist") is
+    kept in an in-process LRU cache, which the functions that create, update or
+    delete projects invalidate.
+    """
+    project = _project_cache.get(project_id)
+    if project is MISSING:
+        with get_connection() as conn:
+            row = conn.execute("""
+                SELECT
+                    project_id,
+                    project_name,
+                    repository_url,
+                    created_by,
+                    created_at,
+                    description
+                FROM projects
+                WHERE project_id = ?
+            """, (project_id,)).fetchone()
+
+        project = dict(row) if row else None
+        _project_cache.set(project_id, project)
+
+    return dict(project) if project else None
+
+
+def project_exists(project_id, user_id=None):
+    """Check if a project exists, and if `user_id` is given, that the user created it"""
+    project = fetch_project(project_id)
+    if project is None:
+        return False
+    return user_id is None or str(project["created_by"]) == str(user_id)
+
+
+def clear_project_cache():
+    """Forget every cached project, e.g. after a user (and so their projects) got deleted"""
+    _project_cache.clear()
+
+
+def project_cache_stats():
+    return _project_cache.stats()
+
+
+def change_versions(user_id, project_id=None):
+    """Returns how often the user's projects (and the project, with its logs) have changed.
+
+    The counters are kept by the triggers of migration 6, reading them is two primary
+    key lookups that don't touch the log tables.
+
+    Returns:
+        tuple[int, int]: (user version, project version), 0 if that never changed
+    """
+    with get_connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT scope, version FROM change_versions
+            WHERE (scope = 'user' AND id = ?) OR (scope = 'project' AND id = ?)
+            """,
+            (user_id, project_id)
+        ).fetchall()
+    versions = {row["scope"]: row["version"] for row in rows}
+    return versions.get("user", 0), versions.get("project", 0)
+
+
+def listing_etag(user_id, project_id=None, args=()):
+    """ETag of a projects listing, or of a logs listing of `project_id` with the query `args`.
+
+    Read it before the listing itself: a change that lands in between then only makes
+    the next request miss, it never gets an outdated body tagged as current.
+    """
+    user_version, project_version = change_versions(user_id, project_id)
+    key = json.dumps([str(user_id), project_id, user_version, project_version, sorted(args)])
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
 def create_project(project_name, user_id, repository_url=None, description=None):
     """Create a new project"""
-    conn = sql.connect(DB_PATH)
-    cur = conn.cursor()
-
-    try:
+    def write(conn):
+        cur = conn.cursor()
         cur.execute(
             """
             INSERT INTO projects (project_name, repository_url, created_by, description)
@@ -421,58 +662,47 @@ def create_project(project_name, user_id, repository_url=None, description=None)
             """,
             (project_name, repository_url, user_id, description)
         )
-        
-        project_id = cur.lastrowid
-        conn.commit()
-        return project_id
-        
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+        return cur.lastrowid
+
+    project_id = run_write(write)
+    _project_cache.invalidate(project_id)
+    return project_id
 
 
 def delete_project(project_id, user_id):
     """Delete a project and all its associated logs"""
-    conn = sql.connect(DB_PATH)
-    cur = conn.cursor()
+    def write(conn):
+        cur = conn.cursor()
 
-    try:
         cur.execute(
             "SELECT project_id FROM projects WHERE project_id = ? AND created_by = ?",
             (project_id, user_id)
         )
         if not cur.fetchone():
             return 0
-        
+
         cur.execute(
             "DELETE FROM log_entries WHERE project_id = ?",
             (project_id,)
         )
-        
+
         cur.execute(
             "DELETE FROM projects WHERE project_id = ? AND created_by = ?",
             (project_id, user_id)
         )
-        
-        row_count = cur.rowcount
-        conn.commit()
-        return row_count
-        
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+
+        return cur.rowcount
+
+    row_count = run_write(write)
+    _project_cache.invalidate(project_id)
+    return row_count
 
 
 def update_project(project_id, user_id, project_name=None, repository_url=None, description=None):
     """Update a project's editable fields"""
-    conn = sql.connect(DB_PATH)
-    cur = conn.cursor()
+    def write(conn):
+        cur = conn.cursor()
 
-    try:
         cur.execute(
             "SELECT project_id FROM projects WHERE project_id = ? AND created_by = ?",
             (project_id, user_id)
@@ -505,11 +735,8 @@ def update_project(project_id, user_id, project_name=None, repository_url=None,
         query = f"UPDATE projects SET {', '.join(update_fields)} WHERE project_id = ? AND created_by = ?"
         cur.execute(query, params)
 
-        row_count = cur.rowcount
-        conn.commit()
-        return row_count
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+        return cur.rowcount
+
+    row_count = run_write(write)
+    _project_cache.invalidate(project_id)
+    return row_count
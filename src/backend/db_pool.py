@@ -0,0 +1,214 @@
+import os
+import queue
+import sqlite3 as sql
+import threading
+import time
+from contextlib import contextmanager
+import metrics
+from db_config import connection_pragmas, storage_settings
+from exceptions import DatabasePoolExhaustedException
+from shared import DB_PATH
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_POOL_TIMEOUT_SECONDS = 5.0
+
+
+def open_connection(path):
+    """Opens a connection to `path` with the storage PRAGMAs from `db_config` applied.
+
+    This is done once per connection, not on every checkout. The connection also
+    counts and times its statements for `metrics`.
+    """
+    settings = storage_settings()
+    conn = sql.connect(
+        path,
+        timeout=settings["busy_timeout"] / 1000,
+        check_same_thread=False,
+        factory=metrics.connection_factory()
+    )
+    conn.row_factory = sql.Row
+    for pragma in connection_pragmas(settings):
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """A fixed size pool of SQLite connections. They're opened lazily, get their PRAGMAs
+    once and are health checked before being handed out.
+
+    Args:
+        path (str): Path to the SQLite database file
+        size (int): Maximum amount of connections that can be open at once
+        timeout (float): How long (in seconds) a checkout waits for a free connection
+    """
+
+    def __init__(self, path, size=DEFAULT_POOL_SIZE, timeout=DEFAULT_POOL_TIMEOUT_SECONDS):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._in_use = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._discarded = 0
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sql.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sql.Error:
+            pass
+        with self._lock:
+            self._opened -= 1
+            self._discarded += 1
+
+    def acquire(self):
+        """Checks out a connection, opening a new one if the pool is not full yet.
+
+        Raises:
+            DatabasePoolExhaustedException: if no connection frees up within the timeout
+        """
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+
+        started = time.perf_counter()
+        deadline = started + self.timeout
+
+        while True:
+            conn = None
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_open = self._opened < self.size
+                    if can_open:
+                        self._opened += 1
+                if can_open:
+                    try:
+                        conn = open_connection(self.path)
+                    except Exception:
+                        with self._lock:
+                            self._opened -= 1
+                        raise
+                else:
+                    remaining = deadline - time.perf_counter()
+                    try:
+                        conn = self._idle.get(timeout=max(remaining, 0))
+                    except queue.Empty:
+                        with self._lock:
+                            self._timeouts += 1
+                        raise DatabasePoolExhaustedException(
+                            f"No database connection became available within {self.timeout}s",
+                            error_code="DB_POOL_EXHAUSTED"
+                        )
+
+            if not self._is_healthy(conn):
+                self._discard(conn)
+                continue
+
+            waited = time.perf_counter() - started
+            with self._lock:
+                self._checkouts += 1
+                self._in_use += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            return conn
+
+    def release(self, conn):
+        """Returns a connection to the pool. Anything left uncommitted is rolled back."""
+        with self._lock:
+            self._in_use -= 1
+
+        if self._closed:
+            self._discard(conn)
+            return
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sql.Error:
+            self._discard(conn)
+            return
+
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            self._discard(conn)
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and always returns it"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Closes every idle connection. Connections in use are closed on release."""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "opened": self._opened,
+                "idle": self._idle.qsize(),
+                "in_use": self._in_use,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+                "wait_seconds_total": self._wait_total,
+                "wait_seconds_max": self._wait_max,
+                "wait_seconds_avg": self._wait_total / self._checkouts if self._checkouts else 0.0,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Returns the process wide pool for `DB_PATH`, creating it on first use.
+
+    The size and checkout timeout can be configured with the `DB_POOL_SIZE` and
+    `DB_POOL_TIMEOUT` environment variables.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    DB_PATH,
+                    size=int(os.getenv("DB_POOL_SIZE", DEFAULT_POOL_SIZE)),
+                    timeout=float(os.getenv("DB_POOL_TIMEOUT", DEFAULT_POOL_TIMEOUT_SECONDS))
+                )
+    return _pool
+
+
+def get_connection():
+    """Shorthand for `get_pool().connection()`"""
+    return get_pool().connection()
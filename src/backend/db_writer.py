@@ -0,0 +1,153 @@
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from db_pool import open_connection
+import metrics
+from shared import DB_PATH
+
+
+class WriteQueue:
+    """Runs every write on one background thread that owns the only writing connection,
+    so request threads never fight over SQLite's write lock.
+
+    A write is a callable that takes the connection. It's committed if it returns and
+    rolled back if it raises.
+
+    Args:
+        path (str): Path to the SQLite database file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._conn = None
+        self._start_lock = threading.Lock()
+
+        self._lock = threading.Lock()
+        self._completed = 0
+        self._failed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def _fail_queued(self, error):
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                return
+            if job is not None and job[1].set_running_or_notify_cancel():
+                job[1].set_exception(error)
+
+    def _run(self):
+        try:
+            conn = self._conn = open_connection(self.path)
+        except Exception as e:
+            self._fail_queued(e)
+            return
+
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    break
+
+                fn, future, queued_at, usage, context = job
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                waited = time.perf_counter() - queued_at
+                # the SQL counts towards (and is traced as part of) the request that queued the write
+                metrics.attach(usage)
+                try:
+                    result = context.run(fn, conn)
+                    if conn.in_transaction:
+                        conn.commit()
+                except BaseException as e:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    self._record(waited, failed=True)
+                    future.set_exception(e)
+                else:
+                    self._record(waited, failed=False)
+                    future.set_result(result)
+                finally:
+                    metrics.attach(None)
+        finally:
+            self._conn = None
+            conn.close()
+
+    def _record(self, waited, failed):
+        with self._lock:
+            if failed:
+                self._failed += 1
+            else:
+                self._completed += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+    def submit(self, fn):
+        """Queues a write and returns a `Future` for its result"""
+        future = Future()
+        self._jobs.put((fn, future, time.perf_counter(), metrics.current(), contextvars.copy_context()))
+        self._ensure_started()
+        return future
+
+    def run(self, fn, timeout=None):
+        """Queues a write and blocks until it has been committed (or rolled back).
+
+        Calling this from inside a write runs `fn` straight away on the writer
+        connection, so a write can be composed from other writes without
+        deadlocking the queue.
+        """
+        if threading.current_thread() is self._thread:
+            return fn(self._conn)
+        return self.submit(fn).result(timeout=timeout)
+
+    def stop(self):
+        """Finishes the writes that are already queued, then stops the writer thread"""
+        if self._thread is not None and self._thread.is_alive():
+            self._jobs.put(None)
+            self._thread.join()
+
+    def stats(self):
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                "queued": self._jobs.qsize(),
+                "completed": self._completed,
+                "failed": self._failed,
+                "wait_seconds_total": self._wait_total,
+                "wait_seconds_max": self._wait_max,
+                "wait_seconds_avg": self._wait_total / finished if finished else 0.0,
+            }
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Returns the process wide write queue for `DB_PATH`"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = WriteQueue(DB_PATH)
+    return _writer
+
+
+def run_write(fn):
+    """Runs `fn(conn)` on the writer thread and returns its result"""
+    return get_writer().run(fn)
@@ -1,6 +1,8 @@
 from flask import Flask
 from .auth import __register_routes as auth_register
 from .devlog import __register_routes as devlog_register
+from .insights import __register_routes as insights_register
+from .internal import __register_routes as internal_register
 
 def register_routes(app: Flask):
     """Registers all routes and endpoints in the devlog app
@@ -9,4 +11,6 @@ def register_routes(app: Flask):
         app (Flask): The Flask app that this will be registered to. 
     """
     auth_register(app)
-    devlog_register(app)
\ No newline at end of file
+    devlog_register(app)
+    insights_register(app)
+    internal_register(app)
\ No newline at end of file
@@ -1,18 +1,23 @@
 from flask import Flask
 import sqlite3
-from flask import jsonify, request
+from flask import jsonify, request, make_response, url_for
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
-import bcrypt
 import pyotp
-import qrcode
-import io
-import base64
-from shared import BLOCKLIST, DB_PATH
+from db_pool import get_connection
+from db_writer import run_write
+import db_handler as dbHandler
+import password_hasher
+import provisioning
+import revocation
+from exceptions import PasswordHasherBusyException
 
 
 def __register_routes(app: Flask):
     """Registers the routes that are related to authentication"""
 
+    def signing_key():
+        return app.config.get("SECRET_KEY") or app.config["JWT_SECRET_KEY"]
+
     @app.route("/api/register", methods=["POST"])
     def register():
         """Registers a user and adds to the `users` database. 
@@ -30,60 +35,40 @@ def __register_routes(app: Flask):
         if not email or not password or not username:
             return jsonify({"message": "Email, username, and password are required"}), 400
 
-        conn = None
         try:
-            conn = sqlite3.connect(DB_PATH)
-            cur = conn.cursor()
-            
-            cur.execute("SELECT user_id FROM users WHERE email = ? OR username = ?", (email, username))
-            existing_user = cur.fetchone()
-            
-            if existing_user:
-                return jsonify({"message": "User with this email or username already exists"}), 400
-                
+            with get_connection() as conn:
+                existing_user = conn.execute(
+                    "SELECT user_id FROM users WHERE email = ? OR username = ?", (email, username)
+                ).fetchone()
         except Exception as e:
             app.logger.error(f"Error checking existing user: {e}")
             return jsonify({"message": "Database error", "cause": str(e)}), 500
-        finally:
-            if conn:
-                conn.close()
 
-        password_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+        if existing_user:
+            return jsonify({"message": "User with this email or username already exists"}), 400
+
+        password_hash = password_hasher.hash_password(password)
         
         totp_secret = pyotp.random_base32()
-        totp = pyotp.TOTP(totp_secret)
-        provisioning_uri = totp.provisioning_uri(name=email, issuer_name='LoperLog')
-        
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(provisioning_uri)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        img_buffer = io.BytesIO()
-        img.save(img_buffer, format='PNG')
-        img_buffer.seek(0)
-        qr_code_base64 = base64.b64encode(img_buffer.getvalue()).decode()
+        provisioning_uri = provisioning.provisioning_uri(totp_secret, email)
 
-        conn = None
         try:
-            conn = sqlite3.connect(DB_PATH)
-            cur = conn.cursor()
-
-            cur.execute(
+            user_id = run_write(lambda write_conn: write_conn.execute(
                 "INSERT INTO users (username, email, password_hash, totp_secret) VALUES (?, ?, ?, ?)",
-                (username, email, password_hash.decode(), totp_secret)
-            )
+                (username, email, password_hash, totp_secret)
+            ).lastrowid)
 
-            user_id = cur.lastrowid
-
-            conn.commit()
+            # rendered in the background, the browser fetches it from qr_code_url
+            provisioning.prepare(user_id, provisioning_uri)
+            qr_token = provisioning.make_token(user_id, signing_key())
 
             return jsonify({
                 "message": "User created. 2FA verification is mandatory and requird.",
                 "user_id": user_id,
                 "totp_secret": totp_secret,
                 "provisioning_uri": provisioning_uri,
-                "qr_code": f"data:image/png;base64,{qr_code_base64}"
+                "qr_code_url": url_for("registration_qr", user_id=user_id, fmt="svg", token=qr_token),
+                "qr_code_png_url": url_for("registration_qr", user_id=user_id, fmt="png", token=qr_token)
             }), 201
 
         except sqlite3.IntegrityError:
@@ -92,9 +77,6 @@ def __register_routes(app: Flask):
         except Exception as e:
             app.logger.error(f"Error while creating user: {e}")
             return jsonify({"message": "Error while creating user", "cause": str(e)}), 400
-        finally:
-            if conn:
-                conn.close()
 
     @app.route("/api/register/verify_2fa", methods=["POST"])
     def verify_2fa_registration():
@@ -106,17 +88,12 @@ def __register_routes(app: Flask):
         if not user_id or not totp_code:
             return jsonify({"message": "user_id and totp_code are required"}), 400
 
-        conn = None
         try:
-            conn = sqlite3.connect(DB_PATH)
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-
-            cur.execute(
-                "SELECT user_id, username, email, totp_secret FROM users WHERE user_id = ?",
-                (user_id,)
-            )
-            user = cur.fetchone()
+            with get_connection() as conn:
+                user = conn.execute(
+                    "SELECT user_id, username, email, totp_secret FROM users WHERE user_id = ?",
+                    (user_id,)
+                ).fetchone()
 
             if not user:
                 return jsonify({"message": "User not found"}), 404
@@ -125,6 +102,13 @@ def __register_routes(app: Flask):
             if not totp.verify(totp_code, valid_window=1):
                 return jsonify({"message": "Invalid 2FA code. Please check your authenticator app and try again."}), 401
 
+            # counts as the first login, which also ends the QR code's lifetime
+            run_write(lambda write_conn: write_conn.execute(
+                "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE user_id = ?",
+                (user['user_id'],)
+            ))
+            provisioning.forget(user['user_id'])
+
             access_token = create_access_token(
                 identity=str(user['user_id']),
                 additional_claims={'email': user['email'], 'username': user['username']}
@@ -153,9 +137,43 @@ def __register_routes(app: Flask):
         except Exception as e:
             app.logger.error(f"Error verifying 2FA: {e}")
             return jsonify({"message": "Error verifying 2FA", "cause": str(e)}), 500
-        finally:
-            if conn:
-                conn.close()
+
+    @app.route("/api/register/<int:user_id>/qr.<any(svg, png):fmt>", methods=["GET"])
+    def registration_qr(user_id, fmt):
+        """Serves the 2FA setup QR code of a freshly registered user as SVG or PNG.
+
+        Requires the `token` query parameter handed out by /api/register. Only works
+        until the user has verified their 2FA code.
+        """
+        if provisioning.read_token(request.args.get("token", ""), signing_key()) != user_id:
+            return jsonify({"message": "QR code not found or expired"}), 404
+
+        try:
+            with get_connection() as conn:
+                user = conn.execute(
+                    "SELECT email, totp_secret FROM users WHERE user_id = ? AND last_login IS NULL",
+                    (user_id,)
+                ).fetchone()
+        except Exception as e:
+            app.logger.error(f"Error fetching 2FA QR code: {e}")
+            return jsonify({"message": "Database error", "cause": str(e)}), 500
+
+        if not user or not user['totp_secret']:
+            provisioning.forget(user_id)
+            return jsonify({"message": "QR code not found or expired"}), 404
+
+        uri = provisioning.provisioning_uri(user['totp_secret'], user['email'])
+        etag = provisioning.etag(uri, fmt)
+
+        if request.if_none_match.contains_weak(etag):
+            response = make_response("", 304)
+        else:
+            response = make_response(provisioning.get_qr(user_id, uri, fmt))
+            response.mimetype = provisioning.FORMATS[fmt]
+        response.set_etag(etag)
+        # holds the TOTP secret, so only the browser itself may keep it
+        response.headers["Cache-Control"] = f"private, max-age={provisioning.QR_TTL_SECONDS}"
+        return response
 
     @app.route("/api/login", methods=["POST"])
     def login():
@@ -166,27 +184,34 @@ def __register_routes(app: Flask):
         if not email or not password:
             return jsonify({'message': 'Email and password required'}), 400
 
-        conn = None
         try:
-            conn = sqlite3.connect(DB_PATH)
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-
-            cur.execute(
-                "SELECT user_id, username, password_hash, totp_secret FROM users WHERE email = ?",
-                (email,)
-            )
-            user = cur.fetchone()
+            with get_connection() as conn:
+                user = conn.execute(
+                    "SELECT user_id, username, password_hash, totp_secret FROM users WHERE email = ?",
+                    (email,)
+                ).fetchone()
         except Exception as e:
             app.logger.error(f"Error while attempting to login: {e}")
             return jsonify({'message': 'Error while attempting to login', 'cause': str(e)}), 500
-        finally:
-            if conn:
-                conn.close()
 
-        if not user or not bcrypt.checkpw(password.encode(), user['password_hash'].encode()):
+        if not user:
             return jsonify({'message': 'Invalid email or password'}), 401
 
+        correct, upgraded_hash = password_hasher.get_hasher().check_and_upgrade(password, user['password_hash'])
+        if not correct:
+            return jsonify({'message': 'Invalid email or password'}), 401
+
+        if upgraded_hash:
+            # the cost factor was changed since this hash was stored, unless the
+            # password was changed in the meantime
+            try:
+                run_write(lambda write_conn: write_conn.execute(
+                    "UPDATE users SET password_hash = ? WHERE user_id = ? AND password_hash = ?",
+                    (upgraded_hash, user['user_id'], user['password_hash'])
+                ))
+            except Exception as e:
+                app.logger.warning(f"Could not store the rehashed password of user {user['user_id']}: {e}")
+
         return jsonify({
             'message': 'Password correct, please enter 2FA code.',
             'user_id': user['user_id'],
@@ -203,17 +228,12 @@ def __register_routes(app: Flask):
         if not user_id or not totp_code:
             return jsonify({"message": "user_id and totp_code are required"}), 400
 
-        conn = None
         try:
-            conn = sqlite3.connect(DB_PATH)
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-
-            cur.execute(
-                "SELECT user_id, username, email, totp_secret FROM users WHERE user_id = ?",
-                (user_id,)
-            )
-            user = cur.fetchone()
+            with get_connection() as conn:
+                user = conn.execute(
+                    "SELECT user_id, username, email, totp_secret FROM users WHERE user_id = ?",
+                    (user_id,)
+                ).fetchone()
 
             if not user:
                 return jsonify({"message": "User not found"}), 404
@@ -222,11 +242,10 @@ def __register_routes(app: Flask):
             if not totp.verify(totp_code, valid_window=1):
                 return jsonify({"message": "Invalid 2FA code"}), 401
 
-            cur.execute(
+            run_write(lambda write_conn: write_conn.execute(
                 "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE user_id = ?",
                 (user_id,)
-            )
-            conn.commit()
+            ))
 
             token = create_access_token(
                 identity=str(user['user_id']),
@@ -256,9 +275,6 @@ def __register_routes(app: Flask):
         except Exception as e:
             app.logger.error(f"Error verifying 2FA login: {e}")
             return jsonify({"message": "Error verifying 2FA", "cause": str(e)}), 500
-        finally:
-            if conn:
-                conn.close()
 
     @app.route("/api/whoami", methods=["GET"])
     @jwt_required()
@@ -269,15 +285,10 @@ def __register_routes(app: Flask):
         """
         user_id = get_jwt_identity()
 
-        conn = None
         try:
-            conn = sqlite3.connect(DB_PATH)
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-
-            cur.execute(
-                "SELECT user_id, username, email FROM users WHERE user_id = ?", (user_id,))
-            user = cur.fetchone()
+            with get_connection() as conn:
+                user = conn.execute(
+                    "SELECT user_id, username, email FROM users WHERE user_id = ?", (user_id,)).fetchone()
 
             if not user:
                 return jsonify({"message": "User not found"}), 404
@@ -291,17 +302,12 @@ def __register_routes(app: Flask):
         except Exception as e:
             app.logger.error(f"Error in whoami: {e}")
             return jsonify({"message": "Error fetching user info"}), 500
-        finally:
-            if conn:
-                conn.close()
 
     @app.route("/api/logout", methods=["POST"])
     @jwt_required()
     def logout():
-        """Logs you out by setting the users JWT token onto a blocklist, forcing the 
-        user to re-login"""
-        jti = get_jwt()["jti"]
-        BLOCKLIST.add(jti)
+        """Logs you out by revoking the users JWT token, forcing the user to re-login"""
+        revocation.revoke_token(get_jwt())
         response = jsonify({"message": "Logout successful"})
         response.delete_cookie('access_token_cookie')
         return response, 200
@@ -321,37 +327,28 @@ def __register_routes(app: Flask):
         if not new_username:
             return jsonify({"message": "username is required"}), 400
 
-        conn = None
         try:
-            conn = sqlite3.connect(DB_PATH)
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
+            with get_connection() as conn:
+                user = conn.execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,)).fetchone()
+                taken = conn.execute(
+                    "SELECT user_id FROM users WHERE username = ? AND user_id != ?",
+                    (new_username, user_id)
+                ).fetchone()
 
-            cur.execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,))
-            user = cur.fetchone()
             if not user:
                 return jsonify({"message": "User not found"}), 404
-
-            cur.execute(
-                "SELECT user_id FROM users WHERE username = ? AND user_id != ?",
-                (new_username, user_id)
-            )
-            if cur.fetchone():
+            if taken:
                 return jsonify({"message": "Username already in use"}), 400
 
-            cur.execute(
+            run_write(lambda write_conn: write_conn.execute(
                 "UPDATE users SET username = ? WHERE user_id = ?",
                 (new_username, user_id)
-            )
-            conn.commit()
+            ))
             return jsonify({"message": "Username updated", "username": new_username}), 200
 
         except Exception as e:
             app.logger.error(f"Error updating username: {e}")
             return jsonify({"message": "Failed to update username", "cause": str(e)}), 500
-        finally:
-            if conn:
-                conn.close()
 
 
     @app.route("/api/account/password", methods=["PUT"])
@@ -375,17 +372,12 @@ def __register_routes(app: Flask):
         if not current_password or not new_password or not totp_code:
             return jsonify({"message": "current_password, new_password, and totp_code are required"}), 400
 
-        conn = None
         try:
-            conn = sqlite3.connect(DB_PATH)
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-
-            cur.execute(
-                "SELECT user_id, password_hash, totp_secret FROM users WHERE user_id = ?",
-                (user_id,)
-            )
-            user = cur.fetchone()
+            with get_connection() as conn:
+                user = conn.execute(
+                    "SELECT user_id, password_hash, totp_secret FROM users WHERE user_id = ?",
+                    (user_id,)
+                ).fetchone()
 
             if not user:
                 return jsonify({"message": "User not found"}), 404
@@ -394,23 +386,21 @@ def __register_routes(app: Flask):
             if not totp.verify(totp_code, valid_window=1):
                 return jsonify({"message": "Invalid 2FA code"}), 401
 
-            if not bcrypt.checkpw(current_password.encode(), user["password_hash"].encode()):
+            if not password_hasher.check_password(current_password, user["password_hash"]):
                 return jsonify({"message": "Current password is incorrect"}), 401
 
-            password_hash = bcrypt.hashpw(new_password.encode(), bcrypt.gensalt()).decode()
-            cur.execute(
+            password_hash = password_hasher.hash_password(new_password)
+            run_write(lambda write_conn: write_conn.execute(
                 "UPDATE users SET password_hash = ? WHERE user_id = ?",
                 (password_hash, user_id)
-            )
-            conn.commit()
+            ))
             return jsonify({"message": "Password updated"}), 200
 
+        except PasswordHasherBusyException:
+            raise
         except Exception as e:
             app.logger.error(f"Error updating password: {e}")
             return jsonify({"message": "Failed to update password", "cause": str(e)}), 500
-        finally:
-            if conn:
-                conn.close()
 
 
     @app.route("/api/account", methods=["DELETE"])
@@ -419,26 +409,24 @@ def __register_routes(app: Flask):
         """Delete the authenticated user's account."""
         user_id = get_jwt_identity()
 
-        conn = None
         try:
-            conn = sqlite3.connect(DB_PATH)
-            cur = conn.cursor()
-
-            cur.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
-            if cur.rowcount == 0:
+            deleted = run_write(lambda write_conn: write_conn.execute(
+                "DELETE FROM users WHERE user_id = ?", (user_id,)
+            ).rowcount)
+            if deleted == 0:
                 return jsonify({"message": "User not found"}), 404
 
-            conn.commit()
+            # their projects went with them through ON DELETE CASCADE
+            dbHandler.clear_project_cache()
 
             try:
                 jwt_data = get_jwt()
-                jti = jwt_data.get("jti")
-                if jti:
-                    BLOCKLIST.add(jti)
+                if jwt_data.get("jti"):
+                    revocation.revoke_token(jwt_data)
                 else:
-                    app.logger.warning("delete_account: JWT missing 'jti'; skipping blocklist")
+                    app.logger.warning("delete_account: JWT missing 'jti'; skipping revocation")
             except RuntimeError as e:
-                app.logger.warning(f"delete_account: unable to read JWT for blocklisting: {e}")
+                app.logger.warning(f"delete_account: unable to read JWT for revocation: {e}")
 
             response = jsonify({"message": "Account deleted"})
             response.delete_cookie('access_token_cookie')
@@ -447,6 +435,3 @@ def __register_routes(app: Flask):
         except Exception as e:
             app.logger.error(f"Error deleting account: {e}")
             return jsonify({"message": "Failed to delete account", "cause": str(e)}), 500
-        finally:
-            if conn:
-                conn.close()
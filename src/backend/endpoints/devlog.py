@@ -1,8 +1,101 @@
 from exceptions import UserSkillIssueException
 from flask import Flask
-from flask import jsonify, request
+from flask import jsonify, request, Response
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import db_handler as dbHandler
+import json
+from datetime import datetime
+
+DATETIME_FIELDS = ('start_time', 'end_time', 'log_timestamp')
+
+BULK_DEFAULT_CHUNK_SIZE = 500
+BULK_MAX_CHUNK_SIZE = 5000
+BULK_MAX_ENTRIES = 50000
+# a body that's wrong all the way through shouldn't produce an even bigger response
+BULK_MAX_REPORTED_ERRORS = 1000
+
+
+def check_log_datetimes(data):
+    """Makes sure the datetime fields of a log entry that are set are in ISO 8601 format.
+
+    Raises:
+        UserSkillIssueException: naming the first field that isn't
+    """
+    for field in DATETIME_FIELDS:
+        if field in data and data[field]:
+            try:
+                datetime.fromisoformat(data[field].replace('Z', '+00:00'))
+            except (ValueError, AttributeError):
+                raise UserSkillIssueException(f"Field '{field}' must be in ISO 8601 format (YYYY-MM-DD HH:MM:SS)")
+
+
+def validate_bulk_entry(entry):
+    """Checks one entry of a bulk import and returns it ready to be inserted.
+
+    Raises:
+        UserSkillIssueException: if the entry can't be added
+    """
+    if not isinstance(entry, dict):
+        raise UserSkillIssueException("Entry must be a JSON object")
+
+    missing = [field for field in ('start_time', 'end_time', 'time_worked_minutes') if entry.get(field) in (None, "")]
+    if missing:
+        raise UserSkillIssueException(f"Missing required fields: {', '.join(missing)}")
+
+    check_log_datetimes(entry)
+
+    try:
+        minutes = int(entry['time_worked_minutes'])
+    except (TypeError, ValueError):
+        raise UserSkillIssueException("Field 'time_worked_minutes' must be an integer")
+    if minutes < 0:
+        raise UserSkillIssueException("Field 'time_worked_minutes' can't be negative")
+
+    notes = entry.get('developer_notes', "")
+    if not isinstance(notes, str):
+        raise UserSkillIssueException("Field 'developer_notes' must be a string")
+
+    return {**entry, 'time_worked_minutes': minutes, 'developer_notes': notes}
+
+
+def iter_bulk_body():
+    """Yields (index, entry) for every entry of a bulk import body, as it's read.
+
+    The body is either a JSON array or NDJSON (one JSON object per line, empty lines
+    are skipped). An NDJSON line that isn't valid JSON is yielded as the
+    UserSkillIssueException to report for it, the others still get read.
+
+    Raises:
+        UserSkillIssueException: if the body as a whole can't be read
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        index = 0
+        for line in request.stream:
+            if not line.strip():
+                continue
+            try:
+                yield index, json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                yield index, UserSkillIssueException("Line is not valid JSON")
+            index += 1
+        return
+
+    entries = request.get_json(silent=True)
+    if not isinstance(entries, list):
+        raise UserSkillIssueException(
+            "Body must be a JSON array (application/json) or NDJSON (application/x-ndjson)")
+    yield from enumerate(entries)
+
+def conditional_listing(etag, build):
+    """Answers with 304 if the client already has the listing tagged `etag`, otherwise with `build()`"""
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = build()
+    response.set_etag(etag)
+    # the client may keep it, but has to check back every time
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
 
 def __register_routes(app: Flask):
     """Registers all the routes that are related to devlog manipulation"""
@@ -12,7 +105,8 @@ def __register_routes(app: Flask):
     def projects():
         """Project management
         
-        GET: Lists all projects for the authenticated user.
+        GET: Lists all projects for the authenticated user. Answers If-None-Match with
+             304 if none of them changed.
         POST: Creates a new project.
 
         For POST, requires:
@@ -26,8 +120,8 @@ def __register_routes(app: Flask):
 
         if request.method == "GET":
             try:
-                projects = dbHandler.fetch_projects(user_id)
-                return jsonify(projects), 200
+                etag = dbHandler.listing_etag(user_id)
+                return conditional_listing(etag, lambda: jsonify(dbHandler.fetch_projects(user_id)))
             except Exception as e:
                 app.logger.error(f"Error fetching projects: {e}")
                 return jsonify({"message": "Failed to fetch projects", "cause": str(e)}), 500
@@ -138,6 +232,19 @@ def __register_routes(app: Flask):
             Example: /api/2/logs?start_time_gt=2025-12-13 10:30:00&time_worked_min=30
         
         where _gte is 'greater than or equal' or '>=' (but the character is not used)
+
+        paginated newest first, as {"logs": [...], "next_cursor": ...}:
+            - limit: entries per page (default 50, max 500)
+            - cursor: the previous page's next_cursor (null on the last page)
+
+        full text search over the notes, commits and project name:
+            - q: an FTS5 query, e.g. `fuel pump`, `"fuel pump"`, `refact*` or `related_commits:abc123`
+            best matches come first, each with a `search_rank` and a `snippet` (matches in <mark></mark>)
+
+        comes with an ETag, send it back as If-None-Match to get a 304 if nothing changed
+
+        shape=columnar sends `columns` and `rows`, with the users and projects listed once by id.
+        much smaller for big pages
         
         POST body fields:
         - start_time: datetime in ISO 8601 format (YYYY-MM-DD HH:MM:SS) (when work started)
@@ -153,23 +260,13 @@ def __register_routes(app: Flask):
         
         if request.method == "POST":
             try:
-                from datetime import datetime
-                
-                project = dbHandler.fetch_projects()
-                project_exists = any(p['project_id'] == project_id for p in project)
-                if not project_exists:
+                if not dbHandler.project_exists(project_id):
                     raise UserSkillIssueException(f"Project with ID {project_id} does not exist")
                 
                 data = dict(request.form)
                 data['project_id'] = project_id
                 
-                datetime_fields = ['start_time', 'end_time', 'log_timestamp']
-                for field in datetime_fields:
-                    if field in data and data[field]:
-                        try:
-                            datetime.fromisoformat(data[field].replace('Z', '+00:00'))
-                        except (ValueError, AttributeError):
-                            raise UserSkillIssueException(f"Field '{field}' must be in ISO 8601 format (YYYY-MM-DD HH:MM:SS)")
+                check_log_datetimes(data)
                 
                 log_id = dbHandler.add_log(data, user_id)
                 return jsonify({"message": "Log successfully added", "log_id": log_id}), 201
@@ -181,19 +278,180 @@ def __register_routes(app: Flask):
                 return jsonify({"message": "Log failed to be added", "cause": str(e)}), 500
         else:
             try:
-                project = dbHandler.fetch_projects()
-                project_exists = any(p['project_id'] == project_id for p in project)
-                if not project_exists:
+                if not dbHandler.project_exists(project_id):
                     return jsonify({"message": f"Project with ID {project_id} does not exist"}), 404
                 
-                from filters import parse_log_filters
-                filters = parse_log_filters()
-                logs = dbHandler.fetch_devlogs(user_id=user_id, project_id=project_id, filters=filters)
-                return jsonify(logs), 200
+                def build():
+                    from filters import parse_log_filters, parse_pagination, encode_cursor
+                    shape = request.args.get("shape", "rows")
+                    if shape not in ("rows", "columnar"):
+                        raise UserSkillIssueException("shape must be either rows or columnar")
+                    filters = parse_log_filters()
+                    limit, cursor = parse_pagination()
+                    logs, next_key = dbHandler.fetch_devlog_page(
+                        user_id=user_id,
+                        project_id=project_id,
+                        filters=filters,
+                        limit=limit,
+                        after=cursor,
+                        search=(request.args.get("q") or "").strip() or None
+                    )
+                    next_cursor = encode_cursor(*next_key) if next_key else None
+                    if shape == "columnar":
+                        return jsonify({**dbHandler.columnar_devlogs(logs), "next_cursor": next_cursor})
+                    return jsonify({"logs": logs, "next_cursor": next_cursor})
+
+                etag = dbHandler.listing_etag(user_id, project_id, request.args.items(multi=True))
+                return conditional_listing(etag, build)
+            except UserSkillIssueException as e:
+                return jsonify({"message": "Failed to fetch logs", "cause": str(e)}), 400
             except Exception as e:
                 app.logger.error(f"Error fetching logs: {e}")
                 return jsonify({"message": "Failed to fetch logs", "cause": str(e)}), 500
 
+    @app.route("/api/<int:project_id>/logs/bulk", methods=["POST"])
+    @jwt_required()
+    def bulk_add_logs(project_id):
+        """Adds many log entries to a project at once, e.g. imported from another time tracker.
+
+        Takes a JSON array or NDJSON (one entry per line) of at most 50000 entries, with the
+        same fields as POST /api/<project_id>/logs.
+            - chunk_size: entries inserted per transaction (default 500, max 5000)
+
+        Bad entries are reported in `errors` by their position and the rest still get added.
+        201 if all of them were added, 207 if some were and 400 if none were.
+
+        Requires a JWT token
+        """
+        user_id = get_jwt_identity()
+
+        try:
+            chunk_size = int(request.args.get("chunk_size", BULK_DEFAULT_CHUNK_SIZE))
+        except ValueError:
+            return jsonify({"message": "chunk_size must be an integer"}), 400
+        if not 1 <= chunk_size <= BULK_MAX_CHUNK_SIZE:
+            return jsonify({"message": f"chunk_size must be between 1 and {BULK_MAX_CHUNK_SIZE}"}), 400
+
+        if not dbHandler.project_exists(project_id):
+            return jsonify({"message": f"Project with ID {project_id} does not exist"}), 404
+
+        added = 0
+        errors = []
+        total = 0
+        chunk = []
+
+        def flush():
+            nonlocal added
+            chunk_added, failed = dbHandler.add_logs(chunk, user_id, project_id)
+            added += chunk_added
+            errors.extend({"index": index, "cause": cause} for index, cause in failed)
+            chunk.clear()
+
+        try:
+            for index, entry in iter_bulk_body():
+                if index >= BULK_MAX_ENTRIES:
+                    errors.append({"index": index, "cause": f"Too many entries, at most {BULK_MAX_ENTRIES} are read"})
+                    break
+                total += 1
+
+                try:
+                    if isinstance(entry, UserSkillIssueException):
+                        raise entry
+                    chunk.append((index, validate_bulk_entry(entry)))
+                except UserSkillIssueException as e:
+                    errors.append({"index": index, "cause": e.args[0]})
+
+                if len(chunk) >= chunk_size:
+                    flush()
+            flush()
+        except UserSkillIssueException as e:
+            return jsonify({"message": "Logs failed to be added", "cause": e.args[0]}), 400
+        except Exception as e:
+            app.logger.error(f"Error during bulk log import: {e}")
+            return jsonify({
+                "message": "Bulk import aborted",
+                "cause": str(e),
+                "added": added
+            }), 500
+
+        app.logger.info(f"Bulk import into project {project_id}: {added} of {total} entries added")
+
+        if not errors:
+            status = 201
+        elif added:
+            status = 207
+        else:
+            status = 400
+        return jsonify({
+            "message": f"{added} of {total} log entries added",
+            "added": added,
+            "failed": total - added,
+            "errors": errors[:BULK_MAX_REPORTED_ERRORS],
+            "errors_truncated": len(errors) > BULK_MAX_REPORTED_ERRORS
+        }), status
+
+    @app.route("/api/logs/export", methods=["GET"])
+    @app.route("/api/<int:project_id>/logs/export", methods=["GET"])
+    @jwt_required()
+    def export_logs(project_id=None):
+        """Streams every log entry of the user (optionally for one project) for bulk exports.
+
+        Takes the same filters as GET /api/<project_id>/logs, and:
+            - format: "ndjson" (default, one JSON object per line) or "json" (a single JSON array)
+
+        Entries are written out while they are read from the database, so this does not
+        load everything into memory first.
+
+        Requires a JWT token
+        """
+        user_id = get_jwt_identity()
+
+        export_format = (request.args.get("format") or "ndjson").lower()
+        if export_format not in ("ndjson", "json"):
+            return jsonify({"message": "format must be either ndjson or json"}), 400
+
+        try:
+            if project_id is not None and not dbHandler.project_exists(project_id):
+                return jsonify({"message": f"Project with ID {project_id} does not exist"}), 404
+
+            from filters import parse_log_filters
+            filters = parse_log_filters()
+            rows = dbHandler.iter_devlogs(user_id=user_id, project_id=project_id, filters=filters)
+        except ValueError as e:
+            return jsonify({"message": "Failed to export logs", "cause": str(e)}), 400
+        except Exception as e:
+            app.logger.error(f"Error exporting logs: {e}")
+            return jsonify({"message": "Failed to export logs", "cause": str(e)}), 500
+
+        def ndjson():
+            try:
+                for row in rows:
+                    yield json.dumps(row) + "\n"
+            except Exception as e:
+                app.logger.error(f"Error while streaming log export: {e}")
+                yield json.dumps({"error": "Export aborted", "cause": str(e)}) + "\n"
+
+        def json_array():
+            # an export that breaks halfway is left as an unterminated array on purpose,
+            # so it can't be mistaken for a complete one
+            yield "["
+            try:
+                for index, row in enumerate(rows):
+                    yield ("," if index else "") + json.dumps(row)
+            except Exception as e:
+                app.logger.error(f"Error while streaming log export: {e}")
+                return
+            yield "]"
+
+        if export_format == "json":
+            body, mimetype, extension = json_array(), "application/json", "json"
+        else:
+            body, mimetype, extension = ndjson(), "application/x-ndjson", "ndjson"
+
+        response = Response(body, mimetype=mimetype)
+        response.headers["Content-Disposition"] = f'attachment; filename="loperlog-logs.{extension}"'
+        return response
+
     @app.route("/api/<int:project_id>/logs/<int:log_id>", methods=["GET"])
     @jwt_required()
     def fetch_log(project_id, log_id):
@@ -201,9 +459,7 @@ def __register_routes(app: Flask):
         user_id = get_jwt_identity()
 
         try:
-            project = dbHandler.fetch_projects()
-            project_exists = any(p['project_id'] == project_id for p in project)
-            if not project_exists:
+            if not dbHandler.project_exists(project_id):
                 return jsonify({"message": f"Project with ID {project_id} does not exist"}), 404
             
             log = dbHandler.fetch_one_devlog(log_id, user_id)
@@ -231,9 +487,7 @@ def __register_routes(app: Flask):
         user_id = get_jwt_identity()
 
         try:
-            project = dbHandler.fetch_projects()
-            project_exists = any(p['project_id'] == project_id for p in project)
-            if not project_exists:
+            if not dbHandler.project_exists(project_id):
                 return jsonify({"message": f"Project with ID {project_id} does not exist"}), 404
             
             data = request.form
@@ -274,9 +528,7 @@ def __register_routes(app: Flask):
         user_id = get_jwt_identity()
 
         try:
-            project = dbHandler.fetch_projects()
-            project_exists = any(p['project_id'] == project_id for p in project)
-            if not project_exists:
+            if not dbHandler.project_exists(project_id):
                 return jsonify({"message": f"Project with ID {project_id} does not exist"}), 404
             
             existing_log = dbHandler.fetch_one_devlog(log_id, user_id)
@@ -0,0 +1,139 @@
+from exceptions import UserSkillIssueException
+from flask import Flask
+from flask import jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from filters import parse_date_range
+import insights
+
+
+def _parse_project_id():
+    raw = request.args.get("project_id")
+    if not raw:
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        raise UserSkillIssueException("project_id must be an integer", error_code="BAD_PROJECT")
+
+
+def _parse_limit(default):
+    raw = request.args.get("limit")
+    if not raw:
+        return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise UserSkillIssueException("limit must be an integer", error_code="BAD_LIMIT")
+    if limit < 1:
+        raise UserSkillIssueException("limit must be at least 1", error_code="BAD_LIMIT")
+    return limit
+
+
+def __register_routes(app: Flask):
+    """Registers all the routes for the developer insights dashboard.
+
+    Every route here takes an optional date range as query parameters:
+        - from: first day, YYYY-MM-DD (defaults to 30 days before `to`)
+        - to: last day, YYYY-MM-DD (defaults to today)
+
+    All of them require a JWT token and only ever look at the caller's own entries.
+    """
+
+    def respond(fetch):
+        try:
+            return jsonify(fetch(get_jwt_identity())), 200
+        except UserSkillIssueException as e:
+            return jsonify({"message": "Failed to fetch insights", "cause": str(e)}), 400
+        except Exception as e:
+            app.logger.error(f"Error fetching insights: {e}")
+            return jsonify({"message": "Failed to fetch insights", "cause": str(e)}), 500
+
+    @app.route("/api/insights", methods=["GET"])
+    @jwt_required()
+    def insights_summary():
+        """Everything the dashboard shows at once: all-time totals, minutes in the range,
+        streaks and the top projects of the range.
+        """
+        def fetch(user_id):
+            start, end = parse_date_range()
+            days = insights.minutes_per_day(user_id, start, end)
+            return {
+                "from": start.isoformat(),
+                "to": end.isoformat(),
+                "all_time": insights.totals(user_id),
+                "range": {
+                    "minutes": sum(day["minutes"] for day in days),
+                    "entries": sum(day["entries"] for day in days),
+                    "days_worked": sum(1 for day in days if day["entries"]),
+                },
+                "streaks": insights.streaks(user_id),
+                "top_projects": insights.top_projects(user_id, start, end),
+            }
+
+        return respond(fetch)
+
+    @app.route("/api/insights/daily", methods=["GET"])
+    @jwt_required()
+    def insights_daily():
+        """Minutes and entries per day in the range, days without work included as zeros.
+
+        - project_id: only count one project (optional)
+        """
+        def fetch(user_id):
+            start, end = parse_date_range()
+            return insights.minutes_per_day(user_id, start, end, _parse_project_id())
+
+        return respond(fetch)
+
+    @app.route("/api/insights/weekly", methods=["GET"])
+    @jwt_required()
+    def insights_weekly():
+        """Minutes and entries per week (starting on Monday) in the range. Defaults to the last 12 weeks.
+
+        - project_id: only count one project (optional)
+        """
+        def fetch(user_id):
+            start, end = parse_date_range(default_days=12 * 7)
+            return insights.minutes_per_week(user_id, start, end, _parse_project_id())
+
+        return respond(fetch)
+
+    @app.route("/api/insights/projects", methods=["GET"])
+    @jwt_required()
+    def insights_projects():
+        """Minutes and entries per project, most worked on first.
+
+        Without `from` and `to` this covers all time.
+        """
+        def fetch(user_id):
+            if request.args.get("from") or request.args.get("to"):
+                start, end = parse_date_range()
+                return insights.minutes_per_project(user_id, start, end)
+            return insights.minutes_per_project(user_id)
+
+        return respond(fetch)
+
+    @app.route("/api/insights/top-projects", methods=["GET"])
+    @jwt_required()
+    def insights_top_projects():
+        """The most worked on projects in the range, each with its share of the minutes.
+
+        - limit: amount of projects (default 5)
+        """
+        def fetch(user_id):
+            start, end = parse_date_range()
+            return insights.top_projects(user_id, start, end, _parse_limit(insights.TOP_PROJECTS_LIMIT))
+
+        return respond(fetch)
+
+    @app.route("/api/insights/streaks", methods=["GET"])
+    @jwt_required()
+    def insights_streaks():
+        """The current and longest streak of consecutive days worked in the range.
+        Defaults to the last year, and a streak is current if it reaches up to `to`.
+        """
+        def fetch(user_id):
+            start, end = parse_date_range(default_days=insights.STREAK_WINDOW_DAYS)
+            return insights.streaks(user_id, today=end, window_days=(end - start).days + 1)
+
+        return respond(fetch)
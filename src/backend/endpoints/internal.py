@@ -0,0 +1,106 @@
+from flask import Flask, Response, jsonify, request
+from functools import wraps
+import memory_tracking
+import metrics
+import os
+import slow_queries
+
+# who may see the internals of this process: this machine by default, add e.g. the
+# Prometheus server's address to let it scrape
+INTERNAL_ALLOWED_ADDRESSES = {
+    address.strip() for address in os.getenv("INTERNAL_ALLOWED_ADDRESSES", "127.0.0.1,::1").split(",") if address.strip()
+}
+
+
+def internal_only(fn):
+    """Only lets requests from INTERNAL_ALLOWED_ADDRESSES through to `fn`"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if request.remote_addr not in INTERNAL_ALLOWED_ADDRESSES:
+            return jsonify({"message": "Only available from an internal address"}), 403
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def __register_routes(app: Flask):
+    """Registers the routes that expose how this process is doing"""
+
+    @app.route("/api/metrics", methods=["GET"])
+    @internal_only
+    def prometheus_metrics():
+        """Request, SQL, pool and cache metrics in the Prometheus text format. See `metrics.py`."""
+        if not metrics.ENABLED:
+            return jsonify({"message": "Metrics are turned off (METRICS_ENABLED=0)"}), 404
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    @app.route("/api/internal/slow-queries", methods=["GET", "DELETE"])
+    @internal_only
+    def slow_query_log():
+        """
+        GET: Every SQL fingerprint with its count, total/average/max time and, if it was
+        ever slow, its last query plan. See `slow_queries.py`.
+            - sort: total_seconds (default), max_seconds, avg_seconds, count or slow_count
+            - limit: only the first this many
+
+        DELETE: Starts counting from scratch
+        """
+        if request.method == "DELETE":
+            slow_queries.reset()
+            return jsonify({"message": "Slow query log cleared"}), 200
+
+        sort = request.args.get("sort", "total_seconds")
+        if sort not in ("total_seconds", "max_seconds", "avg_seconds", "count", "slow_count"):
+            return jsonify({"message": "sort must be one of total_seconds, max_seconds, avg_seconds, count or slow_count"}), 400
+        try:
+            limit = int(request.args["limit"]) if "limit" in request.args else None
+        except ValueError:
+            return jsonify({"message": "limit must be an integer"}), 400
+
+        return jsonify({"stats": slow_queries.stats(), "queries": slow_queries.snapshot(sort, limit)}), 200
+
+    @app.route("/api/internal/memory", methods=["GET"])
+    @internal_only
+    def memory_report():
+        """Peak memory per route, the traced and resident totals and the kept snapshots. See `memory_tracking.py`."""
+        if not memory_tracking.ENABLED:
+            return jsonify({"message": "Memory tracking is turned off (MEMORY_TRACKING=0)"}), 404
+        return jsonify(memory_tracking.report()), 200
+
+    @app.route("/api/internal/memory/snapshots", methods=["POST"])
+    @internal_only
+    def memory_snapshot():
+        """Takes a tracemalloc snapshot, returns its id and biggest allocation sites
+            - group_by: lineno (default), filename or traceback
+            - limit: how many sites (default 20)
+        """
+        if not memory_tracking.ENABLED:
+            return jsonify({"message": "Memory tracking is turned off (MEMORY_TRACKING=0)"}), 404
+        try:
+            group_by, limit = memory_tracking.parse_options(request.args)
+        except ValueError as e:
+            return jsonify({"message": "Failed to take a snapshot", "cause": str(e)}), 400
+        return jsonify(memory_tracking.take_snapshot(group_by, limit)), 201
+
+    @app.route("/api/internal/memory/diff", methods=["GET"])
+    @internal_only
+    def memory_diff():
+        """The allocation sites that grew the most between two snapshots
+            - from: id of the earlier snapshot
+            - to: id of the later one (default: a new snapshot, right now)
+            - group_by, limit: as for taking a snapshot
+        """
+        if not memory_tracking.ENABLED:
+            return jsonify({"message": "Memory tracking is turned off (MEMORY_TRACKING=0)"}), 404
+        try:
+            group_by, limit = memory_tracking.parse_options(request.args)
+        except ValueError as e:
+            return jsonify({"message": "Failed to diff snapshots", "cause": str(e)}), 400
+        try:
+            from_id = int(request.args["from"])
+            to_id = int(request.args["to"]) if request.args.get("to") else None
+        except (KeyError, ValueError):
+            return jsonify({"message": "Failed to diff snapshots", "cause": "from (and to, if given) must be snapshot ids"}), 400
+        try:
+            return jsonify(memory_tracking.diff(from_id, to_id, group_by, limit)), 200
+        except KeyError as e:
+            return jsonify({"message": "Failed to diff snapshots", "cause": f"Snapshot {e} isn't kept (anymore)"}), 404
@@ -4,4 +4,33 @@ class UserSkillIssueException(Exception):
        super().__init__(message)
        self.error_code = error_code
    def __str__(self):
-       return f"{self.args[0]} (Error Code: {self.error_code})"
\ No newline at end of file
+       return f"{self.args[0]} (Error Code: {self.error_code})"
+
+
+class DatabasePoolExhaustedException(Exception):
+   """Custom exception for when no pooled database connection frees up in time"""
+   def __init__(self, message, error_code=None):
+       super().__init__(message)
+       self.error_code = error_code
+   def __str__(self):
+       return f"{self.args[0]} (Error Code: {self.error_code})"
+
+
+class PasswordHasherBusyException(Exception):
+   """Custom exception for when too many passwords are already waiting to be hashed"""
+   def __init__(self, message, error_code=None, retry_after=1):
+       super().__init__(message)
+       self.error_code = error_code
+       self.retry_after = retry_after
+   def __str__(self):
+       return f"{self.args[0]} (Error Code: {self.error_code})"
+
+
+class ProvisioningBusyException(Exception):
+   """Custom exception for when a 2FA QR code takes too long to render"""
+   def __init__(self, message, error_code=None, retry_after=1):
+       super().__init__(message)
+       self.error_code = error_code
+       self.retry_after = retry_after
+   def __str__(self):
+       return f"{self.args[0]} (Error Code: {self.error_code})"
@@ -1,4 +1,11 @@
 from flask import request
+from exceptions import UserSkillIssueException
+from datetime import date, timedelta
+import base64
+import json
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
 
 
 def parse_log_filters():
@@ -110,4 +117,99 @@ def apply_filters_to_query(query, conditions, params, filters):
         conditions.append("l.developer_notes LIKE ?")
         params.append(f"%{filters['notes_contains']}%")
     
-    return query, conditions, params
\ No newline at end of file
+    return query, conditions, params
+
+
+def encode_cursor(log_timestamp, log_id):
+    """Encode the sort key of the last log entry on a page into an opaque cursor.
+
+    Args:
+        log_timestamp (str | float): `log_timestamp` of the last entry that was returned
+            (or its `search_rank` when searching)
+        log_id (int): `log_id` of the last entry that was returned
+
+    Returns:
+        str: URL safe cursor to pass back as the `cursor` query parameter
+    """
+    raw = json.dumps([log_timestamp, log_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor made by `encode_cursor`.
+
+    Returns:
+        tuple: (log_timestamp, log_id)
+
+    Raises:
+        UserSkillIssueException: if the cursor was tampered with or is not a cursor at all
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        log_timestamp, log_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(log_timestamp, (str, int, float)) or not isinstance(log_id, int):
+            raise ValueError("cursor has the wrong shape")
+        return log_timestamp, log_id
+    except (ValueError, TypeError) as e:
+        raise UserSkillIssueException(f"Invalid cursor: {e}", error_code="BAD_CURSOR")
+
+
+def parse_pagination():
+    """Parse the `limit` and `cursor` query parameters for keyset pagination.
+
+    - limit: amount of entries per page (defaults to DEFAULT_PAGE_SIZE, capped at MAX_PAGE_SIZE)
+    - cursor: the `next_cursor` value of the previous page, omitted for the first page
+
+    Returns:
+        tuple: (limit, decoded cursor or None)
+    """
+    raw_limit = request.args.get('limit')
+    if raw_limit is None or raw_limit == '':
+        limit = DEFAULT_PAGE_SIZE
+    else:
+        try:
+            limit = int(raw_limit)
+        except ValueError:
+            raise UserSkillIssueException("limit must be an integer", error_code="BAD_LIMIT")
+        if limit < 1:
+            raise UserSkillIssueException("limit must be at least 1", error_code="BAD_LIMIT")
+        limit = min(limit, MAX_PAGE_SIZE)
+
+    cursor = request.args.get('cursor')
+    return limit, decode_cursor(cursor) if cursor else None
+
+
+MAX_RANGE_DAYS = 731
+
+
+def parse_date_range(default_days=30):
+    """Parse the `from` and `to` query parameters (YYYY-MM-DD, both inclusive).
+
+    - to: defaults to today
+    - from: defaults to `default_days` days up to and including `to`
+
+    Returns:
+        tuple: (start date, end date)
+
+    Raises:
+        UserSkillIssueException: if a date can't be parsed, or the range is backwards
+            or longer than MAX_RANGE_DAYS
+    """
+    def parse(name, default):
+        raw = request.args.get(name)
+        if not raw:
+            return default
+        try:
+            return date.fromisoformat(raw)
+        except ValueError:
+            raise UserSkillIssueException(f"{name} must be a date (YYYY-MM-DD)", error_code="BAD_DATE")
+
+    end = parse('to', date.today())
+    start = parse('from', end - timedelta(days=default_days - 1))
+
+    if start > end:
+        raise UserSkillIssueException("from must not be after to", error_code="BAD_RANGE")
+    if (end - start).days + 1 > MAX_RANGE_DAYS:
+        raise UserSkillIssueException(f"date range can't be longer than {MAX_RANGE_DAYS} days", error_code="BAD_RANGE")
+
+    return start, end
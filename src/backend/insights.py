@@ -0,0 +1,262 @@
+"""Developer insights for the dashboard: minutes per day, week and project, streaks
+and top projects.
+
+Everything reads the rollup tables triggers keep up to date (`insight_daily` and
+`insight_project_totals`). If they ever drift, rebuild them from the project root:
+
+    python3 src/backend/insights.py rebuild              # everyone
+    python3 src/backend/insights.py rebuild --user 3     # one user
+"""
+import argparse
+import sys
+from datetime import date, timedelta
+from db_pool import get_connection
+
+TOP_PROJECTS_LIMIT = 5
+STREAK_WINDOW_DAYS = 365
+
+
+def _days(start, end):
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+def _week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def minutes_per_day(user_id, start, end, project_id=None):
+    """Minutes and entries for every day from `start` to `end` (inclusive), oldest first.
+
+    Days without any entries are included with zeros, so the result can be charted as is.
+
+    Args:
+        user_id (int): Whose minutes to count
+        start (date): First day
+        end (date): Last day
+        project_id (int | None): Only count this project
+
+    Returns:
+        list: {"day", "minutes", "entries"} per day
+    """
+    query = """
+        SELECT day, SUM(minutes) AS minutes, SUM(entries) AS entries
+        FROM insight_daily
+        WHERE user_id = ? AND day BETWEEN ? AND ?
+    """
+    params = [user_id, start.isoformat(), end.isoformat()]
+    if project_id is not None:
+        query += " AND project_id = ?"
+        params.append(project_id)
+    query += " GROUP BY day"
+
+    with get_connection() as conn:
+        totals = {row["day"]: row for row in conn.execute(query, params)}
+
+    result = []
+    for day in _days(start, end):
+        row = totals.get(day.isoformat())
+        result.append({
+            "day": day.isoformat(),
+            "minutes": row["minutes"] if row else 0,
+            "entries": row["entries"] if row else 0,
+        })
+    return result
+
+
+def minutes_per_week(user_id, start, end, project_id=None):
+    """Like `minutes_per_day`, but summed per week (weeks start on Monday).
+
+    The first and last week only count the days that fall inside `start`..`end`.
+
+    Returns:
+        list: {"week_start", "minutes", "entries"} per week
+    """
+    weeks = {}
+    for day in minutes_per_day(user_id, start, end, project_id):
+        week = _week_start(date.fromisoformat(day["day"])).isoformat()
+        totals = weeks.setdefault(week, {"week_start": week, "minutes": 0, "entries": 0})
+        totals["minutes"] += day["minutes"]
+        totals["entries"] += day["entries"]
+    return list(weeks.values())
+
+
+def minutes_per_project(user_id, start=None, end=None, limit=None):
+    """Minutes and entries per project, most worked on first.
+
+    Without a date range this reads the all-time totals, otherwise it sums the days in
+    the range.
+
+    Args:
+        user_id (int): Whose minutes to count
+        start (date | None): First day, or None for all time
+        end (date | None): Last day, or None for all time
+        limit (int | None): Only return this many projects
+
+    Returns:
+        list: {"project_id", "project_name", "minutes", "entries"} per project
+    """
+    if start is None or end is None:
+        query = """
+            SELECT t.project_id, p.project_name, t.minutes, t.entries
+            FROM insight_project_totals t
+            JOIN projects p ON t.project_id = p.project_id
+            WHERE t.user_id = ?
+            ORDER BY t.minutes DESC, t.project_id
+        """
+        params = [user_id]
+    else:
+        query = """
+            SELECT d.project_id, p.project_name, SUM(d.minutes) AS minutes, SUM(d.entries) AS entries
+            FROM insight_daily d
+            JOIN projects p ON d.project_id = p.project_id
+            WHERE d.user_id = ? AND d.day BETWEEN ? AND ?
+            GROUP BY d.project_id
+            ORDER BY minutes DESC, d.project_id
+        """
+        params = [user_id, start.isoformat(), end.isoformat()]
+
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    with get_connection() as conn:
+        return [dict(row) for row in conn.execute(query, params)]
+
+
+def top_projects(user_id, start=None, end=None, limit=TOP_PROJECTS_LIMIT):
+    """The `limit` most worked on projects, each with its `share` (0..1) of all minutes worked"""
+    projects = minutes_per_project(user_id, start, end)
+    total = sum(project["minutes"] for project in projects)
+    for project in projects:
+        project["share"] = round(project["minutes"] / total, 4) if total else 0.0
+    return projects[:limit]
+
+
+def totals(user_id):
+    """All-time minutes, entries and amount of projects worked on"""
+    with get_connection() as conn:
+        row = conn.execute(
+            """
+            SELECT COALESCE(SUM(minutes), 0) AS minutes,
+                   COALESCE(SUM(entries), 0) AS entries,
+                   COUNT(*) AS projects
+            FROM insight_project_totals
+            WHERE user_id = ?
+            """,
+            (user_id,)
+        ).fetchone()
+    return dict(row)
+
+
+def streaks(user_id, today=None, window_days=STREAK_WINDOW_DAYS):
+    """The current and the longest run of consecutive days with at least one entry.
+
+    A streak is still current if the last worked day is today or yesterday, as today
+    isn't over yet. Only the last `window_days` days are looked at, so a streak longer
+    than that is counted from the start of the window.
+
+    Returns:
+        dict: "current" and "longest", each {"days", "start", "end"} (days is 0 and
+        start/end are None without a streak), and the "window_start" that was looked at
+    """
+    today = today or date.today()
+    window_start = today - timedelta(days=window_days - 1)
+
+    with get_connection() as conn:
+        worked = [
+            date.fromisoformat(row["day"])
+            for row in conn.execute(
+                "SELECT DISTINCT day FROM insight_daily WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day",
+                (user_id, window_start.isoformat(), today.isoformat())
+            )
+        ]
+
+    runs = []
+    for day in worked:
+        if runs and runs[-1][1] + timedelta(days=1) == day:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+
+    def streak(run):
+        if run is None:
+            return {"days": 0, "start": None, "end": None}
+        return {"days": (run[1] - run[0]).days + 1, "start": run[0].isoformat(), "end": run[1].isoformat()}
+
+    current = runs[-1] if runs and runs[-1][1] >= today - timedelta(days=1) else None
+    longest = max(runs, key=lambda run: run[1] - run[0], default=None)
+
+    return {
+        "current": streak(current),
+        "longest": streak(longest),
+        "window_start": window_start.isoformat(),
+    }
+
+
+def rebuild_rollups(conn, user_id=None):
+    """Recomputes the rollup tables from log_entries. Does not commit.
+
+    Args:
+        conn (sqlite3.Connection): Connection to rebuild on
+        user_id (int | None): Only rebuild this user's rows
+
+    Returns:
+        tuple: (insight_daily rows, insight_project_totals rows) written
+    """
+    scope = "WHERE user_id = ?" if user_id is not None else ""
+    params = (user_id,) if user_id is not None else ()
+
+    conn.execute(f"DELETE FROM insight_daily {scope}", params)
+    conn.execute(f"DELETE FROM insight_project_totals {scope}", params)
+
+    daily = conn.execute(
+        f"""
+        INSERT INTO insight_daily (user_id, day, project_id, minutes, entries)
+        SELECT user_id, COALESCE(date(start_time), date(log_timestamp)), project_id,
+               SUM(time_worked_minutes), COUNT(*)
+        FROM log_entries
+        {scope}
+        GROUP BY 1, 2, 3
+        """,
+        params
+    ).rowcount
+    project_totals = conn.execute(
+        f"""
+        INSERT INTO insight_project_totals (user_id, project_id, minutes, entries)
+        SELECT user_id, project_id, SUM(time_worked_minutes), COUNT(*)
+        FROM log_entries
+        {scope}
+        GROUP BY 1, 2
+        """,
+        params
+    ).rowcount
+
+    return daily, project_totals
+
+
+def main():
+    from db_pool import open_connection
+    from shared import DB_PATH
+
+    parser = argparse.ArgumentParser(description="Maintenance for the developer insight rollups")
+    parser.add_argument("command", choices=["rebuild"], help="rebuild: recompute the rollups from log_entries")
+    parser.add_argument("--db", default=DB_PATH, help=f"database to use (default: {DB_PATH})")
+    parser.add_argument("--user", type=int, help="only rebuild this user id")
+    args = parser.parse_args()
+
+    conn = open_connection(args.db)
+    try:
+        daily, project_totals = rebuild_rollups(conn, args.user)
+        conn.commit()
+    finally:
+        conn.close()
+
+    print(f"Rebuilt {daily} daily rows and {project_totals} project totals")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
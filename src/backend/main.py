@@ -1,13 +1,29 @@
-from shared import BLOCKLIST
+import os
+import sys
+
+# the modules both apps use (profiling, memory tracking and tracing) live in src/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+
 from flask import Flask, jsonify
 import endpoints
 from flask import Flask, jsonify, request, render_template
 from flask_jwt_extended import JWTManager
 import db_handler as dbHandler
+import memory_tracking
+import metrics
+import password_hasher
+import profiling
+import provisioning
+import responses
+import revocation
+import slow_queries
+import tracing
+from db_pool import get_pool
+from db_writer import get_writer
+from exceptions import PasswordHasherBusyException, ProvisioningBusyException
 from dotenv import load_dotenv
 from datetime import timedelta
 from flask_cors import CORS
-import os
 
 # BEFORE COMING HERE REMEMBER THIS NOTE TO SELF YOU MADE:
 #
@@ -17,14 +33,18 @@ load_dotenv()
 
 app = Flask(__name__, template_folder='../../templates',
             static_folder='../../static')
+metrics.init_app(app)
+profiling.init_app(app, "backend")
+memory_tracking.init_app(app)
+tracing.init_app(app, "backend")
 CORS(app, supports_credentials=True)
+responses.init_app(app)
 jwt = JWTManager(app)
 
 
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header, jwt_payload):
-    jti = jwt_payload["jti"]
-    return jti in BLOCKLIST
+    return revocation.is_revoked(jwt_payload["jti"])
 
 
 app.config['SECRET_KEY'] = os.getenv("SECRET_KEY")
@@ -39,6 +59,15 @@ app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=1)
 
 endpoints.register_routes(app)
 
+metrics.register_stats("db_pool", lambda: get_pool().stats())
+metrics.register_stats("db_writer", lambda: get_writer().stats())
+metrics.register_stats("project_cache", dbHandler.project_cache_stats)
+metrics.register_stats("revocation", lambda: revocation.get_store().stats())
+metrics.register_stats("password_hasher", lambda: password_hasher.get_hasher().stats())
+metrics.register_stats("provisioning_qr_cache", provisioning.stats)
+metrics.register_stats("responses", responses.stats)
+metrics.register_stats("slow_queries", slow_queries.stats)
+
 
 @app.route("/api/ping")
 def ping():
@@ -55,6 +84,14 @@ def page_not_found(e):
     return jsonify({"message": "404, requested resource not found", "cause": str(e)}), 404
 
 
+@app.errorhandler(PasswordHasherBusyException)
+@app.errorhandler(ProvisioningBusyException)
+def server_busy(e):
+    response = jsonify({"message": "The server is busy, please try again in a moment", "cause": str(e)})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, 503
+
+
 if __name__ == "__main__":
     dbHandler.prepare(app.logger)
 
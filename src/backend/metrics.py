@@ -0,0 +1,372 @@
+"""Request and SQL metrics of the backend, in the Prometheus text format.
+
+Requests are timed and counted per route and status code, and every statement run
+through a `db_pool` connection is counted and timed (not with `set_trace_callback`,
+as FTS5 would call it thousands of times per search). Responses also get a
+`Server-Timing` header. The numbers are per process, served by `/api/metrics`, and
+`METRICS_ENABLED=0` turns it all off.
+"""
+import os
+import re
+import sqlite3 as sql
+import threading
+import time
+from bisect import bisect_left
+from flask import Flask, g, request
+import slow_queries
+import tracing
+
+ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+PREFIX = "loperlog"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+_local = threading.local()
+_lock = threading.Lock()
+_routes = {}
+_statuses = {}
+_collectors = {}
+_in_flight = 0
+_sql_statements = 0
+_sql_seconds = 0.0
+_started_at = time.time()
+
+
+class Usage:
+    """How many SQL statements a request ran, and the seconds it spent in them"""
+    __slots__ = ("statements", "seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+
+
+class Histogram:
+    """Counts of observed values per bucket, plus their sum. Not thread-safe on its own."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """Yields (le, cumulative count) for every bucket, ending with +Inf"""
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield _number(bound), cumulative
+        yield "+Inf", self.count
+
+
+def current():
+    """Returns the `Usage` SQL on this thread counts towards, if any"""
+    return getattr(_local, "usage", None)
+
+
+def attach(usage):
+    """Makes SQL on this thread count towards `usage` (None to stop), returns the previous one"""
+    previous = getattr(_local, "usage", None)
+    _local.usage = usage
+    return previous
+
+
+def _spent(seconds, statements=0):
+    global _sql_seconds, _sql_statements
+    usage = getattr(_local, "usage", None)
+    if usage is not None:
+        usage.seconds += seconds
+        usage.statements += statements
+    with _lock:
+        _sql_seconds += seconds
+        _sql_statements += statements
+
+
+class TimedCursor(sql.Cursor):
+    """A cursor that counts and times its statements (executing and fetching) for the
+    current request, `slow_queries` and tracing. Fetch times are only handed on once
+    the rows run out, so iterating stays cheap.
+    """
+    _statement = None
+    _params = None
+    _statement_seconds = 0.0
+    _unrecorded = 0.0
+    _span = None
+
+    def _flush(self):
+        if self._unrecorded:
+            slow_queries.record(self.connection, self._statement, self._params,
+                                self._unrecorded, False, self._statement_seconds)
+            self._unrecorded = 0.0
+
+    def _executed(self, started, statement, params):
+        seconds = time.perf_counter() - started
+        _spent(seconds, statements=1)
+        self._flush()
+        self._statement, self._params, self._statement_seconds = statement, params, seconds
+        slow_queries.record(self.connection, statement, params, seconds, True, seconds)
+        if tracing.recording():
+            fingerprint, normalised = slow_queries.fingerprint(statement)
+            self._span = tracing.sql_span(normalised, seconds, fingerprint=fingerprint)
+        else:
+            self._span = None
+
+    def _fetched(self, started, exhausted):
+        seconds = time.perf_counter() - started
+        _spent(seconds)
+        if self._statement is None:
+            return
+        if self._span is not None:
+            self._span["duration_ms"] += seconds * 1000
+        self._statement_seconds += seconds
+        self._unrecorded += seconds
+        if exhausted:
+            self._flush()
+
+    def execute(self, statement, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(statement, parameters)
+        finally:
+            self._executed(started, statement, parameters)
+
+    def executemany(self, statement, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(statement, seq_of_parameters)
+        finally:
+            self._executed(started, statement, None)
+
+    def executescript(self, script):
+        started = time.perf_counter()
+        try:
+            return super().executescript(script)
+        finally:
+            self._executed(started, script, None)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = None
+        try:
+            row = super().fetchone()
+            return row
+        finally:
+            self._fetched(started, row is None)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        size = self.arraysize if size is None else size
+        rows = []
+        try:
+            rows = super().fetchmany(size)
+            return rows
+        finally:
+            self._fetched(started, len(rows) < size)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._fetched(started, True)
+
+    def __next__(self):
+        started = time.perf_counter()
+        exhausted = True
+        try:
+            row = super().__next__()
+            exhausted = False
+            return row
+        finally:
+            self._fetched(started, exhausted)
+
+
+class TimedConnection(sql.Connection):
+    """A connection whose cursors, including the ones `execute` makes, are `TimedCursor`s"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, statement, parameters=()):
+        return self.cursor().execute(statement, parameters)
+
+    def executemany(self, statement, parameters):
+        return self.cursor().executemany(statement, parameters)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+
+def connection_factory():
+    """The class `sqlite3.connect` should create connections with"""
+    return TimedConnection if ENABLED else sql.Connection
+
+
+def register_stats(name, fn):
+    """Exposes the numbers in the dict `fn()` returns as `loperlog_<name>_<key>` on every scrape.
+
+    Nested dicts become longer names, anything that isn't a number is left out.
+    """
+    _collectors[name] = fn
+
+
+def _before_request():
+    global _in_flight
+    g.metrics_started = time.perf_counter()
+    g.metrics_usage = Usage()
+    attach(g.metrics_usage)
+    with _lock:
+        _in_flight += 1
+
+
+def _after_request(response):
+    usage = g.get("metrics_usage")
+    if usage is None:
+        return response
+    duration = time.perf_counter() - g.metrics_started
+    route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+    key = (request.method, route)
+
+    with _lock:
+        histograms = _routes.get(key)
+        if histograms is None:
+            histograms = _routes[key] = {
+                "duration": Histogram(LATENCY_BUCKETS),
+                "sql_seconds": Histogram(LATENCY_BUCKETS),
+                "sql_statements": Histogram(STATEMENT_BUCKETS),
+            }
+        histograms["duration"].observe(duration)
+        histograms["sql_seconds"].observe(usage.seconds)
+        histograms["sql_statements"].observe(usage.statements)
+        status_key = (*key, response.status_code)
+        _statuses[status_key] = _statuses.get(status_key, 0) + 1
+
+    tracing.annotate(sql_ms=round(usage.seconds * 1000, 3), sql_statements=usage.statements)
+    response.headers.add(
+        "Server-Timing",
+        f'sql;dur={usage.seconds * 1000:.2f};desc="{usage.statements} statements", app;dur={duration * 1000:.2f}'
+    )
+    return response
+
+
+def _teardown_request(exc):
+    global _in_flight
+    if g.pop("metrics_usage", None) is None:
+        return
+    attach(None)
+    with _lock:
+        _in_flight -= 1
+
+
+def init_app(app: Flask):
+    """Starts recording the requests of `app`, unless METRICS_ENABLED=0"""
+    if not ENABLED:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, float):
+        if value != value:
+            return "NaN"
+        if abs(value) == float("inf"):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{_label(value)}"' for name, value in labels.items()) + "}"
+
+
+def _metric_name(*parts):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", "_".join(str(part) for part in parts))
+
+
+def _flatten(prefix, stats):
+    for key, value in stats.items():
+        name = _metric_name(prefix, key)
+        if isinstance(value, dict):
+            yield from _flatten(name, value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+
+
+def render():
+    """Returns every metric in the Prometheus text exposition format (version 0.0.4)"""
+    with _lock:
+        routes = {
+            key: {name: (list(h.samples()), h.sum, h.count) for name, h in histograms.items()}
+            for key, histograms in _routes.items()
+        }
+        statuses = dict(_statuses)
+        in_flight = _in_flight
+        sql_statements = _sql_statements
+        sql_seconds = _sql_seconds
+
+    lines = []
+
+    def header(name, kind, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    name = f"{PREFIX}_http_requests_total"
+    header(name, "counter", "Requests handled, per route and status code.")
+    for (method, route, status), count in sorted(statuses.items()):
+        lines.append(f"{name}{_labels(method=method, route=route, status=status)} {count}")
+
+    name = f"{PREFIX}_http_requests_in_flight"
+    header(name, "gauge", "Requests being handled right now.")
+    lines.append(f"{name} {in_flight}")
+
+    for histogram, metric, help_text in (
+        ("duration", "http_request_duration_seconds", "Time it took to handle a request."),
+        ("sql_seconds", "http_request_sql_seconds", "Time a request spent executing and fetching SQL."),
+        ("sql_statements", "http_request_sql_statements", "SQL statements a request ran."),
+    ):
+        name = f"{PREFIX}_{metric}"
+        header(name, "histogram", help_text)
+        for (method, route), histograms in sorted(routes.items()):
+            samples, total, count = histograms[histogram]
+            for le, cumulative in samples:
+                lines.append(f"{name}_bucket{_labels(method=method, route=route, le=le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(method=method, route=route)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(method=method, route=route)} {count}")
+
+    name = f"{PREFIX}_sql_statements_total"
+    header(name, "counter", "SQL statements run, in and outside of requests.")
+    lines.append(f"{name} {sql_statements}")
+
+    name = f"{PREFIX}_sql_seconds_total"
+    header(name, "counter", "Time spent executing and fetching SQL, in and outside of requests.")
+    lines.append(f"{name} {_number(sql_seconds)}")
+
+    name = f"{PREFIX}_process_start_time_seconds"
+    header(name, "gauge", "When this process started, to spot restarts.")
+    lines.append(f"{name} {_number(_started_at)}")
+
+    for collector, fn in list(_collectors.items()):
+        try:
+            stats = fn()
+        except Exception as e:
+            lines.append(f"# {collector} stats are unavailable: {_label(e)}")
+            continue
+        for name, value in _flatten(f"{PREFIX}_{collector}", stats):
+            lines.append(f"# TYPE {name} untyped")
+            lines.append(f"{name} {_number(value)}")
+
+    return "\n".join(lines) + "\n"
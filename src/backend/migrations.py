@@ -0,0 +1,549 @@
+"""Versioned schema migrations for mono.db.
+
+The database remembers the last migration it ran in `PRAGMA user_version`. To change
+the schema add a function with the next number at the bottom, never edit one that
+already shipped. They have to be idempotent, a backfill may be interrupted halfway.
+
+    python3 src/backend/migrations.py --dry-run    # list what would be applied
+    python3 src/backend/migrations.py              # apply everything that's pending
+"""
+import argparse
+import logging
+import os
+import sqlite3 as sql
+import sys
+import time
+
+DEFAULT_BATCH_SIZE = 1000
+
+_MIGRATIONS = []
+
+
+def migration(version, description):
+    """Registers the decorated function as migration number `version`"""
+    def register(fn):
+        if any(existing[0] == version for existing in _MIGRATIONS):
+            raise ValueError(f"Migration {version} is registered twice")
+        _MIGRATIONS.append((version, description, fn))
+        _MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+class MigrationContext:
+    """What a migration gets to work with.
+
+    Args:
+        conn (sqlite3.Connection): Connection in autocommit mode, inside a `BEGIN IMMEDIATE`
+        log (Logger): Where progress is reported
+        batch_size (int): Rows per transaction for `backfill`
+    """
+
+    def __init__(self, conn, log, batch_size=DEFAULT_BATCH_SIZE):
+        self.conn = conn
+        self.log = log
+        self.batch_size = batch_size
+
+    def execute(self, statement, params=()):
+        return self.conn.execute(statement, params)
+
+    def backfill(self, name, key_query, apply_statement):
+        """Copies or rewrites existing rows in small transactions, so other connections get
+        the write lock in between.
+
+        Args:
+            name (str): What is being backfilled, for the progress output
+            key_query (str): Selects the next keys in order, given (last key, batch size)
+            apply_statement (str): Processes every key between (first key, last key)
+                of a batch. Has to skip rows that were already done.
+
+        Returns:
+            int: how many rows `apply_statement` changed
+        """
+        started = time.perf_counter()
+        last_key = -1
+        changed = 0
+        batches = 0
+
+        while True:
+            keys = [row[0] for row in self.conn.execute(key_query, (last_key, self.batch_size))]
+            if not keys:
+                break
+
+            batch_started = time.perf_counter()
+            changed += self.conn.execute(apply_statement, (keys[0], keys[-1])).rowcount
+            self.conn.execute("COMMIT")
+            self.conn.execute("BEGIN IMMEDIATE")
+
+            batches += 1
+            last_key = keys[-1]
+            self.log.debug(
+                f"  {name}: batch {batches} up to key {last_key} "
+                f"in {time.perf_counter() - batch_started:.3f}s"
+            )
+
+        self.log.info(
+            f"  {name}: {changed} rows in {batches} batches, "
+            f"{time.perf_counter() - started:.3f}s"
+        )
+        return changed
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def latest_version():
+    return _MIGRATIONS[-1][0] if _MIGRATIONS else 0
+
+
+def pending_migrations(conn, target=None):
+    """Returns (version, description) for every migration that has not been applied yet"""
+    current = schema_version(conn)
+    return [
+        (version, description)
+        for version, description, _ in _MIGRATIONS
+        if version > current and (target is None or version <= target)
+    ]
+
+
+def migrate(conn, log, dry_run=False, target=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Brings the database on `conn` up to `target` (default: the latest migration).
+
+    Each migration runs in its own `BEGIN IMMEDIATE` together with the `user_version`
+    bump, so a failed one is retried on the next run and only one process applies it.
+
+    Args:
+        conn (sqlite3.Connection): Connection to migrate
+        log (Logger): Where the per-step timings are reported
+        dry_run (bool): Only report what would be applied
+        target (int | None): Stop after this version
+        batch_size (int): Rows per transaction for backfills
+
+    Returns:
+        int: the schema version the database is at afterwards
+    """
+    pending = pending_migrations(conn, target)
+    if not pending:
+        log.info(f"Database schema is up to date (version {schema_version(conn)})")
+        return schema_version(conn)
+
+    if dry_run:
+        for version, description in pending:
+            log.info(f"[dry run] would apply {version:03d}: {description}")
+        return schema_version(conn)
+
+    steps = {version: fn for version, _, fn in _MIGRATIONS}
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    total_started = time.perf_counter()
+
+    try:
+        for version, description in pending:
+            conn.execute("BEGIN IMMEDIATE")
+            if schema_version(conn) >= version:
+                conn.execute("ROLLBACK")
+                log.info(f"Migration {version:03d} was already applied by another process")
+                continue
+
+            log.info(f"Applying migration {version:03d}: {description}")
+            started = time.perf_counter()
+            try:
+                steps[version](MigrationContext(conn, log, batch_size))
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                conn.execute("COMMIT")
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                log.error(f"Migration {version:03d} failed: {e}")
+                raise
+
+            log.info(f"Migration {version:03d} done in {time.perf_counter() - started:.3f}s")
+    finally:
+        conn.isolation_level = isolation_level
+
+    log.info(
+        f"Database schema migrated to version {schema_version(conn)} "
+        f"in {time.perf_counter() - total_started:.3f}s"
+    )
+    return schema_version(conn)
+
+
+@migration(1, "users, projects and log_entries tables")
+def _base_tables(ctx):
+    ctx.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            totp_secret TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_login DATETIME
+        );
+        """
+    )
+    ctx.execute(
+        """
+        CREATE TABLE IF NOT EXISTS projects (
+            project_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_name TEXT NOT NULL,
+            repository_url TEXT,
+            created_by INTEGER NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            description TEXT,
+            FOREIGN KEY (created_by) REFERENCES users(user_id) ON DELETE CASCADE
+        );
+        """
+    )
+    ctx.execute(
+        """
+        CREATE TABLE IF NOT EXISTS log_entries (
+            log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            project_id INTEGER NOT NULL,
+            start_time DATETIME NOT NULL,
+            end_time DATETIME NOT NULL,
+            log_timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            time_worked_minutes INTEGER NOT NULL,
+            developer_notes TEXT NOT NULL,
+            related_commits TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+            FOREIGN KEY (project_id) REFERENCES projects(project_id) ON DELETE CASCADE
+        );
+        """
+    )
+    ctx.execute("CREATE INDEX IF NOT EXISTS idx_log_entries_user ON log_entries(user_id);")
+    ctx.execute("CREATE INDEX IF NOT EXISTS idx_log_entries_project ON log_entries(project_id);")
+    ctx.execute("CREATE INDEX IF NOT EXISTS idx_log_entries_timestamp ON log_entries(log_timestamp);")
+
+
+@migration(2, "composite indexes for the log listing filters")
+def _filter_indexes(ctx):
+    # Listings are always scoped to a user (and usually a project) and ordered by
+    # (log_timestamp, log_id), so those two follow the scope columns and the order is
+    # served without a sort. log_id has to be spelled out: the implicit rowid at the
+    # end would come after the filter columns. The range filters come last so they
+    # are checked from the index before a row is ever read.
+    #
+    # Run query_plan_check.py after changing any of these.
+    ctx.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_log_entries_user_project_filters
+        ON log_entries(user_id, project_id, log_timestamp, log_id, start_time, end_time, time_worked_minutes);
+        """
+    )
+    ctx.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_log_entries_user_filters
+        ON log_entries(user_id, log_timestamp, log_id, start_time, end_time, time_worked_minutes);
+        """
+    )
+    ctx.execute("CREATE INDEX IF NOT EXISTS idx_projects_created_by ON projects(created_by, created_at);")
+
+    # both are a prefix of one of the indexes above
+    ctx.execute("DROP INDEX IF EXISTS idx_log_entries_user;")
+    ctx.execute("DROP INDEX IF EXISTS idx_log_entries_user_project_timestamp;")
+
+
+@migration(3, "full text search index over log entries")
+def _search_index(ctx):
+    # a copy of each entry's notes and commits plus its project's name, stored under
+    # the entry's log_id as rowid
+    ctx.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS log_entries_fts USING fts5(
+            developer_notes, project_name, related_commits,
+            tokenize = 'unicode61'
+        );
+        """
+    )
+    ctx.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS log_entries_fts_insert
+        AFTER INSERT ON log_entries
+        BEGIN
+            INSERT INTO log_entries_fts (rowid, developer_notes, project_name, related_commits)
+            VALUES (
+                new.log_id,
+                new.developer_notes,
+                (SELECT project_name FROM projects WHERE project_id = new.project_id),
+                new.related_commits
+            );
+        END;
+        """
+    )
+    ctx.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS log_entries_fts_delete
+        AFTER DELETE ON log_entries
+        BEGIN
+            DELETE FROM log_entries_fts WHERE rowid = old.log_id;
+        END;
+        """
+    )
+    ctx.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS log_entries_fts_update
+        AFTER UPDATE OF developer_notes, related_commits, project_id ON log_entries
+        BEGIN
+            DELETE FROM log_entries_fts WHERE rowid = old.log_id;
+            INSERT INTO log_entries_fts (rowid, developer_notes, project_name, related_commits)
+            VALUES (
+                new.log_id,
+                new.developer_notes,
+                (SELECT project_name FROM projects WHERE project_id = new.project_id),
+                new.related_commits
+            );
+        END;
+        """
+    )
+    ctx.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS projects_fts_rename
+        AFTER UPDATE OF project_name ON projects
+        BEGIN
+            UPDATE log_entries_fts SET project_name = new.project_name
+            WHERE rowid IN (SELECT log_id FROM log_entries WHERE project_id = new.project_id);
+        END;
+        """
+    )
+
+    ctx.backfill(
+        "log_entries_fts",
+        "SELECT log_id FROM log_entries WHERE log_id > ? ORDER BY log_id LIMIT ?",
+        """
+        INSERT INTO log_entries_fts (rowid, developer_notes, project_name, related_commits)
+        SELECT l.log_id, l.developer_notes, p.project_name, l.related_commits
+        FROM log_entries l
+        JOIN projects p ON l.project_id = p.project_id
+        WHERE l.log_id BETWEEN ? AND ?
+        AND NOT EXISTS (SELECT 1 FROM log_entries_fts WHERE rowid = l.log_id)
+        """
+    )
+
+
+@migration(4, "rollup tables for the developer insights")
+def _insight_rollups(ctx):
+    # Minutes and entries per user, day and project, plus all-time totals per user and
+    # project, so the dashboard reads a handful of rows instead of every log entry. An
+    # entry counts towards the day it started on. Rows are removed once their last
+    # entry is, so every row in insight_daily is a day the user actually worked.
+    ctx.execute(
+        """
+        CREATE TABLE IF NOT EXISTS insight_daily (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            project_id INTEGER NOT NULL,
+            minutes INTEGER NOT NULL DEFAULT 0,
+            entries INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, project_id)
+        ) WITHOUT ROWID;
+        """
+    )
+    ctx.execute(
+        """
+        CREATE TABLE IF NOT EXISTS insight_project_totals (
+            user_id INTEGER NOT NULL,
+            project_id INTEGER NOT NULL,
+            minutes INTEGER NOT NULL DEFAULT 0,
+            entries INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, project_id)
+        ) WITHOUT ROWID;
+        """
+    )
+
+    def day_of(row):
+        return f"COALESCE(date({row}.start_time), date({row}.log_timestamp))"
+
+    def count(row):
+        return f"""
+            INSERT INTO insight_daily (user_id, day, project_id, minutes, entries)
+            VALUES ({row}.user_id, {day_of(row)}, {row}.project_id, {row}.time_worked_minutes, 1)
+            ON CONFLICT (user_id, day, project_id) DO UPDATE
+            SET minutes = minutes + excluded.minutes, entries = entries + 1;
+
+            INSERT INTO insight_project_totals (user_id, project_id, minutes, entries)
+            VALUES ({row}.user_id, {row}.project_id, {row}.time_worked_minutes, 1)
+            ON CONFLICT (user_id, project_id) DO UPDATE
+            SET minutes = minutes + excluded.minutes, entries = entries + 1;
+        """
+
+    def uncount(row):
+        daily = f"user_id = {row}.user_id AND day = {day_of(row)} AND project_id = {row}.project_id"
+        totals = f"user_id = {row}.user_id AND project_id = {row}.project_id"
+        return f"""
+            UPDATE insight_daily SET minutes = minutes - {row}.time_worked_minutes, entries = entries - 1
+            WHERE {daily};
+            DELETE FROM insight_daily WHERE {daily} AND entries <= 0;
+
+            UPDATE insight_project_totals SET minutes = minutes - {row}.time_worked_minutes, entries = entries - 1
+            WHERE {totals};
+            DELETE FROM insight_project_totals WHERE {totals} AND entries <= 0;
+        """
+
+    ctx.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS log_entries_insights_insert
+        AFTER INSERT ON log_entries
+        BEGIN
+            {count("new")}
+        END;
+        """
+    )
+    ctx.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS log_entries_insights_delete
+        AFTER DELETE ON log_entries
+        BEGIN
+            {uncount("old")}
+        END;
+        """
+    )
+    ctx.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS log_entries_insights_update
+        AFTER UPDATE OF user_id, project_id, start_time, log_timestamp, time_worked_minutes ON log_entries
+        BEGIN
+            {uncount("old")}
+            {count("new")}
+        END;
+        """
+    )
+
+    # Sums can't be backfilled in resumable batches like the search index: re-running
+    # half a backfill would count entries twice. So this rebuilds everything in the
+    # migration's own transaction, which is one pass over log_entries.
+    ctx.execute("DELETE FROM insight_daily;")
+    ctx.execute("DELETE FROM insight_project_totals;")
+    ctx.execute(
+        f"""
+        INSERT INTO insight_daily (user_id, day, project_id, minutes, entries)
+        SELECT l.user_id, {day_of("l")}, l.project_id, SUM(l.time_worked_minutes), COUNT(*)
+        FROM log_entries l
+        GROUP BY 1, 2, 3;
+        """
+    )
+    ctx.execute(
+        """
+        INSERT INTO insight_project_totals (user_id, project_id, minutes, entries)
+        SELECT user_id, project_id, SUM(time_worked_minutes), COUNT(*)
+        FROM log_entries
+        GROUP BY 1, 2;
+        """
+    )
+
+
+@migration(5, "revoked access tokens")
+def _revoked_tokens(ctx):
+    # seq only ever grows, so every process can pick up the revocations made by the
+    # others since it last looked (see revocation.py)
+    ctx.execute(
+        """
+        CREATE TABLE IF NOT EXISTS revoked_tokens (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            jti TEXT UNIQUE NOT NULL,
+            expires_at INTEGER NOT NULL,
+            revoked_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+    )
+    ctx.execute("CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires ON revoked_tokens(expires_at);")
+
+
+@migration(6, "change versions for conditional listing requests")
+def _change_versions(ctx):
+    # A counter per scope that goes up with every change to what the listings of that
+    # scope show. They're the ETags of GET /api/projects ('user': the user's projects
+    # and name) and GET /api/<project_id>/logs ('project': the project and its log
+    # entries), see db_handler.listing_etag. Triggers keep them up to date, so every
+    # process and every way of writing (bulk imports, cascading deletes) bumps them.
+    ctx.execute(
+        """
+        CREATE TABLE IF NOT EXISTS change_versions (
+            scope TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (scope, id)
+        ) WITHOUT ROWID;
+        """
+    )
+
+    def bump(scope, id_expression, condition="1"):
+        return f"""
+            INSERT INTO change_versions (scope, id, version)
+            SELECT '{scope}', {id_expression}, 1 WHERE {condition}
+            ON CONFLICT (scope, id) DO UPDATE SET version = version + 1;
+        """
+
+    triggers = {
+        "log_entries_versions_insert": ("AFTER INSERT ON log_entries", [
+            bump("project", "new.project_id"),
+        ]),
+        "log_entries_versions_delete": ("AFTER DELETE ON log_entries", [
+            bump("project", "old.project_id"),
+        ]),
+        "log_entries_versions_update": ("AFTER UPDATE ON log_entries", [
+            bump("project", "old.project_id"),
+            bump("project", "new.project_id", "new.project_id IS NOT old.project_id"),
+        ]),
+        "projects_versions_insert": ("AFTER INSERT ON projects", [
+            bump("project", "new.project_id"),
+            bump("user", "new.created_by"),
+        ]),
+        "projects_versions_delete": ("AFTER DELETE ON projects", [
+            bump("project", "old.project_id"),
+            bump("user", "old.created_by"),
+        ]),
+        "projects_versions_update": ("AFTER UPDATE ON projects", [
+            bump("project", "new.project_id"),
+            bump("user", "new.created_by"),
+            bump("user", "old.created_by", "new.created_by IS NOT old.created_by"),
+        ]),
+        "users_versions_update": ("AFTER UPDATE OF username, email ON users", [
+            bump("user", "new.user_id"),
+        ]),
+    }
+    for name, (event, statements) in triggers.items():
+        ctx.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {name}
+            {event}
+            BEGIN
+                {"".join(statements)}
+            END;
+            """
+        )
+
+
+def main():
+    # db_pool's connections are timed and traced, with modules shared with the frontend
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+    from db_pool import open_connection
+    from shared import DB_PATH
+
+    parser = argparse.ArgumentParser(description="Applies pending schema migrations to mono.db")
+    parser.add_argument("--db", default=DB_PATH, help=f"database to migrate (default: {DB_PATH})")
+    parser.add_argument("--dry-run", action="store_true", help="only list the migrations that would be applied")
+    parser.add_argument("--target", type=int, help="stop after this version")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="rows per transaction for backfills")
+    parser.add_argument("--verbose", action="store_true", help="also report every backfill batch")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(message)s")
+    log = logging.getLogger("migrations")
+
+    conn = open_connection(args.db)
+    try:
+        log.info(f"{args.db} is at schema version {schema_version(conn)}, latest is {latest_version()}")
+        migrate(conn, log, dry_run=args.dry_run, target=args.target, batch_size=args.batch_size)
+    except sql.Error:
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+from exceptions import PasswordHasherBusyException
+
+DEFAULT_ROUNDS = 12
+
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode()
+
+
+def _checkpw(password, password_hash):
+    return bcrypt.checkpw(password, password_hash)
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    return fn(*args), time.perf_counter() - started
+
+
+def hash_rounds(password_hash):
+    """Returns the cost factor a bcrypt hash was made with, or None if it can't be read"""
+    try:
+        return int(password_hash.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """Hashes and checks passwords on a pool of worker processes, so bcrypt doesn't tie
+    up the request threads. With more than `max_pending` hashes waiting (or one taking
+    longer than `timeout`) it raises PasswordHasherBusyException instead of piling up.
+
+    Args:
+        workers (int): Amount of hashing processes, 0 hashes on the calling thread instead
+        max_pending (int): Amount of hashes that can be queued or running at once
+        rounds (int): bcrypt cost factor for new hashes, every step up doubles the work
+        timeout (float): Seconds a request waits for its hash before giving up
+    """
+
+    def __init__(self, workers=2, max_pending=8, rounds=DEFAULT_ROUNDS, timeout=30.0):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self.timeout = timeout
+
+        self._executor = None
+        self._start_lock = threading.Lock()
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._rehashed = 0
+        self._duration_avg = 0.0
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._start_lock:
+                if self._executor is None:
+                    # forked from a process with threads (and open database
+                    # connections) isn't safe, so the workers come from a clean server
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("forkserver"),
+                    )
+        return self._executor
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise PasswordHasherBusyException(
+                    "Too many passwords are being hashed right now, try again shortly",
+                    error_code="PASSWORD_HASHER_BUSY",
+                    retry_after=self._retry_after(),
+                )
+            self._pending += 1
+
+        if self.workers == 0:
+            try:
+                result, duration = _timed(fn, *args)
+            finally:
+                self._release()
+            self._record(duration)
+            return result
+
+        try:
+            future = self._get_executor().submit(_timed, fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        # the slot is only free once the work is, not when the request stops waiting for it
+        future.add_done_callback(self._finished)
+
+        try:
+            result, _ = future.result(timeout=self.timeout)
+        except TimeoutError:
+            # nobody is waiting for it anymore, so don't start it if it's still queued
+            future.cancel()
+            with self._lock:
+                self._timed_out += 1
+                retry_after = self._retry_after()
+            raise PasswordHasherBusyException(
+                f"Hashing the password took longer than {self.timeout:g}s, try again shortly",
+                error_code="PASSWORD_HASHER_TIMEOUT",
+                retry_after=retry_after,
+            )
+        return result
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def _record(self, duration):
+        with self._lock:
+            self._completed += 1
+            # moving average, so the Retry-After estimate follows the current cost
+            self._duration_avg = duration if self._completed == 1 else 0.8 * self._duration_avg + 0.2 * duration
+
+    def _finished(self, future):
+        self._release()
+        if not future.cancelled() and future.exception() is None:
+            self._record(future.result()[1])
+
+    def _retry_after(self):
+        # rounds of `workers` hashes it takes to work through what's queued
+        return max(1, math.ceil(self._pending / max(self.workers, 1) * self._duration_avg))
+
+    def hash(self, password):
+        """Hashes `password` with the configured cost factor.
+
+        Raises:
+            PasswordHasherBusyException: if too many hashes are already pending, or it timed out
+        """
+        return self._run(_hashpw, password.encode(), self.rounds)
+
+    def check(self, password, password_hash):
+        """Checks `password` against the stored `password_hash`.
+
+        Raises:
+            PasswordHasherBusyException: if too many hashes are already pending, or it timed out
+        """
+        return self._run(_checkpw, password.encode(), password_hash.encode())
+
+    def needs_rehash(self, password_hash):
+        """Whether `password_hash` was made with another cost factor than the configured one"""
+        return hash_rounds(password_hash) != self.rounds
+
+    def check_and_upgrade(self, password, password_hash):
+        """Checks `password` and rehashes it if the cost factor was changed since it was stored.
+
+        The upgrade is best effort: if the hasher is busy by then it's skipped, and
+        done on a later login instead.
+
+        Returns:
+            tuple[bool, str | None]: whether the password is correct, and the new hash
+            to store (None if the stored one can stay)
+
+        Raises:
+            PasswordHasherBusyException: if too many hashes are already pending for the check
+        """
+        if not self.check(password, password_hash):
+            return False, None
+        if not self.needs_rehash(password_hash):
+            return True, None
+
+        try:
+            new_hash = self.hash(password)
+        except PasswordHasherBusyException:
+            return True, None
+        with self._lock:
+            self._rehashed += 1
+        return True, new_hash
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "rounds": self.rounds,
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "rehashed": self._rehashed,
+                "duration_seconds_avg": self._duration_avg,
+            }
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    """Returns the process wide password hasher, configured from the environment on first use"""
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                workers = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+                _hasher = PasswordHasher(
+                    workers=workers,
+                    max_pending=int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(max(workers, 1) * 4))),
+                    rounds=int(os.getenv("PASSWORD_HASH_ROUNDS", str(DEFAULT_ROUNDS))),
+                    timeout=float(os.getenv("PASSWORD_HASH_TIMEOUT", "30")),
+                )
+    return _hasher
+
+
+def hash_password(password):
+    return get_hasher().hash(password)
+
+
+def check_password(password, password_hash):
+    return get_hasher().check(password, password_hash)
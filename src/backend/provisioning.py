@@ -0,0 +1,115 @@
+"""QR codes that set up 2FA for a freshly registered user.
+
+Registering only hands out the provisioning URI and a signed URL for the QR image,
+which starts rendering on a small thread pool straight away and is served from the
+memo here. The URL stops working after `QR_TTL_SECONDS` or once 2FA is verified.
+Waiting longer than `QR_RENDER_TIMEOUT_SECONDS` for a render gets a 503.
+"""
+import hashlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import pyotp
+import qrcode
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from qrcode.image.svg import SvgPathImage
+from cache import LRUCache, MISSING
+from exceptions import ProvisioningBusyException
+
+ISSUER_NAME = "LoperLog"
+QR_TTL_SECONDS = int(os.getenv("PROVISIONING_QR_TTL", "900"))
+QR_RENDER_TIMEOUT_SECONDS = float(os.getenv("PROVISIONING_QR_TIMEOUT", "5"))
+
+FORMATS = {
+    "svg": "image/svg+xml",
+    "png": "image/png",
+}
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PROVISIONING_WORKERS", "2")),
+    thread_name_prefix="provisioning",
+)
+# (user_id, format) -> (provisioning uri, Future of the image bytes)
+_rendered = LRUCache(maxsize=1024, ttl=QR_TTL_SECONDS)
+
+
+def provisioning_uri(totp_secret, email):
+    return pyotp.TOTP(totp_secret).provisioning_uri(name=email, issuer_name=ISSUER_NAME)
+
+
+def render_qr(uri, fmt):
+    """Renders the QR code of `uri` as "svg" or "png" and returns the file's bytes"""
+    if fmt == "svg":
+        qr = qrcode.QRCode(version=1, box_size=10, border=5, image_factory=SvgPathImage)
+    else:
+        qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(uri)
+    qr.make(fit=True)
+
+    buffer = io.BytesIO()
+    if fmt == "svg":
+        qr.make_image().save(buffer)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _render(user_id, uri, fmt):
+    cached = _rendered.get((user_id, fmt))
+    if cached is not MISSING and cached[0] == uri:
+        future = cached[1]
+        # a failed render is tried again instead of being served from the memo
+        if not (future.done() and future.exception() is not None):
+            return future
+
+    future = _executor.submit(render_qr, uri, fmt)
+    _rendered.set((user_id, fmt), (uri, future))
+    return future
+
+
+def prepare(user_id, uri, fmt="svg"):
+    """Starts rendering the QR code in the background, so it's ready when it's asked for"""
+    _render(user_id, uri, fmt)
+
+
+def get_qr(user_id, uri, fmt):
+    """Returns the bytes of the QR code of `uri`, rendering it if it isn't memoised yet
+
+    Raises:
+        ProvisioningBusyException: if it isn't rendered within QR_RENDER_TIMEOUT_SECONDS
+    """
+    try:
+        return _render(user_id, uri, fmt).result(timeout=QR_RENDER_TIMEOUT_SECONDS)
+    except FutureTimeoutError:
+        raise ProvisioningBusyException("QR code is still being rendered", error_code="QR_NOT_READY")
+
+
+def forget(user_id):
+    """Drops the memoised QR codes of `user_id`, once they aren't needed anymore"""
+    for fmt in FORMATS:
+        _rendered.invalidate((user_id, fmt))
+
+
+def etag(uri, fmt):
+    return hashlib.sha256(f"{fmt}\n{uri}".encode()).hexdigest()[:32]
+
+
+def _serializer(secret_key):
+    return URLSafeTimedSerializer(secret_key, salt="totp-provisioning-qr")
+
+
+def make_token(user_id, secret_key):
+    """Signs `user_id` into the token that grants access to its QR code"""
+    return _serializer(secret_key).dumps(user_id)
+
+
+def read_token(token, secret_key):
+    """Returns the user_id signed into `token`, or None if it's forged or expired"""
+    try:
+        return _serializer(secret_key).loads(token, max_age=QR_TTL_SECONDS)
+    except BadSignature:
+        return None
+
+
+def stats():
+    return _rendered.stats()
@@ -0,0 +1,206 @@
+"""Query plan regression checks for the log listing queries.
+
+Builds every query shape `filters.py` can produce and fails if `EXPLAIN QUERY PLAN`
+shows a full table scan or a temp B-tree sort (full-text searches may sort by bm25,
+but mustn't scan). Runs as part of the tests too. From the project root:
+
+    python3 src/backend/query_plan_check.py             # against a scratch database
+    python3 src/backend/query_plan_check.py --db PATH   # against an existing database
+
+Exits with status 1 on a regression.
+"""
+import argparse
+import logging
+import os
+import sqlite3 as sql
+import sys
+
+# db_handler's connections are timed and traced, with modules shared with the frontend
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+
+import db_handler as dbHandler
+import migrations
+
+# placeholder values only have to have the right type, the planner never sees them
+FILTER_VALUES = {
+    'start_time_gt': "2025-01-01 00:00:00",
+    'start_time_gte': "2025-01-01 00:00:00",
+    'start_time_lt': "2025-12-31 00:00:00",
+    'start_time_lte': "2025-12-31 00:00:00",
+    'end_time_gt': "2025-01-01 00:00:00",
+    'end_time_gte': "2025-01-01 00:00:00",
+    'end_time_lt': "2025-12-31 00:00:00",
+    'end_time_lte': "2025-12-31 00:00:00",
+    'time_worked_min': "30",
+    'time_worked_max': "240",
+    'log_timestamp_after': "2025-01-01 00:00:00",
+    'log_timestamp_before': "2025-12-31 23:59:59",
+    'username': "someone",
+    'notes_contains': "refactor",
+}
+
+RANGE_PAIRS = [
+    ('start_time_gte', 'start_time_lte'),
+    ('end_time_gte', 'end_time_lte'),
+    ('time_worked_min', 'time_worked_max'),
+    ('log_timestamp_after', 'log_timestamp_before'),
+]
+
+CURSOR = ("2025-06-01 12:00:00", 1000)
+SEARCH_CURSOR = (-1.5, 1000)
+
+# matches come out of the FTS index unordered, ranking them always needs a sort
+RANK_SORT = "USE TEMP B-TREE FOR ORDER BY"
+
+
+def filter_combinations():
+    """Yields (name, filters) for every filter combination that is checked"""
+    yield "no filters", {}
+
+    for key in FILTER_VALUES:
+        yield key, {key: FILTER_VALUES[key]}
+
+    for low, high in RANGE_PAIRS:
+        yield f"{low} + {high}", {low: FILTER_VALUES[low], high: FILTER_VALUES[high]}
+
+    yield "every filter", dict(FILTER_VALUES)
+
+
+def listing_queries():
+    """Yields (name, query, params) for every log listing query shape"""
+    scopes = [
+        ("project logs", {"user_id": 1, "project_id": 1}),
+        ("export across projects", {"user_id": 1, "project_id": None}),
+    ]
+
+    for scope_name, scope in scopes:
+        for filters_name, filters in filter_combinations():
+            for cursor in (None, CURSOR):
+                query, params = dbHandler._build_devlogs_query(
+                    filters=dict(filters),
+                    limit=51,
+                    after=cursor,
+                    **scope
+                )
+                page = "next page" if cursor else "first page"
+                yield f"{scope_name}, {filters_name}, {page}", query, params
+
+
+def search_queries():
+    """Yields (name, query, params) for every full-text search shape"""
+    scopes = [
+        ("project search", {"user_id": 1, "project_id": 1}),
+        ("search across projects", {"user_id": 1, "project_id": None}),
+    ]
+
+    for scope_name, scope in scopes:
+        for filters_name, filters in filter_combinations():
+            for cursor in (None, SEARCH_CURSOR):
+                query, params = dbHandler._build_devlogs_query(
+                    filters=dict(filters),
+                    limit=51,
+                    after=cursor,
+                    search="refactor*",
+                    **scope
+                )
+                page = "next page" if cursor else "first page"
+                yield f"{scope_name}, {filters_name}, {page}", query, params
+
+
+def other_queries():
+    """Yields (name, query, params) for the other hot lookups in db_handler"""
+    yield "projects of a user", """
+        SELECT project_id, project_name, repository_url, created_by, created_at, description
+        FROM projects
+        WHERE created_by = ?
+        ORDER BY created_at DESC
+    """, (1,)
+    yield "project by id", "SELECT * FROM projects WHERE project_id = ?", (1,)
+    yield "logs of a deleted project", "DELETE FROM log_entries WHERE project_id = ?", (1,)
+    yield "insights minutes per day", """
+        SELECT day, SUM(minutes) AS minutes, SUM(entries) AS entries
+        FROM insight_daily
+        WHERE user_id = ? AND day BETWEEN ? AND ?
+        GROUP BY day
+    """, (1, "2025-01-01", "2025-12-31")
+    yield "insights days worked", """
+        SELECT DISTINCT day FROM insight_daily WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day
+    """, (1, "2025-01-01", "2025-12-31")
+    yield "listing change versions", """
+        SELECT scope, version FROM change_versions
+        WHERE (scope = 'user' AND id = ?) OR (scope = 'project' AND id = ?)
+    """, (1, 1)
+
+
+def plan_problems(conn, query, params, allowed=()):
+    """Returns the lines of the query plan that scan a table or sort in a temporary B-tree,
+    except for the ones in `allowed`"""
+    problems = []
+    for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params):
+        detail = row[-1]
+        if detail in allowed:
+            continue
+        if detail.startswith("SCAN") and "VIRTUAL TABLE" not in detail:
+            problems.append(detail)
+        elif "USE TEMP B-TREE" in detail:
+            problems.append(detail)
+    return problems
+
+
+def all_queries():
+    """Yields (name, query, params, allowed plan lines) for every query shape that is checked"""
+    for name, query, params in [*listing_queries(), *other_queries()]:
+        yield name, query, params, ()
+    for name, query, params in search_queries():
+        yield name, query, params, (RANK_SORT,)
+
+
+def scratch_database():
+    """Returns a connection to an empty in-memory database with the latest schema"""
+    conn = sql.connect(":memory:")
+    log = logging.getLogger("query_plan_check")
+    log.addHandler(logging.NullHandler())
+    log.propagate = False
+    migrations.migrate(conn, log)
+    return conn
+
+
+def check(conn):
+    """Checks every query shape against `conn`.
+
+    Returns:
+        list: (name, problems) for every query with a bad plan, empty when everything is fine
+    """
+    failures = []
+    for name, query, params, allowed in all_queries():
+        problems = plan_problems(conn, query, params, allowed)
+        if problems:
+            failures.append((name, problems))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help="database to check, defaults to a freshly created scratch one")
+    args = parser.parse_args()
+
+    conn = sql.connect(f"file:{args.db}?mode=ro", uri=True) if args.db else scratch_database()
+
+    failures = check(conn)
+    conn.close()
+
+    checked = sum(1 for _ in all_queries())
+    if not failures:
+        print(f"OK: {checked} query plans checked, no table scans or temporary sorts")
+        return 0
+
+    print(f"FAILED: {len(failures)} of {checked} query plans regressed")
+    for name, problems in failures:
+        print(f"  {name}")
+        for problem in problems:
+            print(f"    {problem}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
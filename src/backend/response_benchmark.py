@@ -0,0 +1,100 @@
+"""Payload size and encode time of the log listing, per shape, JSON encoder and compression.
+
+Encodes a page of made up log entries as objects and columnar, with the standard
+library and orjson, uncompressed, gzipped and (if installed) with brotli.
+
+    python3 src/backend/response_benchmark.py
+    python3 src/backend/response_benchmark.py --rows 500 --repeat 50
+"""
+import argparse
+import random
+import statistics
+import os
+import sys
+import time
+
+# db_handler's connections are timed and traced, with modules shared with the frontend
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+import db_handler as dbHandler
+import responses
+
+
+def synthetic_logs(rows, projects=5, seed=1):
+    """Returns `rows` log entries shaped like the ones `fetch_devlogs` lists"""
+    rng = random.Random(seed)
+    words = "fixed refactored the parser cache query index flaky test deploy pipeline review notes".split()
+    logs = []
+    for log_id in range(rows, 0, -1):
+        project_id = rng.randint(1, projects)
+        day = f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        logs.append({
+            "log_id": log_id,
+            "user_id": 1,
+            "username": "someone",
+            "project_id": project_id,
+            "project_name": f"Project number {project_id}",
+            "start_time": f"{day} 09:00:00",
+            "end_time": f"{day} 11:30:00",
+            "log_timestamp": f"{day} 11:31:04",
+            "time_worked_minutes": rng.randint(15, 240),
+            "repository_url": f"https://github.com/someone/project-{project_id}",
+            "developer_notes": " ".join(rng.choice(words) for _ in range(rng.randint(10, 60))),
+            "related_commits": f'["{rng.getrandbits(64):016x}"]' if rng.random() < 0.5 else None,
+        })
+    return logs
+
+
+def timed(fn, repeat):
+    """Runs `fn` `repeat` times and returns (its last result, the median milliseconds per run)"""
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        durations.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(durations)
+
+
+def benchmark(rows, repeat):
+    """Yields a result row for every shape, encoder and encoding"""
+    app = Flask(__name__)
+    encoders = {"json": DefaultJSONProvider(app)}
+    if responses.orjson is not None:
+        encoders["orjson"] = responses.OrjsonProvider(app)
+
+    logs = synthetic_logs(rows)
+    shapes = {
+        "rows": {"logs": logs, "next_cursor": None},
+        "columnar": {**dbHandler.columnar_devlogs(logs), "next_cursor": None},
+    }
+
+    for shape, payload in shapes.items():
+        for encoder_name, encoder in encoders.items():
+            body, encode_ms = timed(lambda: encoder.response(payload).get_data(), repeat)
+            yield shape, encoder_name, "identity", len(body), encode_ms, 0.0
+            for encoding in responses.available_encodings():
+                compressed, compress_ms = timed(lambda: responses.compress(body, encoding), repeat)
+                yield shape, encoder_name, encoding, len(compressed), encode_ms, compress_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500, help="log entries on the page (the listing's maximum is 500)")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per measurement, the median is reported")
+    args = parser.parse_args()
+
+    results = list(benchmark(args.rows, args.repeat))
+    baseline = next(size for shape, encoder, encoding, size, *_ in results
+                    if (shape, encoder, encoding) == ("rows", "json", "identity"))
+
+    print(f"{args.rows} log entries, median of {args.repeat} runs")
+    print(f"{'shape':<10}{'encoder':<9}{'encoding':<10}{'bytes':>10}{'size':>8}{'encode ms':>11}{'compress ms':>13}")
+    for shape, encoder, encoding, size, encode_ms, compress_ms in results:
+        print(f"{shape:<10}{encoder:<9}{encoding:<10}{size:>10}{size / baseline:>8.1%}{encode_ms:>11.2f}{compress_ms:>13.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
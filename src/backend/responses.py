@@ -0,0 +1,137 @@
+"""How API responses are encoded and compressed.
+
+JSON goes through orjson when it's installed, with the same output as Flask's (as
+long as keys are strings). Responses above `COMPRESS_MIN_BYTES` are compressed with
+brotli if it's installed, gzip otherwise. Streamed ones are left alone.
+
+Both are optional: `pip install orjson brotli` to get them.
+"""
+import gzip
+import os
+import threading
+from flask import Flask, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "image/svg+xml",
+    "text/css",
+    "text/html",
+    "text/javascript",
+    "text/plain",
+}
+
+_lock = threading.Lock()
+_compressed = {}
+_bytes_in = 0
+_bytes_out = 0
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with the encoding done by orjson"""
+
+    def _options(self, indent=False):
+        # datetimes go through Flask's `default` like they would without orjson
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # options only the standard library knows about
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent) | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def available_encodings():
+    """Content encodings this process can produce, best first"""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # no timestamp in the header, so the same body always compresses to the same bytes
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_response(response):
+    """Compresses `response` with the best encoding the client accepts, if it's worth it"""
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(available_encodings())
+    if encoding is None:
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+
+    compressed = compress(body, encoding)
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+
+    # the compressed bytes aren't the ones the (strong) ETag was made for
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+    global _bytes_in, _bytes_out
+    with _lock:
+        _compressed[encoding] = _compressed.get(encoding, 0) + 1
+        _bytes_in += len(body)
+        _bytes_out += len(compressed)
+    return response
+
+
+def init_app(app: Flask):
+    """Sets up the fast JSON encoder (if orjson is installed) and compression for `app`"""
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
+    app.after_request(compress_response)
+
+
+def stats():
+    with _lock:
+        return {
+            "json_encoder": "orjson" if orjson is not None else "json",
+            "encodings": available_encodings(),
+            "compressed": dict(_compressed),
+            "bytes_in": _bytes_in,
+            "bytes_out": _bytes_out,
+            "ratio": _bytes_out / _bytes_in if _bytes_in else None,
+        }
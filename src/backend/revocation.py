@@ -0,0 +1,213 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from cache import LRUCache, MISSING
+from db_pool import get_connection
+from db_writer import run_write
+
+
+class BloomFilter:
+    """A fixed size set that can answer "definitely not in here" without false negatives.
+
+    Args:
+        capacity (int): Amount of keys it is sized for
+        error_rate (float): Chance of a false "maybe" once `capacity` keys were added
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * step) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationStore:
+    """Revoked access tokens, shared by every backend process through the database.
+
+    A Bloom filter lets nearly every token through without a query. Every
+    `sync_interval` seconds it picks up what other processes revoked, and expired
+    rows get purged every `purge_interval` seconds.
+
+    Args:
+        sync_interval (float): Seconds between checks for revocations by other processes
+        purge_interval (float): Seconds between purges of expired revocations
+        capacity (int): Revocations the Bloom filter is sized for before it gets rebuilt bigger
+    """
+
+    def __init__(self, sync_interval=1.0, purge_interval=600.0, capacity=10000):
+        self.sync_interval = sync_interval
+        self.purge_interval = purge_interval
+        self.capacity = capacity
+
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._bloom = None
+        self._rebuild = True
+        self._last_seq = 0
+        self._synced_at = 0.0
+        self._purged_at = time.monotonic()
+        self._confirmed = LRUCache(maxsize=4096)
+
+        self._checks = 0
+        self._filtered = 0
+        self._lookups = 0
+        self._false_positives = 0
+        self._purged = 0
+
+    def revoke(self, jti, expires_at):
+        """Revokes the token `jti` until it expires at `expires_at` (a unix timestamp)"""
+        run_write(lambda conn: conn.execute(
+            "INSERT OR IGNORE INTO revoked_tokens (jti, expires_at) VALUES (?, ?)",
+            (jti, int(expires_at))
+        ))
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+        self._confirmed.set(jti, True)
+
+    def is_revoked(self, jti):
+        self._sync()
+
+        # checked first so this process' own revocations count even while a
+        # rebuilt filter doesn't have them yet
+        if self._confirmed.get(jti) is not MISSING:
+            return True
+
+        with self._lock:
+            self._checks += 1
+            if jti not in self._bloom:
+                self._filtered += 1
+                return False
+
+        with get_connection() as conn:
+            revoked = conn.execute(
+                "SELECT 1 FROM revoked_tokens WHERE jti = ?", (jti,)).fetchone() is not None
+
+        with self._lock:
+            self._lookups += 1
+            if not revoked:
+                self._false_positives += 1
+        if revoked:
+            self._confirmed.set(jti, True)
+        return revoked
+
+    def purge_expired(self):
+        """Deletes the revocations of tokens that have expired and rebuilds the filter.
+
+        Returns:
+            int: amount of revocations deleted
+        """
+        now = int(time.time())
+        purged = run_write(lambda conn: conn.execute(
+            "DELETE FROM revoked_tokens WHERE expires_at <= ?", (now,)
+        ).rowcount)
+        with self._lock:
+            self._purged += purged
+            # the old filter stays in use until the next sync replaces it: extra
+            # entries in it only cost a lookup
+            self._rebuild = True
+            self._synced_at = 0.0
+        self._confirmed.clear()
+        return purged
+
+    def _sync(self):
+        if not self._rebuild and time.monotonic() - self._synced_at < self.sync_interval:
+            return
+
+        with self._sync_lock:
+            if not self._rebuild and time.monotonic() - self._synced_at < self.sync_interval:
+                return
+
+            if time.monotonic() - self._purged_at >= self.purge_interval:
+                self._purged_at = time.monotonic()
+                self.purge_expired()
+
+            with get_connection() as conn:
+                if not self._rebuild:
+                    rows = conn.execute(
+                        "SELECT seq, jti FROM revoked_tokens WHERE seq > ? ORDER BY seq",
+                        (self._last_seq,)
+                    ).fetchall()
+                    with self._lock:
+                        for row in rows:
+                            self._bloom.add(row["jti"])
+                            self._last_seq = row["seq"]
+                        if self._bloom.count > self._bloom.capacity:
+                            self._rebuild = True
+
+                if self._rebuild:
+                    self._load(conn)
+
+            self._synced_at = time.monotonic()
+
+    def _load(self, conn):
+        # read before the rows: anything committed in between is picked up by the next sync
+        last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM revoked_tokens").fetchone()[0]
+        rows = conn.execute(
+            "SELECT jti FROM revoked_tokens WHERE expires_at > ?",
+            (int(time.time()),)
+        ).fetchall()
+
+        bloom = BloomFilter(max(self.capacity, 2 * len(rows)))
+        for row in rows:
+            bloom.add(row["jti"])
+
+        with self._lock:
+            self._bloom = bloom
+            self._rebuild = False
+            self._last_seq = last_seq
+
+    def stats(self):
+        with self._lock:
+            return {
+                "checks": self._checks,
+                "filtered": self._filtered,
+                "lookups": self._lookups,
+                "false_positives": self._false_positives,
+                "purged": self._purged,
+                "filter_size": self._bloom.count if self._bloom is not None else 0,
+                "confirmed_cache": self._confirmed.stats(),
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Returns the process wide revocation store, configured from the environment on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = RevocationStore(
+                    sync_interval=float(os.getenv("REVOCATION_SYNC_SECONDS", "1")),
+                    purge_interval=float(os.getenv("REVOCATION_PURGE_SECONDS", "600")),
+                )
+    return _store
+
+
+def revoke_token(jwt_payload):
+    """Revokes the token with the decoded `jwt_payload` until it would have expired anyway"""
+    get_store().revoke(jwt_payload["jti"], jwt_payload["exp"])
+
+
+def is_revoked(jti):
+    return get_store().is_revoked(jti)
@@ -1,9 +1,7 @@
 import os
 
-# Token blocklist for logout functionality
-BLOCKLIST = set()
-
 # Database path - use absolute path relative to project root
 PROJECT_ROOT = os.path.dirname(os.path.dirname(
     os.path.dirname(os.path.abspath(__file__))))
-DB_PATH = os.path.join(PROJECT_ROOT, "databaseFiles", "mono.db")
+# LOPERLOG_DB_PATH points everything at another database, e.g. a generated one to benchmark against
+DB_PATH = os.getenv("LOPERLOG_DB_PATH") or os.path.join(PROJECT_ROOT, "databaseFiles", "mono.db")
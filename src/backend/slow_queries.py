@@ -0,0 +1,183 @@
+"""Per-statement SQL statistics and a log of the slow ones.
+
+Statements are reduced to a fingerprint (literals and placeholder lists replaced) and
+their count, total and max time kept, for at most `MAX_FINGERPRINTS` of them. One that
+takes longer than `SLOW_QUERY_MS` is logged with its `EXPLAIN QUERY PLAN`.
+
+Served by `/api/internal/slow-queries`, and written to `SLOW_QUERY_DUMP_PATH` (if set,
+`{pid}` becomes the process id) on exit.
+"""
+import atexit
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3 as sql
+import threading
+import time
+from collections import OrderedDict
+
+THRESHOLD_SECONDS = float(os.getenv("SLOW_QUERY_MS", "100")) / 1000
+MAX_FINGERPRINTS = int(os.getenv("SLOW_QUERY_MAX_FINGERPRINTS", "500"))
+DUMP_PATH = os.getenv("SLOW_QUERY_DUMP_PATH")
+
+# statement -> fingerprint, so that the regexes only run once per distinct statement
+FINGERPRINT_CACHE_SIZE = 2048
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_PLACEHOLDER_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_ROW_LISTS = re.compile(r"\(\?, \.\.\.\)(?:\s*,\s*\(\?, \.\.\.\))+")
+_SPACE = re.compile(r"\s+")
+
+log = logging.getLogger("slow_queries")
+
+_lock = threading.Lock()
+_fingerprints = {}
+_table = OrderedDict()
+_evictions = 0
+_slow = 0
+
+
+def normalise(statement):
+    """Returns `statement` with everything that varies between runs of the same query taken out"""
+    statement = _COMMENTS.sub(" ", statement)
+    statement = _STRINGS.sub("?", statement)
+    statement = _NUMBERS.sub("?", statement)
+    statement = _PLACEHOLDER_LISTS.sub("(?, ...)", statement)
+    statement = _ROW_LISTS.sub("(?, ...), ...", statement)
+    return _SPACE.sub(" ", statement).strip()
+
+
+def fingerprint(statement):
+    """Returns (fingerprint id, normalised statement) of `statement`"""
+    cached = _fingerprints.get(statement)
+    if cached is not None:
+        return cached
+    normalised = normalise(statement)
+    cached = (hashlib.sha1(normalised.encode()).hexdigest()[:16], normalised)
+    if len(_fingerprints) >= FINGERPRINT_CACHE_SIZE:
+        _fingerprints.clear()
+    _fingerprints[statement] = cached
+    return cached
+
+
+def explain(conn, statement, params):
+    """Returns the lines of the `EXPLAIN QUERY PLAN` of `statement`, indented like the sqlite3 shell does"""
+    try:
+        # a plain cursor, so the EXPLAIN itself isn't timed and recorded
+        rows = sql.Connection.execute(conn, f"EXPLAIN QUERY PLAN {statement}", params).fetchall()
+    except (sql.Error, ValueError) as e:
+        return [f"unavailable: {e}"]
+
+    depth = {0: 0}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, 0) + 1
+        lines.append("  " * (depth[node_id] - 1) + detail)
+    return lines
+
+
+def record(conn, statement, params, seconds, executed, statement_seconds):
+    """Adds the time a statement took to its fingerprint.
+
+    Called when a statement has been executed, and again when its rows have all
+    been fetched.
+
+    Args:
+        conn (sqlite3.Connection): Connection it ran on, for the query plan
+        statement (str): The statement as it was executed
+        params: Its parameters, or None if there's no single set of them (executemany)
+        seconds (float): Time to add
+        executed (bool): Whether this is the execution rather than the fetching
+        statement_seconds (float): Time the statement took so far, all in all
+    """
+    global _evictions, _slow
+    fingerprint_id, normalised = fingerprint(statement)
+    crossed = statement_seconds >= THRESHOLD_SECONDS and statement_seconds - seconds < THRESHOLD_SECONDS
+
+    with _lock:
+        entry = _table.get(fingerprint_id)
+        if entry is None:
+            entry = _table[fingerprint_id] = {
+                "fingerprint": fingerprint_id,
+                "statement": normalised,
+                "count": 0,
+                "total_seconds": 0.0,
+                "max_seconds": 0.0,
+                "slow_count": 0,
+                "last_slow_at": None,
+                "plan": None,
+            }
+            while len(_table) > MAX_FINGERPRINTS:
+                _table.popitem(last=False)
+                _evictions += 1
+        else:
+            _table.move_to_end(fingerprint_id)
+
+        if executed:
+            entry["count"] += 1
+        entry["total_seconds"] += seconds
+        entry["max_seconds"] = max(entry["max_seconds"], statement_seconds)
+        if crossed:
+            entry["slow_count"] += 1
+            entry["last_slow_at"] = time.time()
+            _slow += 1
+
+    if not crossed:
+        return
+
+    plan = explain(conn, statement, params) if params is not None else ["unavailable: executed with many sets of parameters"]
+    with _lock:
+        entry["plan"] = plan
+    plan_text = "\n    ".join(plan)
+    log.warning(f"Slow query {fingerprint_id} took {statement_seconds * 1000:.1f}ms: {normalised}\n    {plan_text}")
+
+
+def snapshot(sort="total_seconds", limit=None):
+    """Returns the fingerprints, the ones with the most of `sort` first
+
+    Args:
+        sort (str): total_seconds, max_seconds, avg_seconds, count or slow_count
+        limit (int | None): Return at most this many
+
+    Returns:
+        list: a dict per fingerprint, with `avg_seconds` added
+    """
+    with _lock:
+        entries = [dict(entry) for entry in _table.values()]
+    for entry in entries:
+        entry["avg_seconds"] = entry["total_seconds"] / entry["count"] if entry["count"] else 0.0
+    entries.sort(key=lambda entry: entry[sort], reverse=True)
+    return entries[:limit] if limit is not None else entries
+
+
+def reset():
+    global _evictions, _slow
+    with _lock:
+        _table.clear()
+        _evictions = 0
+        _slow = 0
+
+
+def stats():
+    with _lock:
+        return {
+            "fingerprints": len(_table),
+            "max_fingerprints": MAX_FINGERPRINTS,
+            "evictions": _evictions,
+            "slow": _slow,
+            "threshold_seconds": THRESHOLD_SECONDS,
+        }
+
+
+def dump(path):
+    """Writes the settings and every fingerprint to `path` as JSON"""
+    with open(path, "w") as f:
+        json.dump({"stats": stats(), "generated_at": time.time(), "queries": snapshot()}, f, indent=2)
+
+
+if DUMP_PATH:
+    atexit.register(lambda: dump(DUMP_PATH.replace("{pid}", str(os.getpid()))))
@@ -0,0 +1,95 @@
+"""The LRU cache both apps keep things in memory with."""
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by `LRUCache.get` when nothing usable is cached, so that `None` can be
+# cached as a value of its own (e.g. "this project doesn't exist").
+MISSING = object()
+
+
+class LRUCache:
+    """A small thread-safe LRU cache with an optional time to live.
+
+    Args:
+        maxsize (int): Maximum amount of entries kept (or their total `sizeof`), least
+            recently used are evicted first
+        ttl (float | None): Seconds an entry stays valid for, or None to keep it until evicted
+        sizeof (callable | None): Size of a value, e.g. in bytes. Every entry counts as 1 without it
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, sizeof=None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self._entries = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total -= entry[2]
+        return entry
+
+    def get(self, key):
+        """Returns the cached value for `key`, or `MISSING`"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return MISSING
+
+            value, expires_at, _ = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._pop(key)
+                self._misses += 1
+                return MISSING
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        size = self.sizeof(value) if self.sizeof else 1
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (value, expires_at, size)
+            self._total += size
+            while self._total > self.maxsize:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._total -= evicted
+                self._evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._pop(key) is not None:
+                self._invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total = 0
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+            }
+            if self.sizeof:
+                stats["total_size"] = self._total
+            return stats
@@ -0,0 +1,219 @@
+"""Per-request peak memory and tracemalloc snapshots, to track down memory growth.
+
+Off unless `MEMORY_TRACKING=1`, as tracemalloc slows down every allocation. When on,
+every request records its peak per route (and sends it in `X-Memory-Peak`), and
+snapshots can be taken and diffed to see which allocation sites grew. Requests that
+overlapped are counted as `overlapped`, since the peak is process wide.
+"""
+import itertools
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from flask import Flask, g, request
+
+ENABLED = os.getenv("MEMORY_TRACKING", "0") == "1"
+TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "5"))
+SNAPSHOTS_KEEP = int(os.getenv("MEMORY_SNAPSHOTS_KEEP", "5"))
+
+GROUPINGS = ("lineno", "filename", "traceback")
+
+_lock = threading.Lock()
+_routes = {}
+_snapshots = OrderedDict()
+_snapshot_ids = itertools.count(1)
+_in_flight = 0
+_started = 0
+
+
+def _before_request():
+    global _in_flight, _started
+    with _lock:
+        _in_flight += 1
+        _started += 1
+        alone = _in_flight == 1
+        if alone:
+            tracemalloc.reset_peak()
+        g.memory_started = (tracemalloc.get_traced_memory()[0], _started, alone)
+
+
+def _after_request(response):
+    started = g.get("memory_started")
+    if started is None:
+        return response
+    current_at_start, started_count, alone = started
+    peak = max(tracemalloc.get_traced_memory()[1] - current_at_start, 0)
+    route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+
+    with _lock:
+        # anyone else started in the meantime, or was already running, shares the peak
+        overlapped = not alone or _started != started_count
+        stats = _routes.setdefault((request.method, route), {
+            "count": 0, "overlapped": 0, "peak_bytes_total": 0, "peak_bytes_max": 0, "peak_bytes_last": 0,
+        })
+        if overlapped:
+            stats["overlapped"] += 1
+        else:
+            stats["count"] += 1
+            stats["peak_bytes_total"] += peak
+            stats["peak_bytes_max"] = max(stats["peak_bytes_max"], peak)
+            stats["peak_bytes_last"] = peak
+
+    response.headers["X-Memory-Peak"] = f"{peak}{'; overlapped' if overlapped else ''}"
+    return response
+
+
+def _teardown_request(exc):
+    global _in_flight
+    if g.pop("memory_started", None) is None:
+        return
+    with _lock:
+        _in_flight -= 1
+
+
+def init_app(app: Flask):
+    """Starts tracemalloc and records the peak memory of every request of `app`, if MEMORY_TRACKING=1"""
+    if not ENABLED:
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACE_FRAMES)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+
+def _peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def report():
+    """Returns the per-route peaks and the memory totals of this process"""
+    current, peak = tracemalloc.get_traced_memory()
+    with _lock:
+        routes = [
+            {
+                "method": method,
+                "route": route,
+                **stats,
+                "peak_bytes_avg": stats["peak_bytes_total"] // stats["count"] if stats["count"] else 0,
+            }
+            for (method, route), stats in _routes.items()
+        ]
+        snapshots = [{"id": snapshot_id, "taken_at": taken_at} for snapshot_id, (_, taken_at) in _snapshots.items()]
+    routes.sort(key=lambda stats: stats["peak_bytes_max"], reverse=True)
+    return {
+        "tracing": tracemalloc.is_tracing(),
+        "traced_bytes": current,
+        "traced_peak_bytes": peak,
+        "tracemalloc_overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+        "peak_rss_bytes": _peak_rss_bytes(),
+        "routes": routes,
+        "snapshots": snapshots,
+    }
+
+
+def parse_options(args):
+    """Reads `group_by` (lineno, filename or traceback) and `limit` from query parameters
+
+    Raises:
+        ValueError: if either is invalid
+    """
+    group_by = args.get("group_by", "lineno")
+    if group_by not in GROUPINGS:
+        raise ValueError(f"group_by must be one of {', '.join(GROUPINGS)}")
+    try:
+        limit = int(args.get("limit", 20))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    return group_by, limit
+
+
+def _take():
+    snapshot = tracemalloc.take_snapshot()
+    # what tracemalloc and the import machinery allocate isn't interesting
+    return snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+
+
+def _site(statistic, group_by):
+    frames = statistic.traceback
+    site = {"file": frames[0].filename, "line": frames[0].lineno}
+    if group_by == "traceback":
+        site["traceback"] = [f"{frame.filename}:{frame.lineno}" for frame in frames]
+    return site
+
+
+def take_snapshot(group_by="lineno", limit=20):
+    """Takes a snapshot and keeps it for diffing later.
+
+    Returns:
+        dict: its id and its `limit` biggest allocation sites
+
+    Raises:
+        RuntimeError: if tracemalloc isn't tracing
+    """
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc isn't tracing, set MEMORY_TRACKING=1")
+    snapshot = _take()
+    with _lock:
+        snapshot_id = next(_snapshot_ids)
+        _snapshots[snapshot_id] = (snapshot, time.time())
+        while len(_snapshots) > SNAPSHOTS_KEEP:
+            _snapshots.popitem(last=False)
+
+    statistics = snapshot.statistics(group_by)
+    return {
+        "id": snapshot_id,
+        "total_bytes": sum(statistic.size for statistic in statistics),
+        "top": [
+            {**_site(statistic, group_by), "size_bytes": statistic.size, "count": statistic.count}
+            for statistic in statistics[:limit]
+        ],
+    }
+
+
+def diff(from_id, to_id=None, group_by="lineno", limit=20):
+    """Compares two kept snapshots, or one against right now if `to_id` is None.
+
+    Returns:
+        dict: the `limit` allocation sites that grew (or shrank) the most
+
+    Raises:
+        KeyError: if a snapshot isn't kept (anymore)
+        RuntimeError: if tracemalloc isn't tracing
+    """
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc isn't tracing, set MEMORY_TRACKING=1")
+    with _lock:
+        before = _snapshots[from_id][0]
+        after = _snapshots[to_id][0] if to_id is not None else None
+    if after is None:
+        after = _take()
+
+    differences = after.compare_to(before, group_by)
+    return {
+        "from": from_id,
+        "to": to_id if to_id is not None else "now",
+        "size_diff_bytes": sum(difference.size_diff for difference in differences),
+        "top": [
+            {
+                **_site(difference, group_by),
+                "size_diff_bytes": difference.size_diff,
+                "count_diff": difference.count_diff,
+                "size_bytes": difference.size,
+                "count": difference.count,
+            }
+            for difference in differences[:limit]
+        ],
+    }
@@ -0,0 +1,230 @@
+"""Opt-in profiling of single requests.
+
+Off unless `PROFILING_ENABLED=1`, then only for requests with a signed `X-Profile`
+header and a random `PROFILING_SAMPLE_RATE` of the rest. `PROFILER` is cprofile
+(`.pstats`) or sampling (`.speedscope.json`, much cheaper). Only one cProfile can run
+at a time, so a request that overlaps another one gets sampled instead. The newest
+`PROFILING_KEEP` files are kept in `PROFILING_DIR`, named in `X-Profile-File`.
+
+Make a header (signed with `PROFILING_SECRET`) with
+
+    python3 src/common/profiling.py --ttl 600
+"""
+import argparse
+import cProfile
+import hashlib
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+
+ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILER = os.getenv("PROFILER", "cprofile")
+DIRECTORY = os.getenv("PROFILING_DIR") or os.path.join(tempfile.gettempdir(), "loperlog-profiles")
+KEEP = int(os.getenv("PROFILING_KEEP", "50"))
+SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+INTERVAL_SECONDS = float(os.getenv("PROFILING_INTERVAL_MS", "5")) / 1000
+SECRET = os.getenv("PROFILING_SECRET", "")
+
+SUFFIXES = (".pstats", ".speedscope.json")
+
+_prune_lock = threading.Lock()
+# held by the request that's being cProfiled, there can't be two at once
+_cprofile_lock = threading.Lock()
+
+
+def sign(expires_at, secret=SECRET):
+    return hmac.new(secret.encode(), str(expires_at).encode(), hashlib.sha256).hexdigest()
+
+
+def make_token(ttl=600, secret=SECRET):
+    """Returns an `X-Profile` header value that is valid for `ttl` seconds"""
+    expires_at = int(time.time()) + ttl
+    return f"{expires_at}.{sign(expires_at, secret)}"
+
+
+def token_is_valid(token, secret=SECRET):
+    if not secret or not token:
+        return False
+    expires_at, _, signature = token.partition(".")
+    if not expires_at.isdigit() or int(expires_at) < time.time():
+        return False
+    return hmac.compare_digest(signature, sign(expires_at, secret))
+
+
+class StackSampler:
+    """Records the stack of one thread every `interval` seconds, from a thread of its own"""
+
+    def __init__(self, thread_id, interval=INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.frames = {}
+        self.samples = []
+        self.weights = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+
+    def _frame_index(self, code):
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        index = self.frames.get(key)
+        if index is None:
+            index = self.frames[key] = len(self.frames)
+        return index
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_index(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append(stack)
+            self.weights.append((now - last) * 1000)
+            last = now
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def speedscope(self, name):
+        """Returns the samples in speedscope's file format"""
+        frames = sorted(self.frames.items(), key=lambda item: item[1])
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": [{"name": fn, "file": file, "line": line} for (fn, file, line), _ in frames]},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(self.weights),
+                "samples": self.samples,
+                "weights": self.weights,
+            }],
+            "exporter": "loperlog profiling",
+        }
+
+
+def _prune(directory, keep):
+    """Deletes all but the newest `keep` profiles in `directory`"""
+    with _prune_lock:
+        profiles = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name.endswith(SUFFIXES):
+                profiles.append((entry.stat().st_mtime, entry.path))
+        profiles.sort(reverse=True)
+        for _, path in profiles[keep:]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _consume(iterable):
+    """Reads a WSGI body into a list, so generating it counts towards the profile too"""
+    try:
+        return list(iterable)
+    finally:
+        if hasattr(iterable, "close"):
+            iterable.close()
+
+
+class ProfilingMiddleware:
+    """WSGI middleware that profiles the requests that are signed or sampled.
+
+    Args:
+        wsgi_app: The app to wrap
+        app_name (str): Goes into the file names, to tell the frontend's and backend's apart
+    """
+
+    def __init__(self, wsgi_app, app_name, profiler=PROFILER, directory=DIRECTORY, keep=KEEP,
+                 sample_rate=SAMPLE_RATE, secret=SECRET):
+        if profiler not in ("cprofile", "sampling"):
+            raise ValueError(f"PROFILER must be cprofile or sampling, got '{profiler}'")
+        self.wsgi_app = wsgi_app
+        self.app_name = app_name
+        self.profiler = profiler
+        self.directory = directory
+        self.keep = keep
+        self.sample_rate = sample_rate
+        self.secret = secret
+        os.makedirs(directory, exist_ok=True)
+
+    def _wanted(self, environ):
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        return token_is_valid(environ.get("HTTP_X_PROFILE"), self.secret)
+
+    def _path(self, environ, suffix):
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", environ.get("PATH_INFO", "")).strip("-") or "root"
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        name = f"{stamp}-{time.time_ns() % 10**9:09d}-{self.app_name}-{environ.get('REQUEST_METHOD', 'GET')}-{slug[:80]}-{os.getpid()}{suffix}"
+        return os.path.join(self.directory, name)
+
+    def __call__(self, environ, start_response):
+        if not self._wanted(environ):
+            return self.wsgi_app(environ, start_response)
+
+        use_cprofile = self.profiler == "cprofile" and _cprofile_lock.acquire(blocking=False)
+        suffix = ".pstats" if use_cprofile else ".speedscope.json"
+        path = self._path(environ, suffix)
+
+        def start_response_with_file(status, headers, exc_info=None):
+            return start_response(status, headers + [("X-Profile-File", os.path.basename(path))], exc_info)
+
+        if use_cprofile:
+            try:
+                profile = cProfile.Profile()
+                profile.enable()
+                try:
+                    body = _consume(self.wsgi_app(environ, start_response_with_file))
+                finally:
+                    profile.disable()
+                    profile.dump_stats(path)
+            finally:
+                _cprofile_lock.release()
+        else:
+            sampler = StackSampler(threading.get_ident())
+            sampler.start()
+            try:
+                body = _consume(self.wsgi_app(environ, start_response_with_file))
+            finally:
+                sampler.stop()
+                with open(path, "w") as f:
+                    json.dump(sampler.speedscope(f"{environ.get('REQUEST_METHOD')} {environ.get('PATH_INFO')}"), f)
+
+        _prune(self.directory, self.keep)
+        return body
+
+
+def init_app(app, app_name):
+    """Wraps `app` in the profiling middleware, if PROFILING_ENABLED=1"""
+    if ENABLED:
+        app.wsgi_app = ProfilingMiddleware(app.wsgi_app, app_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prints an X-Profile header value, signed with PROFILING_SECRET")
+    parser.add_argument("--ttl", type=int, default=600, help="seconds it stays valid")
+    args = parser.parse_args()
+    if not SECRET:
+        parser.error("PROFILING_SECRET isn't set")
+    print(make_token(args.ttl))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
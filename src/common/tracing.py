@@ -0,0 +1,319 @@
+"""Request tracing across the frontend and the backend, written to a local JSONL file.
+
+The frontend starts a trace and passes it on in a `traceparent` header, and both
+apps record spans (server, client and sql) to `TRACING_FILE`. Responses name their
+trace in `X-Trace-Id`. To look at one:
+
+    python3 src/common/tracing.py list                 # the latest traces
+    python3 src/common/tracing.py waterfall <trace id>
+
+Off unless `TRACING_ENABLED=1`, and `TRACING_SAMPLE_RATE` of new traces get recorded.
+"""
+import argparse
+import contextvars
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+ENABLED = os.getenv("TRACING_ENABLED", "0") == "1"
+SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", "1"))
+FILE = os.getenv("TRACING_FILE") or os.path.join(tempfile.gettempdir(), "loperlog-traces.jsonl")
+MAX_SPANS = int(os.getenv("TRACING_MAX_SPANS", "1000"))
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_trace = contextvars.ContextVar("trace", default=None)
+_parent = contextvars.ContextVar("trace_parent", default=None)
+
+_file_lock = threading.Lock()
+_fd = None
+
+
+class Trace:
+    """The spans one request of this process recorded, until they are written"""
+    __slots__ = ("trace_id", "sampled", "service", "spans", "dropped", "root")
+
+    def __init__(self, trace_id, sampled, service):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.service = service
+        self.spans = []
+        self.dropped = 0
+        self.root = None
+
+    def add(self, span):
+        if len(self.spans) < MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+
+def _new_id(size):
+    return os.urandom(size).hex()
+
+
+def _span(trace, name, kind, parent_id, start, **attributes):
+    span = {
+        "trace_id": trace.trace_id,
+        "span_id": _new_id(8),
+        "parent_id": parent_id,
+        "service": trace.service,
+        "kind": kind,
+        "name": name,
+        "start": start,
+        "duration_ms": 0.0,
+        "attributes": attributes,
+    }
+    trace.add(span)
+    return span
+
+
+def parse_traceparent(header):
+    """Returns (trace id, parent span id, sampled) from a `traceparent` header, or None"""
+    match = _TRACEPARENT.match((header or "").strip().lower())
+    if match is None or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+
+def start_request(service, name, traceparent=None, **attributes):
+    """Starts the server span of a request, continuing the trace in `traceparent` if there is one.
+
+    Returns:
+        tuple: (span or None if it isn't recorded, token for `finish_request`)
+    """
+    parent = parse_traceparent(traceparent)
+    if parent is not None:
+        trace_id, parent_id, sampled = parent
+    else:
+        trace_id, parent_id, sampled = _new_id(16), None, random.random() < SAMPLE_RATE
+
+    trace = Trace(trace_id, sampled, service)
+    span = trace.root = _span(trace, name, "server", parent_id, time.time(), **attributes) if sampled else None
+    token = (_trace.set(trace), _parent.set(span["span_id"] if span else parent_id), time.perf_counter())
+    return span, token
+
+
+def finish_request(span, token, **attributes):
+    """Ends the server span started by `start_request` and writes out the request's spans"""
+    trace_token, parent_token, started = token
+    trace = _trace.get()
+    _parent.reset(parent_token)
+    _trace.reset(trace_token)
+    if span is None:
+        return
+    span["duration_ms"] = (time.perf_counter() - started) * 1000
+    span["attributes"].update(attributes)
+    if trace.dropped:
+        span["attributes"]["dropped_spans"] = trace.dropped
+    export(trace.spans)
+
+
+def annotate(**attributes):
+    """Adds `attributes` to the server span of the current request, if it's recorded"""
+    trace = _trace.get()
+    if trace is not None and trace.root is not None:
+        trace.root["attributes"].update(attributes)
+
+
+def current_trace_id():
+    trace = _trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+class ClientSpan:
+    """Times a call to another service as a client span, see `client_span`"""
+    __slots__ = ("span", "headers", "_started", "_token")
+
+    def __init__(self, span, headers):
+        self.span = span
+        self.headers = headers
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        if self.span is not None:
+            self._token = _parent.set(self.span["span_id"])
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.span is not None:
+            self.span["duration_ms"] = (time.perf_counter() - self._started) * 1000
+            if exc is not None:
+                self.span["attributes"]["error"] = repr(exc)
+            _parent.reset(self._token)
+        return False
+
+
+_NOT_TRACED = ClientSpan(None, {})
+
+
+def client_span(name, **attributes):
+    """Returns a context manager that records a call to another service.
+
+    Its `headers` are the ones to send along so the other side joins the trace
+    (empty if nothing is being traced), and its `span` (if recorded) takes more
+    attributes, e.g. the status code.
+    """
+    trace = _trace.get()
+    if trace is None:
+        return _NOT_TRACED
+    if not trace.sampled:
+        # pass the decision on, so the other side doesn't record a trace of its own
+        return ClientSpan(None, {"traceparent": f"00-{trace.trace_id}-{_parent.get() or _new_id(8)}-00"})
+    span = _span(trace, name, "client", _parent.get(), time.time(), **attributes)
+    return ClientSpan(span, {"traceparent": f"00-{trace.trace_id}-{span['span_id']}-01"})
+
+
+def recording():
+    """Whether spans recorded right now end up anywhere"""
+    trace = _trace.get()
+    return trace is not None and trace.sampled
+
+
+def sql_span(statement, seconds, **attributes):
+    """Records a statement that took `seconds` to execute, returns its span (or None if not traced)"""
+    trace = _trace.get()
+    if trace is None or not trace.sampled:
+        return None
+    span = _span(trace, statement, "sql", _parent.get(), time.time() - seconds, **attributes)
+    span["duration_ms"] = seconds * 1000
+    return span
+
+
+def export(spans):
+    """Appends `spans` to TRACING_FILE, one per line, in a single write so that processes don't interleave"""
+    global _fd
+    if not spans:
+        return
+    data = "".join(json.dumps(span, separators=(",", ":")) + "\n" for span in spans).encode()
+    with _file_lock:
+        if _fd is None:
+            _fd = os.open(FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(_fd, data)
+
+
+def init_app(app, service):
+    """Traces every request of `app` as `service`, if TRACING_ENABLED=1"""
+    if not ENABLED:
+        return
+    from flask import g, request
+
+    @app.before_request
+    def start_trace():
+        name = f"{request.method} {request.url_rule.rule if request.url_rule is not None else '<unmatched>'}"
+        g.trace = start_request(service, name, request.headers.get("traceparent"), path=request.path)
+
+    @app.after_request
+    def name_trace(response):
+        span = g.trace[0] if "trace" in g else None
+        if span is not None:
+            span["attributes"]["status"] = response.status_code
+        trace_id = current_trace_id()
+        if trace_id is not None:
+            response.headers["X-Trace-Id"] = trace_id
+        return response
+
+    @app.teardown_request
+    def finish_trace(exc):
+        if "trace" not in g:
+            return
+        span, token = g.pop("trace")
+        finish_request(span, token, **({"error": repr(exc)} if exc is not None else {}))
+
+
+def read_spans(paths, trace_id=None):
+    """Yields the spans in the JSONL files `paths`, only those of `trace_id` if given"""
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if trace_id is not None and trace_id not in line:
+                    continue
+                try:
+                    span = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if trace_id is None or span.get("trace_id") == trace_id:
+                    yield span
+
+
+def waterfall(spans, width=40):
+    """Returns the lines of a waterfall chart of one trace's spans, children under their parents"""
+    if not spans:
+        return []
+    by_id = {span["span_id"]: span for span in spans}
+    children = defaultdict(list)
+    roots = []
+    for span in spans:
+        if span["parent_id"] in by_id:
+            children[span["parent_id"]].append(span)
+        else:
+            roots.append(span)
+
+    start = min(span["start"] for span in spans)
+    end = max(span["start"] + span["duration_ms"] / 1000 for span in spans)
+    total_ms = max((end - start) * 1000, 0.001)
+
+    lines = [f"trace {spans[0]['trace_id']}: {total_ms:.1f}ms, {len(spans)} spans"]
+
+    def draw(span, depth):
+        offset_ms = (span["start"] - start) * 1000
+        left = min(int(offset_ms / total_ms * width), width - 1)
+        length = max(1, round(span["duration_ms"] / total_ms * width))
+        bar = (" " * left + "#" * length)[:width].ljust(width)
+        status = span["attributes"].get("status", "")
+        label = f"{'  ' * depth}{span['service']} {span['kind']} {span['name']}"
+        label = re.sub(r"\s+", " ", label) if span["kind"] == "sql" else label
+        lines.append(f"{offset_ms:9.1f}ms {span['duration_ms']:9.1f}ms |{bar}| {status!s:>3} {label[:120]}")
+        for child in sorted(children[span["span_id"]], key=lambda child: child["start"]):
+            draw(child, depth + 1)
+
+    for root in sorted(roots, key=lambda root: root["start"]):
+        draw(root, 0)
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shows the traces recorded in TRACING_FILE")
+    parser.add_argument("--file", action="append", help=f"JSONL file(s) to read (default: {FILE})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    latest = commands.add_parser("list", help="the latest traces, with their root span and duration")
+    latest.add_argument("--limit", type=int, default=20)
+    show = commands.add_parser("waterfall", help="one trace as a waterfall")
+    show.add_argument("trace_id")
+    show.add_argument("--width", type=int, default=40, help="width of the bars")
+    args = parser.parse_args()
+    paths = args.file or [FILE]
+
+    if args.command == "waterfall":
+        spans = list(read_spans(paths, args.trace_id))
+        if not spans:
+            print(f"No spans of trace {args.trace_id} in {', '.join(paths)}", file=sys.stderr)
+            return 1
+        print("\n".join(waterfall(spans, args.width)))
+        return 0
+
+    traces = {}
+    for span in read_spans(paths):
+        trace = traces.setdefault(span["trace_id"], {"start": span["start"], "end": 0.0, "root": None, "spans": 0})
+        trace["spans"] += 1
+        trace["start"] = min(trace["start"], span["start"])
+        trace["end"] = max(trace["end"], span["start"] + span["duration_ms"] / 1000)
+        if span["kind"] == "server" and (trace["root"] is None or span["start"] < trace["root"]["start"]):
+            trace["root"] = span
+    latest_traces = sorted(traces.items(), key=lambda item: item[1]["start"], reverse=True)[:args.limit]
+    for trace_id, trace in latest_traces:
+        root = trace["root"] or {"service": "?", "name": "?"}
+        stamp = time.strftime("%H:%M:%S", time.localtime(trace["start"]))
+        print(f"{trace_id}  {stamp}  {(trace['end'] - trace['start']) * 1000:9.1f}ms  {trace['spans']:4} spans  "
+              f"{root['service']} {root['name']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,347 @@
+"""Calls from the frontend to the backend API.
+
+Every API endpoint gets one `ApiClient`, a session with kept alive connections that
+retries failed connects and 502/503/504s. `fetch_page_data` sends a page's calls at
+once from a thread pool, carrying the page's trace along.
+
+GET responses with an ETag are kept per user and asked for again with If-None-Match,
+so a 304 reuses the kept body (up to FRONTEND_API_RESPONSE_CACHE_BYTES in total).
+"""
+import contextvars
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
+import requests as req
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.util.retry import Retry
+import tracing
+from cache import LRUCache, MISSING
+
+API_CONNECT_TIMEOUT_SECONDS = float(os.getenv("FRONTEND_API_CONNECT_TIMEOUT", "3"))
+API_TIMEOUT_SECONDS = float(os.getenv("FRONTEND_API_TIMEOUT", "8"))
+ACCESS_COOKIE_NAME = "access_token_cookie"
+
+# shared by every page render, so this caps the amount of calls in flight to the API
+API_WORKERS = int(os.getenv("FRONTEND_API_WORKERS", "16"))
+# kept alive connections per API endpoint
+API_POOL_SIZE = int(os.getenv("FRONTEND_API_POOL_SIZE", str(API_WORKERS)))
+API_RETRIES = int(os.getenv("FRONTEND_API_RETRIES", "2"))
+API_BACKOFF_SECONDS = float(os.getenv("FRONTEND_API_BACKOFF", "0.2"))
+# the endpoint comes from the login form, so the amount of clients has to be capped
+MAX_API_CLIENTS = int(os.getenv("FRONTEND_MAX_API_CLIENTS", "32"))
+
+# memory the GET responses kept for conditional requests may take up (per worker), and
+# the largest single response worth keeping
+API_RESPONSE_CACHE_BYTES = int(os.getenv("FRONTEND_API_RESPONSE_CACHE_BYTES", str(32 * 1024 * 1024)))
+API_RESPONSE_CACHE_MAX_BYTES = int(os.getenv("FRONTEND_API_RESPONSE_CACHE_MAX_BYTES", str(1024 * 1024)))
+
+_executor = ThreadPoolExecutor(max_workers=API_WORKERS, thread_name_prefix="api-call")
+
+
+class CachedResponse:
+    """What's kept of a GET response to answer with after a 304: the status, headers
+    (without cookies) and body. Reads like a response.
+    """
+    __slots__ = ("status_code", "headers", "content", "size")
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.size = len(content) + sum(len(name) + len(value) for name, value in headers.items())
+
+    @classmethod
+    def from_response(cls, response):
+        headers = CaseInsensitiveDict(
+            (name, value) for name, value in response.headers.items() if name.lower() != "set-cookie"
+        )
+        return cls(response.status_code, headers, response.content)
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def etag(self):
+        return self.headers["ETag"]
+
+    @property
+    def text(self):
+        return self.content.decode(get_encoding_from_headers(self.headers) or "utf-8", errors="replace")
+
+    def json(self, **kwargs):
+        return json.loads(self.content, **kwargs)
+
+
+class ResponseCache(LRUCache):
+    """The GET responses that came with an ETag, least recently used evicted first.
+
+    Args:
+        max_bytes (int): Total size of the responses kept
+        max_entry_bytes (int): Responses with a bigger body aren't kept
+    """
+
+    def __init__(self, max_bytes=API_RESPONSE_CACHE_BYTES, max_entry_bytes=API_RESPONSE_CACHE_MAX_BYTES):
+        super().__init__(max_bytes, sizeof=lambda cached: cached.size)
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+
+        self._not_modified = 0
+        self._stored = 0
+
+    @staticmethod
+    def key(url, token):
+        return hashlib.sha256(f"{url}\n{token}".encode()).hexdigest()
+
+    def get(self, key):
+        """Returns the `CachedResponse` kept under `key` (counted as a conditional request), or None"""
+        cached = super().get(key)
+        return None if cached is MISSING else cached
+
+    def update(self, key, response, cached=None):
+        """Handles the answer to a GET: returns the kept response on a 304, keeps a new one with an ETag"""
+        if response.status_code == 304 and cached is not None:
+            with self._lock:
+                self._not_modified += 1
+            return cached
+
+        if response.status_code == 200 and response.headers.get("ETag") and len(response.content) <= self.max_entry_bytes:
+            self.set(key, CachedResponse.from_response(response))
+            with self._lock:
+                self._stored += 1
+        elif cached is not None:
+            self.invalidate(key)
+        return response
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            return {
+                "size": stats["size"],
+                "bytes": stats["total_size"],
+                "max_bytes": self.max_bytes,
+                "conditional_requests": stats["hits"],
+                "not_modified": self._not_modified,
+                "stored": self._stored,
+                "evictions": stats["evictions"],
+            }
+
+
+_responses = ResponseCache()
+
+
+class ApiClient:
+    """A pool of kept alive connections to one API endpoint. Every user of the endpoint
+    shares it, so it never keeps cookies, the token goes along with each request.
+
+    Args:
+        api_endpoint (str): Base URL of the API, without a trailing slash
+        pool_size (int): Maximum amount of connections kept alive
+        retries (int): How often a request that couldn't connect (or a GET that got a
+            502/503/504) is retried
+        backoff (float): Base delay between retries in seconds, doubled after each one
+    """
+
+    def __init__(self, api_endpoint, pool_size=API_POOL_SIZE, retries=API_RETRIES, backoff=API_BACKOFF_SECONDS):
+        self.api_endpoint = api_endpoint
+        self.session = req.Session()
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET", "HEAD", "OPTIONS"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+
+        self._lock = threading.Lock()
+        self._requests = 0
+
+    def request(self, method, path, token=None, **kwargs):
+        """Sends one request to the API, authenticated as the owner of `token`.
+
+        Args:
+            method (str): HTTP method
+            path (str): Path of the route, e.g. /api/projects
+            token (str | None): The user's access token
+            **kwargs: Passed on to `requests.Session.request` (params, data, ...)
+
+        Returns:
+            requests.Response: the response, whatever its status code. A GET the API
+            answered with 304 returns the `CachedResponse` kept from before instead
+
+        Raises:
+            requests.RequestException: if the API couldn't be reached
+        """
+        if token:
+            kwargs["cookies"] = {**kwargs.get("cookies", {}), ACCESS_COOKIE_NAME: token}
+        kwargs.setdefault("timeout", (API_CONNECT_TIMEOUT_SECONDS, API_TIMEOUT_SECONDS))
+        url = f"{self.api_endpoint}{path}"
+
+        cache_key = cached = None
+        if method.upper() == "GET":
+            cache_key = ResponseCache.key(req.Request("GET", url, params=kwargs.get("params")).prepare().url, token)
+            cached = _responses.get(cache_key)
+            if cached is not None:
+                kwargs["headers"] = {**(kwargs.get("headers") or {}), "If-None-Match": cached.etag}
+
+        with self._lock:
+            self._requests += 1
+        with tracing.client_span(f"{method.upper()} {path}") as call:
+            if call.headers:
+                kwargs["headers"] = {**(kwargs.get("headers") or {}), **call.headers}
+            response = self.session.request(method, url, **kwargs)
+            if call.span is not None:
+                call.span["attributes"]["status"] = response.status_code
+
+        if cache_key is not None:
+            return _responses.update(cache_key, response, cached)
+        return response
+
+    def close(self):
+        self.session.close()
+
+    def stats(self):
+        """Returns how many requests were sent and how many connections that took"""
+        connection_pools = self._adapter.poolmanager.pools
+        pools = [connection_pools[key] for key in connection_pools.keys()]
+        opened = sum(pool.num_connections for pool in pools)
+        with self._lock:
+            requests_sent = self._requests
+        return {
+            "requests": requests_sent,
+            "connections_opened": opened,
+            "connections_reused": max(requests_sent - opened, 0),
+            # the pool's queue is padded with None up to its size, only real connections count
+            "idle_connections": sum(
+                1 for pool in pools if pool.pool is not None
+                for conn in list(pool.pool.queue) if conn is not None
+            ),
+        }
+
+
+_clients = OrderedDict()
+_clients_lock = threading.Lock()
+_client_hits = 0
+_client_misses = 0
+_client_evictions = 0
+
+
+def get_client(api_endpoint):
+    """Returns the `ApiClient` for `api_endpoint`, creating it on first use.
+
+    The least recently used client is closed once there are more than MAX_API_CLIENTS.
+    """
+    global _client_hits, _client_misses, _client_evictions
+
+    with _clients_lock:
+        client = _clients.get(api_endpoint)
+        if client is not None:
+            _clients.move_to_end(api_endpoint)
+            _client_hits += 1
+            return client
+
+        _client_misses += 1
+        client = _clients[api_endpoint] = ApiClient(api_endpoint)
+        while len(_clients) > MAX_API_CLIENTS:
+            _, evicted = _clients.popitem(last=False)
+            evicted.close()
+            _client_evictions += 1
+        return client
+
+
+def client_stats():
+    """Returns the client cache metrics plus the connection stats of each cached client"""
+    with _clients_lock:
+        clients = dict(_clients)
+        stats = {
+            "clients": len(clients),
+            "max_clients": MAX_API_CLIENTS,
+            "hits": _client_hits,
+            "misses": _client_misses,
+            "evictions": _client_evictions,
+        }
+    stats["endpoints"] = {endpoint: client.stats() for endpoint, client in clients.items()}
+    stats["response_cache"] = _responses.stats()
+    return stats
+
+
+def api_request(api_endpoint, method, path, token=None, **kwargs):
+    """Sends one request through the pooled client of `api_endpoint`, see `ApiClient.request`"""
+    return get_client(api_endpoint).request(method, path, token, **kwargs)
+
+
+def submit(api_endpoint, method, path, token=None, **kwargs):
+    """Like `api_request`, but returns straight away with a `Future` for the response"""
+    # the pool's threads don't know which request they're working for, the trace has to come along
+    return _executor.submit(contextvars.copy_context().run, api_request, api_endpoint, method, path, token, **kwargs)
+
+
+class PageData:
+    """The results of `fetch_page_data`, by the name each call was given.
+
+    Args:
+        futures (dict): name -> `Future` of the call's response
+        user (dict | None): The user, if it was already known and whoami wasn't called
+    """
+
+    def __init__(self, futures, user=None):
+        self._user = user
+        self.responses = {}
+        self.errors = {}
+        for name, future in futures.items():
+            try:
+                self.responses[name] = future.result()
+            except req.RequestException as e:
+                self.errors[name] = e
+
+    def json(self, name, default=None):
+        """The JSON body of call `name` if it returned 200, otherwise `default`"""
+        response = self.responses.get(name)
+        if response is None or response.status_code != 200:
+            return default
+        return response.json()
+
+    @property
+    def user(self):
+        """Who the user is, or None if they aren't logged in"""
+        if self._user is not None:
+            return self._user
+        return self.json("whoami")
+
+    @property
+    def projects(self):
+        return self.json("projects", [])
+
+
+def fetch_page_data(api_endpoint, token, user=None, **calls):
+    """Fetches who the user is, their projects and any other `calls`, all at the same time.
+
+    Args:
+        api_endpoint (str): Base URL of the API
+        token (str): The user's access token
+        user (dict | None): The user if that's already known, whoami is skipped then
+        **calls: name=(path, query parameters or None) of extra GET requests for the page
+
+    Returns:
+        PageData: with the results "whoami" (unless `user` was given), "projects" and
+        one per extra call
+    """
+    calls = {"projects": ("/api/projects", None), **calls}
+    if user is None:
+        calls["whoami"] = ("/api/whoami", None)
+    return PageData({
+        name: submit(api_endpoint, "GET", path, token, params=params)
+        for name, (path, params) in calls.items()
+    }, user)
@@ -0,0 +1,93 @@
+"""Who is logged in, without asking /api/whoami on every page load.
+
+Identities are cached for a short while under a hash of the API endpoint and token.
+Logging out, changing the username and deleting the account have to `forget` it.
+
+With FRONTEND_IDENTITY_SOURCE=token the identity is read from the token's claims
+instead, checked with FRONTEND_JWT_SECRET_KEY (or JWT_SECRET_KEY). The claims are from
+login time, so a token revoked elsewhere keeps working here, and a new username doesn't
+show up, until the token expires.
+"""
+import hashlib
+import os
+import jwt
+from cache import LRUCache, MISSING
+
+IDENTITY_CACHE_TTL_SECONDS = float(os.getenv("FRONTEND_IDENTITY_TTL", "30"))
+IDENTITY_CACHE_SIZE = int(os.getenv("FRONTEND_IDENTITY_CACHE_SIZE", "4096"))
+# "api": ask /api/whoami and cache the answer, "token": read the claims of the token
+IDENTITY_SOURCE = os.getenv("FRONTEND_IDENTITY_SOURCE", "api").lower()
+
+
+class IdentityCache(LRUCache):
+    """The users behind tokens, kept for `ttl` seconds before asking the API again.
+    Hands out copies, so a page can't change a cached identity.
+    """
+
+    def __init__(self, maxsize=IDENTITY_CACHE_SIZE, ttl=IDENTITY_CACHE_TTL_SECONDS):
+        super().__init__(maxsize, ttl)
+
+    def get(self, key):
+        """Returns a copy of the identity cached under `key`, or None"""
+        user = super().get(key)
+        return None if user is MISSING else dict(user)
+
+    def set(self, key, user):
+        super().set(key, dict(user))
+
+    def stats(self):
+        return {"source": IDENTITY_SOURCE, "ttl_seconds": self.ttl, **super().stats()}
+
+
+_cache = IdentityCache()
+
+
+def _key(api_endpoint, token):
+    return hashlib.sha256(f"{api_endpoint}\n{token}".encode()).hexdigest()
+
+
+def decode_identity(token):
+    """Reads the user out of the claims of `token` after checking its signature and expiry.
+
+    Returns:
+        dict | None: {"user_id", "username", "email"}, or None if the token can't be
+        trusted (or no secret key is configured to check it with)
+    """
+    secret = os.getenv("FRONTEND_JWT_SECRET_KEY") or os.getenv("JWT_SECRET_KEY")
+    if not secret:
+        return None
+
+    try:
+        claims = jwt.decode(token, secret, algorithms=["HS256"], options={"require": ["sub", "exp"]})
+        return {
+            "user_id": int(claims["sub"]),
+            "username": claims.get("username"),
+            "email": claims.get("email"),
+        }
+    except (jwt.InvalidTokenError, ValueError):
+        return None
+
+
+def lookup(api_endpoint, token):
+    """Returns who `token` belongs to without calling the API, or None if that's not known"""
+    user = _cache.get(_key(api_endpoint, token))
+    if user is None and IDENTITY_SOURCE == "token":
+        user = decode_identity(token)
+        if user is not None:
+            _cache.set(_key(api_endpoint, token), user)
+    return user
+
+
+def remember(api_endpoint, token, user):
+    """Caches what /api/whoami said about the owner of `token`"""
+    _cache.set(_key(api_endpoint, token), user)
+
+
+def forget(api_endpoint, token):
+    """Drops the cached identity of `token`, the next page load asks the API again"""
+    if token:
+        _cache.invalidate(_key(api_endpoint, token))
+
+
+def stats():
+    return _cache.stats()
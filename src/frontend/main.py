@@ -1,11 +1,26 @@
 import os
+import sys
+
+# the modules both apps use (profiling, memory tracking and tracing) live in src/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+
 from flask import Flask, render_template, redirect, url_for, request, session, make_response, send_file, jsonify
 import requests as req
 import json
+from functools import wraps
+from urllib.parse import urlsplit
+from backend_client import ACCESS_COOKIE_NAME, PageData, api_request, client_stats, fetch_page_data
+import identity
+import memory_tracking
+import profiling
+import tracing
 
 DEFAULT_API_ENDPOINT = "http://127.0.0.1:5000"
-API_TIMEOUT_SECONDS = 8
-ACCESS_COOKIE_NAME = "access_token_cookie"
+
+# who may see the /stats pages, the same setting as the backend's internal routes
+INTERNAL_ALLOWED_ADDRESSES = {
+    address.strip() for address in os.getenv("INTERNAL_ALLOWED_ADDRESSES", "127.0.0.1,::1").split(",") if address.strip()
+}
 
 app = Flask(
     __name__,
@@ -14,6 +29,19 @@ app = Flask(
 )
 
 app.secret_key = os.getenv("FRONTEND_SECRET_KEY", "dev-frontend-secret")
+profiling.init_app(app, "frontend")
+memory_tracking.init_app(app)
+tracing.init_app(app, "frontend")
+
+
+def internal_only(fn):
+    """Sends requests that aren't from INTERNAL_ALLOWED_ADDRESSES to the index instead of `fn`"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if request.remote_addr not in INTERNAL_ALLOWED_ADDRESSES:
+            return redirect(url_for("index"))
+        return fn(*args, **kwargs)
+    return wrapper
 
 
 @app.route("/serviceWorker.js", methods=["GET"])
@@ -42,6 +70,63 @@ def privacy():
     return render_template("/privacy.html")
 
 
+@app.route("/stats/api-clients", methods=["GET"])
+@internal_only
+def api_client_stats():
+    """Connection pool stats of the API clients"""
+    return jsonify(client_stats())
+
+
+@app.route("/stats/identity-cache", methods=["GET"])
+@internal_only
+def identity_cache_stats():
+    """Hit/miss stats of the identity cache"""
+    return jsonify(identity.stats())
+
+
+@app.route("/stats/memory", methods=["GET"])
+@internal_only
+def memory_stats():
+    """Peak memory per route and the tracemalloc snapshots (see memory_tracking.py)"""
+    if not memory_tracking.ENABLED:
+        return jsonify({"message": "Memory tracking is turned off (MEMORY_TRACKING=0)"}), 404
+    return jsonify(memory_tracking.report())
+
+
+@app.route("/stats/memory/snapshots", methods=["POST"])
+@internal_only
+def memory_snapshot():
+    """Takes a tracemalloc snapshot (?group_by=lineno|filename|traceback&limit=20)"""
+    if not memory_tracking.ENABLED:
+        return jsonify({"message": "Memory tracking is turned off (MEMORY_TRACKING=0)"}), 404
+    try:
+        group_by, limit = memory_tracking.parse_options(request.args)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    return jsonify(memory_tracking.take_snapshot(group_by, limit)), 201
+
+
+@app.route("/stats/memory/diff", methods=["GET"])
+@internal_only
+def memory_diff():
+    """Allocation sites that grew between snapshots ?from=<id>[&to=<id>]"""
+    if not memory_tracking.ENABLED:
+        return jsonify({"message": "Memory tracking is turned off (MEMORY_TRACKING=0)"}), 404
+    try:
+        group_by, limit = memory_tracking.parse_options(request.args)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    try:
+        from_id = int(request.args.get("from", ""))
+        to_id = int(request.args["to"]) if request.args.get("to") else None
+    except ValueError:
+        return jsonify({"message": "from (and to, if given) must be snapshot ids"}), 400
+    try:
+        return jsonify(memory_tracking.diff(from_id, to_id, group_by, limit))
+    except KeyError as e:
+        return jsonify({"message": f"Snapshot {e} isn't kept (anymore)"}), 404
+
+
 @app.template_filter('from_json')
 def from_json_filter(value):
     """Parse a JSON string into a Python object"""
@@ -103,10 +188,9 @@ def login():
         )
 
     try:
-        response = req.post(
-            f"{api_endpoint}/api/login",
-            data={"email": email, "password": password},
-            timeout=API_TIMEOUT_SECONDS
+        response = api_request(
+            api_endpoint, "POST", "/api/login",
+            data={"email": email, "password": password}
         )
     except req.RequestException as exc:
         return render_template(
@@ -175,10 +259,9 @@ def verify_2fa_login():
         return jsonify({"message": "2FA code is required"}), 400
 
     try:
-        response = req.post(
-            f"{api_endpoint}/api/login/verify_2fa",
-            data={"user_id": user_id, "totp_code": totp_code},
-            timeout=API_TIMEOUT_SECONDS
+        response = api_request(
+            api_endpoint, "POST", "/api/login/verify_2fa",
+            data={"user_id": user_id, "totp_code": totp_code}
         )
     except req.RequestException as exc:
         return jsonify({"message": f"Unable to reach API: {exc}"}), 500
@@ -238,15 +321,14 @@ def register():
         )
 
     try:
-        response = req.post(
-            f"{api_endpoint}/api/register",
+        response = api_request(
+            api_endpoint, "POST", "/api/register",
             data={
                 "name": name,
                 "username": username,
                 "email": email,
                 "password": password
-            },
-            timeout=API_TIMEOUT_SECONDS
+            }
         )
     except req.RequestException as exc:
         return render_template(
@@ -288,29 +370,75 @@ def register():
     return redirect_response
 
 
-def check_if_user_is_authenticated(api_endpoint, token):
+def is_same_origin():
+    """Whether the request was sent by one of our own pages, going by its Origin (or Referer)"""
+    source = request.headers.get("Origin") or request.headers.get("Referer")
+    if not source:
+        return False
+    source = urlsplit(source)
+    return (source.scheme, source.netloc) == (request.scheme, request.host)
+
+
+@app.route("/logout", methods=["POST"])
+def logout():
+    """Revokes the token on the API, forgets its identity and clears the cookie.
+    Only for our own pages, so another site can't log users out.
+    """
+    if not is_same_origin():
+        return jsonify({"message": "Cross-origin requests aren't allowed"}), 403
+
+    api_endpoint = session.get("api_endpoint", DEFAULT_API_ENDPOINT)
+    token = request.cookies.get(ACCESS_COOKIE_NAME)
+
+    identity.forget(api_endpoint, token)
+    if token:
+        try:
+            api_request(api_endpoint, "POST", "/api/logout", token)
+        except req.RequestException as exc:
+            app.logger.error(f"Unable to revoke token on logout: {exc}")
+
+    response = jsonify({"message": "Logged out"})
+    response.set_cookie(ACCESS_COOKIE_NAME, "", max_age=0)
+    return response, 200
+
+
+def check_if_user_is_authenticated(api_endpoint, token, **calls):
+    """Checks who is logged in, fetching their projects and any extra `calls` of the page
+    at the same time (see `backend_client.fetch_page_data`).
+
+    Who the token belongs to comes from the identity cache when possible (see
+    `identity.py`), so /api/whoami is only asked every now and then.
+
+    Returns:
+        PageData | Response: the page data when logged in, otherwise the response to send instead
+    """
     if not token:
         return redirect(url_for("login"))
 
-    try:
-        response = req.get(
-            f"{api_endpoint}/api/whoami",
-            cookies={ACCESS_COOKIE_NAME: token},
-            timeout=API_TIMEOUT_SECONDS
-        )
-    except req.RequestException as exc:
+    known_user = identity.lookup(api_endpoint, token)
+    page = fetch_page_data(api_endpoint, token, user=known_user, **calls)
+
+    projects_response = page.responses.get("projects")
+    if known_user is not None and projects_response is not None and projects_response.status_code == 401:
+        # the token was revoked or expired since its identity was cached
+        identity.forget(api_endpoint, token)
+        return redirect(url_for("login"))
+
+    if "whoami" in page.errors:
         return render_template(
             "dashboard.html",
             message="Unable to reach API",
-            message_detail=str(exc),
+            message_detail=str(page.errors["whoami"]),
             message_type="danger",
             projects=[]
         )
 
-    if response.status_code != 200:
+    if page.user is None:
         return redirect(url_for("login"))
     else:
-        return response.json()
+        if known_user is None:
+            identity.remember(api_endpoint, token, page.user)
+        return page
 
 
 @app.route("/dashboard", methods=["GET"])
@@ -318,28 +446,20 @@ def dashboard():
     api_endpoint = session.get("api_endpoint", DEFAULT_API_ENDPOINT)
     token = request.cookies.get(ACCESS_COOKIE_NAME)
 
-    result = check_if_user_is_authenticated(api_endpoint, token)
-    if not isinstance(result, dict):
-        return result
+    page = check_if_user_is_authenticated(api_endpoint, token)
+    if not isinstance(page, PageData):
+        return page
 
-    user_data = result
+    user_data = page.user
 
-    projects = []
-    try:
-        projects_response = req.get(
-            f"{api_endpoint}/api/projects",
-            cookies={ACCESS_COOKIE_NAME: token},
-            timeout=API_TIMEOUT_SECONDS
-        )
-        if projects_response.status_code == 200:
-            projects = projects_response.json()
-    except req.RequestException as exc:
+    if "projects" in page.errors:
         return render_template(
             "dashboard.html",
             message="Unable to reach API",
-            message_detail=str(exc),
+            message_detail=str(page.errors["projects"]),
             message_type="danger"
         )
+    projects = page.projects
 
     return render_template(
         "dashboard.html",
@@ -356,28 +476,20 @@ def new_project():
     api_endpoint = session.get("api_endpoint", DEFAULT_API_ENDPOINT)
     token = request.cookies.get(ACCESS_COOKIE_NAME)
 
-    result = check_if_user_is_authenticated(api_endpoint, token)
-    if not isinstance(result, dict):
-        return result
+    page = check_if_user_is_authenticated(api_endpoint, token)
+    if not isinstance(page, PageData):
+        return page
 
-    user_data = result
+    user_data = page.user
 
-    projects = []
-    try:
-        projects_response = req.get(
-            f"{api_endpoint}/api/projects",
-            cookies={ACCESS_COOKIE_NAME: token},
-            timeout=API_TIMEOUT_SECONDS
-        )
-        if projects_response.status_code == 200:
-            projects = projects_response.json()
-    except req.RequestException as exc:
+    if "projects" in page.errors:
         return render_template(
             "new_project.html",
             message="Unable to reach API",
-            message_detail=str(exc),
+            message_detail=str(page.errors["projects"]),
             message_type="danger"
         )
+    projects = page.projects
 
     if not token:
         return redirect(url_for("login"))
@@ -411,15 +523,13 @@ def new_project():
         )
 
     try:
-        response = req.post(
-            f"{api_endpoint}/api/projects",
+        response = api_request(
+            api_endpoint, "POST", "/api/projects", token,
             data={
                 "project_name": project_name,
                 "repository_url": repository_url or None,
                 "description": description or None
-            },
-            cookies={ACCESS_COOKIE_NAME: token},
-            timeout=API_TIMEOUT_SECONDS
+            }
         )
     except req.RequestException as exc:
         return render_template(
@@ -457,82 +567,65 @@ def new_project():
 
 @app.route("/projects/<int:project_id>", methods=["GET", "POST"])
 def project_info(project_id):
+    allowed_filter_keys = {
+        "start_time_gt",
+        "start_time_gte",
+        "start_time_lt",
+        "start_time_lte",
+        "end_time_gt",
+        "end_time_gte",
+        "end_time_lt",
+        "end_time_lte",
+        "time_worked_min",
+        "time_worked_max",
+        "log_timestamp_after",
+        "log_timestamp_before",
+        "username",
+        "notes_contains",
+    }
+
+    filters = {
+        key: (request.args.get(key) or "").strip()
+        for key in allowed_filter_keys
+        if request.args.get(key) is not None and (request.args.get(key) or "").strip() != ""
+    }
+
+    search = (request.args.get("search") or "").strip()
+    if search and "notes_contains" not in filters:
+        filters["notes_contains"] = search
+
+    after = filters.get("log_timestamp_after")
+    if after and len(after) == 10 and after.count("-") == 2:
+        filters["log_timestamp_after"] = f"{after} 00:00:00"
+    before = filters.get("log_timestamp_before")
+    if before and len(before) == 10 and before.count("-") == 2:
+        filters["log_timestamp_before"] = f"{before} 23:59:59"
+
+    # pages are fetched through keyset pagination, see GET /api/<project_id>/logs
+    params = dict(filters)
+    for key in ("limit", "cursor"):
+        value = (request.args.get(key) or "").strip()
+        if value:
+            params[key] = value
+
     # copy from here for auth checking
     api_endpoint = session.get("api_endpoint", DEFAULT_API_ENDPOINT)
     token = request.cookies.get(ACCESS_COOKIE_NAME)
 
-    result = check_if_user_is_authenticated(api_endpoint, token)
-    if not isinstance(result, dict):
-        return result
-
-    user_data = result
+    # the logs are fetched together with the user and their projects
+    page = check_if_user_is_authenticated(
+        api_endpoint, token, logs=(f"/api/{project_id}/logs", params))
+    if not isinstance(page, PageData):
+        return page
 
-    projects = []
-    try:
-        projects_response = req.get(
-            f"{api_endpoint}/api/projects",
-            cookies={ACCESS_COOKIE_NAME: token},
-            timeout=API_TIMEOUT_SECONDS
-        )
-        if projects_response.status_code == 200:
-            projects = projects_response.json()
-    except req.RequestException:
-        pass
-
-    if not token:
-        return redirect(url_for("login"))
+    user_data = page.user
+    projects = page.projects
     # end copy
 
     logs = []
-    try:
-        allowed_filter_keys = {
-            "start_time_gt",
-            "start_time_gte",
-            "start_time_lt",
-            "start_time_lte",
-            "end_time_gt",
-            "end_time_gte",
-            "end_time_lt",
-            "end_time_lte",
-            "time_worked_min",
-            "time_worked_max",
-            "log_timestamp_after",
-            "log_timestamp_before",
-            "username",
-            "notes_contains",
-        }
-
-        filters = {
-            key: (request.args.get(key) or "").strip()
-            for key in allowed_filter_keys
-            if request.args.get(key) is not None and (request.args.get(key) or "").strip() != ""
-        }
-
-        search = (request.args.get("search") or "").strip()
-        if search and "notes_contains" not in filters:
-            filters["notes_contains"] = search
-
-        after = filters.get("log_timestamp_after")
-        if after and len(after) == 10 and after.count("-") == 2:
-            filters["log_timestamp_after"] = f"{after} 00:00:00"
-        before = filters.get("log_timestamp_before")
-        if before and len(before) == 10 and before.count("-") == 2:
-            filters["log_timestamp_before"] = f"{before} 23:59:59"
-
-        project_request = req.get(
-            f"{api_endpoint}/api/{project_id}/logs",
-            params=filters,
-            cookies={ACCESS_COOKIE_NAME: token},
-            timeout=API_TIMEOUT_SECONDS
-        )
-        if project_request.status_code == 200:
-            logs = project_request.json()
-        else:
-            return render_template(
-                "devlog.html",
-                message=f"Failed to fetch project logs: {_build_error_message(project_request)}"
-            )
-    except req.RequestException as exc:
+    next_page_url = None
+
+    if "logs" in page.errors:
         return render_template(
             "devlog.html",
             username=user_data.get("username"),
@@ -540,7 +633,23 @@ def project_info(project_id):
             user_id=user_data.get("user_id"),
             projects=projects,
             message="Unable to reach API",
-            message_detail=str(exc)
+            message_detail=str(page.errors["logs"])
+        )
+
+    project_request = page.responses["logs"]
+    if project_request.status_code == 200:
+        logs_page = project_request.json()
+        logs = logs_page.get("logs", [])
+        if logs_page.get("next_cursor"):
+            next_page_url = url_for(
+                "project_info",
+                project_id=project_id,
+                **{**request.args.to_dict(), "cursor": logs_page["next_cursor"]}
+            )
+    else:
+        return render_template(
+            "devlog.html",
+            message=f"Failed to fetch project logs: {_build_error_message(project_request)}"
         )
 
     if request.method == "GET":
@@ -553,6 +662,7 @@ def project_info(project_id):
             user_id=user_data.get("user_id"),
             projects=projects,
             logs=logs,
+            next_page_url=next_page_url,
             project_id=project_id
         )
     else:
@@ -565,23 +675,12 @@ def project_settings(project_id):
     api_endpoint = session.get("api_endpoint", DEFAULT_API_ENDPOINT)
     token = request.cookies.get(ACCESS_COOKIE_NAME)
 
-    result = check_if_user_is_authenticated(api_endpoint, token)
-    if not isinstance(result, dict):
-        return result
+    page = check_if_user_is_authenticated(api_endpoint, token)
+    if not isinstance(page, PageData):
+        return page
 
-    user_data = result
-
-    projects = []
-    try:
-        projects_response = req.get(
-            f"{api_endpoint}/api/projects",
-            cookies={ACCESS_COOKIE_NAME: token},
-            timeout=API_TIMEOUT_SECONDS
-        )
-        if projects_response.status_code == 200:
-            projects = projects_response.json()
-    except req.RequestException:
-        pass
+    user_data = page.user
+    projects = page.projects
 
     if not token:
         return redirect(url_for("login"))
@@ -626,15 +725,13 @@ def project_settings(project_id):
                 )
 
             try:
-                update_response = req.put(
-                    f"{api_endpoint}/api/projects/{project_id}",
+                update_response = api_request(
+                    api_endpoint, "PUT", f"/api/projects/{project_id}", token,
                     data={
                         "project_name": project_name,
                         "repository_url": repository_url if repository_url is not None else "",
                         "description": description if description is not None else "",
-                    },
-                    cookies={ACCESS_COOKIE_NAME: token},
-                    timeout=API_TIMEOUT_SECONDS
+                    }
                 )
             except req.RequestException as exc:
                 return render_template(
@@ -666,10 +763,8 @@ def project_settings(project_id):
                 )
 
             try:
-                projects_response = req.get(
-                    f"{api_endpoint}/api/projects",
-                    cookies={ACCESS_COOKIE_NAME: token},
-                    timeout=API_TIMEOUT_SECONDS
+                projects_response = api_request(
+                    api_endpoint, "GET", "/api/projects", token
                 )
                 if projects_response.status_code == 200:
                     projects = projects_response.json()
@@ -693,10 +788,8 @@ def project_settings(project_id):
 
         if action == "delete":
             try:
-                delete_response = req.delete(
-                    f"{api_endpoint}/api/projects/{project_id}",
-                    cookies={ACCESS_COOKIE_NAME: token},
-                    timeout=API_TIMEOUT_SECONDS
+                delete_response = api_request(
+                    api_endpoint, "DELETE", f"/api/projects/{project_id}", token
                 )
             except req.RequestException as exc:
                 return render_template(
@@ -760,23 +853,12 @@ def user_settings():
     api_endpoint = session.get("api_endpoint", DEFAULT_API_ENDPOINT)
     token = request.cookies.get(ACCESS_COOKIE_NAME)
 
-    result = check_if_user_is_authenticated(api_endpoint, token)
-    if not isinstance(result, dict):
-        return result
-
-    user_data = result
+    page = check_if_user_is_authenticated(api_endpoint, token)
+    if not isinstance(page, PageData):
+        return page
 
-    projects = []
-    try:
-        projects_response = req.get(
-            f"{api_endpoint}/api/projects",
-            cookies={ACCESS_COOKIE_NAME: token},
-            timeout=API_TIMEOUT_SECONDS
-        )
-        if projects_response.status_code == 200:
-            projects = projects_response.json()
-    except req.RequestException:
-        pass
+    user_data = page.user
+    projects = page.projects
 
     if not token:
         return redirect(url_for("login"))
@@ -799,11 +881,9 @@ def user_settings():
                 )
 
             try:
-                resp = req.put(
-                    f"{api_endpoint}/api/account/username",
-                    data={"username": new_username},
-                    cookies={ACCESS_COOKIE_NAME: token},
-                    timeout=API_TIMEOUT_SECONDS
+                resp = api_request(
+                    api_endpoint, "PUT", "/api/account/username", token,
+                    data={"username": new_username}
                 )
             except req.RequestException as exc:
                 return render_template(
@@ -828,6 +908,7 @@ def user_settings():
                     message_type="danger",
                 )
 
+            identity.forget(api_endpoint, token)
             user_data["username"] = new_username
             return render_template(
                 "user_settings.html",
@@ -868,15 +949,13 @@ def user_settings():
                 )
 
             try:
-                resp = req.put(
-                    f"{api_endpoint}/api/account/password",
+                resp = api_request(
+                    api_endpoint, "PUT", "/api/account/password", token,
                     data={
                         "current_password": current_password,
                         "new_password": new_password,
                         "totp_code": totp_code,
-                    },
-                    cookies={ACCESS_COOKIE_NAME: token},
-                    timeout=API_TIMEOUT_SECONDS
+                    }
                 )
             except req.RequestException as exc:
                 return render_template(
@@ -913,10 +992,8 @@ def user_settings():
 
         if action == "delete_user":
             try:
-                resp = req.delete(
-                    f"{api_endpoint}/api/account",
-                    cookies={ACCESS_COOKIE_NAME: token},
-                    timeout=API_TIMEOUT_SECONDS
+                resp = api_request(
+                    api_endpoint, "DELETE", "/api/account", token
                 )
             except req.RequestException as exc:
                 return render_template(
@@ -941,6 +1018,7 @@ def user_settings():
                     message_type="danger",
                 )
 
+            identity.forget(api_endpoint, token)
             session.pop("api_endpoint", None)
             redirect_response = make_response(
                 redirect(url_for("login") +
@@ -37,13 +37,9 @@ function apiFetch(url, options = {}) {
 }
 
 async function logout() {
-    let apiEndpoint = localStorage.getItem('apiEndpoint');
-    if (!apiEndpoint) {
-        apiEndpoint = 'http://127.0.0.1:5000';
-    }
-
     try {
-        await apiFetch(`${apiEndpoint}/api/logout`, { method: 'POST' });
+        // the frontend revokes the token on the API and forgets who it belonged to
+        await fetch('/logout', { method: 'POST', credentials: 'same-origin' });
 
         window.location.href = '/login?message=Logged out successfully&message_type=success';
     } catch (error) {
@@ -343,4 +339,44 @@ function deleteLog(projectId, logId) {
     .catch(error => {
         alert('Network error: ' + error.message);
     });
-}
\ No newline at end of file
+}
+
+/// appends the next page of logs to the table instead of navigating to it. the frontend
+/// renders the rows, so we grab them (and the link to the page after) from its html.
+function loadMoreLogs(link) {
+    if (!window.fetch || !window.DOMParser) {
+        return true;
+    }
+
+    link.classList.add('disabled');
+
+    fetch(link.href, { credentials: 'same-origin' })
+    .then(response => {
+        if (!response.ok) {
+            throw new Error(`Request failed with status ${response.status}`);
+        }
+        return response.text();
+    })
+    .then(html => {
+        const page = new DOMParser().parseFromString(html, 'text/html');
+        const tableBody = document.getElementById('logsTableBody');
+
+        page.querySelectorAll('#logsTableBody > tr').forEach(row => {
+            tableBody.appendChild(document.importNode(row, true));
+        });
+
+        const nextLink = page.getElementById('loadMoreLogsBtn');
+        if (nextLink) {
+            link.href = nextLink.getAttribute('href');
+            link.classList.remove('disabled');
+        } else {
+            link.parentElement.remove();
+        }
+    })
+    .catch(error => {
+        console.error('Error loading more logs:', error);
+        window.location.href = link.href;
+    });
+
+    return false;
+}
@@ -0,0 +1,102 @@
+"""Shared fixtures: a backend app on a throwaway database, and logged in test clients.
+
+The backend reads its configuration when its modules are first imported, so the
+environment is set up here, before any test module gets to import them.
+"""
+import itertools
+import logging
+import os
+import tempfile
+import pytest
+
+os.environ.setdefault("LOPERLOG_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="loperlog-tests-"), "mono.db"))
+os.environ.setdefault("SECRET_KEY", "secret-key-used-only-by-the-test-suite")
+os.environ.setdefault("JWT_SECRET_KEY", "jwt-secret-key-used-only-by-the-test-suite")
+# hashing inline and with as few rounds as bcrypt allows keeps registering fast
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+os.environ.setdefault("PASSWORD_HASH_ROUNDS", "4")
+
+_usernames = itertools.count(1)
+
+
+@pytest.fixture(scope="session")
+def app():
+    import db_handler as dbHandler
+    from main import app
+
+    app.testing = True
+    dbHandler.prepare(logging.getLogger("tests"))
+    return app
+
+
+def register(client):
+    """Registers a new user with `client` and verifies their 2FA, which logs the client in.
+
+    Returns:
+        dict: the user, with the `totp_secret` the registration handed out
+    """
+    import pyotp
+
+    username = f"dev{next(_usernames)}"
+    registered = client.post("/api/register", data={
+        "email": f"{username}@example.com",
+        "username": username,
+        "password": "correct horse battery staple",
+    })
+    assert registered.status_code == 201, registered.get_json()
+    user = registered.get_json()
+
+    verified = client.post("/api/register/verify_2fa", data={
+        "user_id": user["user_id"],
+        "totp_code": pyotp.TOTP(user["totp_secret"]).now(),
+    })
+    assert verified.status_code == 200, verified.get_json()
+    return {**verified.get_json()["user"], "totp_secret": user["totp_secret"]}
+
+
+@pytest.fixture
+def client(app):
+    """A test client that is logged in as a user of its own"""
+    client = app.test_client()
+    client.user = register(client)
+    return client
+
+
+@pytest.fixture
+def stranger(app):
+    """Another logged in test client, whose user doesn't own anything of `client`'s user"""
+    stranger = app.test_client()
+    stranger.user = register(stranger)
+    return stranger
+
+
+@pytest.fixture
+def project_id(client):
+    created = client.post("/api/projects", data={"project_name": "loperlog"})
+    assert created.status_code == 201
+    return created.get_json()["project_id"]
+
+
+def log_entry(day, minutes=60, notes=""):
+    """A log entry worked on 2025-01-<day>"""
+    return {
+        "start_time": f"2025-01-{day:02d} 09:00:00",
+        "end_time": f"2025-01-{day:02d} 10:00:00",
+        "time_worked_minutes": minutes,
+        "developer_notes": notes,
+    }
+
+
+@pytest.fixture
+def add_logs(client):
+    """Adds log entries to a project as `client`'s user.
+
+    `add_logs(project_id, [{"day": 3, "minutes": 30}, ...])` takes the arguments of
+    `log_entry` for every entry.
+    """
+    import db_handler as dbHandler
+
+    def add(project_id, entries):
+        for entry in entries:
+            dbHandler.add_log({**log_entry(**entry), "project_id": project_id}, client.user["user_id"])
+    return add
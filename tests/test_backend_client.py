@@ -0,0 +1,77 @@
+"""The frontend's kept GET responses for conditional requests."""
+import requests
+from backend_client import CachedResponse, ResponseCache
+
+
+def response(status_code=200, body=b'{"projects": []}', etag='"v1"'):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body
+    response.headers["Content-Type"] = "application/json"
+    response.headers["Set-Cookie"] = "access_token_cookie=secret"
+    if etag:
+        response.headers["ETag"] = etag
+    response.request = requests.Request("GET", "http://api/api/projects", cookies={"access_token_cookie": "secret"}).prepare()
+    return response
+
+
+def test_keeps_only_status_headers_and_body():
+    cache = ResponseCache()
+    cache.update("key", response())
+
+    cached = cache.get("key")
+    assert isinstance(cached, CachedResponse)
+    assert cached.status_code == 200
+    assert cached.etag == '"v1"'
+    assert cached.json() == {"projects": []}
+    assert cached.text == '{"projects": []}'
+    assert "Set-Cookie" not in cached.headers
+    assert not hasattr(cached, "request")
+
+
+def test_not_modified_answers_with_the_kept_response():
+    cache = ResponseCache()
+    cache.update("key", response())
+    cached = cache.get("key")
+
+    assert cache.update("key", response(304, b""), cached) is cached
+    assert cache.stats()["not_modified"] == 1
+
+
+def test_changed_response_replaces_the_kept_one():
+    cache = ResponseCache()
+    cache.update("key", response())
+    cache.update("key", response(body=b'{"projects": [1]}', etag='"v2"'), cache.get("key"))
+
+    assert cache.get("key").json() == {"projects": [1]}
+    assert cache.stats()["size"] == 1
+    assert cache.stats()["bytes"] == cache.get("key").size
+
+
+def test_response_without_etag_drops_the_kept_one():
+    cache = ResponseCache()
+    cache.update("key", response())
+    cache.update("key", response(etag=None), cache.get("key"))
+
+    assert cache.get("key") is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_bounded_by_total_bytes():
+    body = b"x" * 1000
+    size = CachedResponse.from_response(response(body=body)).size
+    cache = ResponseCache(max_bytes=size * 3, max_entry_bytes=size * 3)
+    for i in range(5):
+        cache.update(f"key {i}", response(body=body))
+
+    assert cache.stats()["size"] == 3
+    assert cache.stats()["bytes"] <= cache.max_bytes
+    assert cache.stats()["evictions"] == 2
+    assert cache.get("key 0") is None and cache.get("key 4") is not None
+
+
+def test_skips_responses_that_are_too_big():
+    cache = ResponseCache(max_bytes=10_000, max_entry_bytes=100)
+    cache.update("key", response(body=b"x" * 101))
+
+    assert cache.get("key") is None
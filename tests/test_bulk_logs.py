@@ -0,0 +1,90 @@
+"""POST /api/<project_id>/logs/bulk and the batched inserts behind it."""
+import json
+import pytest
+import db_handler as dbHandler
+
+
+def entry(day, **fields):
+    return {
+        "start_time": f"2025-02-{day:02d} 09:00:00",
+        "end_time": f"2025-02-{day:02d} 11:00:00",
+        "time_worked_minutes": 120,
+        "developer_notes": f"imported {day}",
+        **fields,
+    }
+
+
+def listed(client, project_id):
+    return client.get(f"/api/{project_id}/logs", query_string={"limit": 500}).get_json()["logs"]
+
+
+def test_all_entries_added_is_201(client, project_id):
+    response = client.post(
+        f"/api/{project_id}/logs/bulk?chunk_size=3",
+        json=[entry(day, related_commits=["abc123"]) for day in range(1, 11)]
+    )
+
+    assert response.status_code == 201
+    assert response.get_json()["added"] == 10
+    assert response.get_json()["errors"] == []
+    logs = listed(client, project_id)
+    assert len(logs) == 10
+    assert {log["related_commits"] for log in logs} == {'["abc123"]'}
+
+
+def test_some_entries_added_is_207_with_their_errors(client, project_id):
+    entries = [
+        entry(1),
+        entry(2, start_time="yesterday"),
+        "not an object",
+        entry(4, time_worked_minutes=-5),
+        {"developer_notes": "no times"},
+        entry(6),
+    ]
+    response = client.post(f"/api/{project_id}/logs/bulk?chunk_size=2", json=entries)
+
+    assert response.status_code == 207
+    body = response.get_json()
+    assert (body["added"], body["failed"]) == (2, 4)
+    assert [error["index"] for error in body["errors"]] == [1, 2, 3, 4]
+    assert "start_time" in body["errors"][0]["cause"]
+    assert sorted(log["developer_notes"] for log in listed(client, project_id)) == ["imported 1", "imported 6"]
+
+
+def test_no_entries_added_is_400(client, project_id):
+    response = client.post(f"/api/{project_id}/logs/bulk", json=[entry(1, time_worked_minutes="lots")])
+
+    assert response.status_code == 400
+    assert response.get_json()["added"] == 0
+    assert listed(client, project_id) == []
+
+
+def test_ndjson_body_reports_the_lines_that_arent_json(client, project_id):
+    body = "\n".join([json.dumps(entry(1)), "", "{not json", json.dumps(entry(2))]) + "\n"
+    response = client.post(f"/api/{project_id}/logs/bulk", data=body, content_type="application/x-ndjson")
+
+    assert response.status_code == 207
+    assert response.get_json()["errors"] == [{"index": 1, "cause": "Line is not valid JSON"}]
+    assert len(listed(client, project_id)) == 2
+
+
+@pytest.mark.parametrize("path, body, status", [
+    ("/api/{project_id}/logs/bulk", {"not": "a list"}, 400),
+    ("/api/{project_id}/logs/bulk?chunk_size=0", [], 400),
+    ("/api/{project_id}/logs/bulk?chunk_size=lots", [], 400),
+    ("/api/999999/logs/bulk", [], 404),
+])
+def test_bad_requests_are_refused(client, project_id, path, body, status):
+    assert client.post(path.format(project_id=project_id), json=body).status_code == status
+
+
+def test_rows_the_database_rejects_dont_abort_the_chunk(client, project_id):
+    user_id = client.user["user_id"]
+    entries = [(0, entry(1)), (1, entry(2, developer_notes=None)), (2, entry(3))]
+
+    added, failed = dbHandler.add_logs(entries, user_id, project_id)
+
+    assert added == 2
+    assert [index for index, _ in failed] == [1]
+    assert "NOT NULL" in failed[0][1]
+    assert len(listed(client, project_id)) == 2
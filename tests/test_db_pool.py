@@ -0,0 +1,62 @@
+"""Checking connections out of the SQLite connection pool and returning them."""
+import pytest
+from db_pool import ConnectionPool
+from exceptions import DatabasePoolExhaustedException
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), size=2, timeout=0.1)
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE notes (body TEXT)")
+        conn.commit()
+    yield pool
+    pool.close()
+
+
+def test_connections_are_reused(pool):
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+
+    assert second is first
+    stats = pool.stats()
+    assert stats["opened"] == 1
+    assert stats["checkouts"] == 3
+    assert stats["in_use"] == 0
+
+
+def test_uncommitted_work_is_rolled_back_on_return(pool):
+    with pool.connection() as conn:
+        conn.execute("INSERT INTO notes VALUES ('never committed')")
+        assert conn.in_transaction
+
+    with pool.connection() as conn:
+        assert not conn.in_transaction
+        assert conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0] == 0
+
+
+def test_checkout_times_out_when_every_connection_is_in_use(pool):
+    held = [pool.acquire(), pool.acquire()]
+
+    with pytest.raises(DatabasePoolExhaustedException) as caught:
+        pool.acquire()
+    assert caught.value.error_code == "DB_POOL_EXHAUSTED"
+    assert pool.stats()["timeouts"] == 1
+
+    pool.release(held.pop())
+    with pool.connection():
+        pass
+    pool.release(held.pop())
+
+
+def test_broken_connection_is_replaced(pool):
+    with pool.connection() as conn:
+        pass
+    conn.close()
+
+    with pool.connection() as replacement:
+        assert replacement is not conn
+        assert replacement.execute("SELECT COUNT(*) FROM notes").fetchone()[0] == 0
+    assert pool.stats()["discarded"] == 1
@@ -0,0 +1,117 @@
+"""The storage PRAGMAs and the queue that serialises every write."""
+import threading
+import pytest
+from db_pool import ConnectionPool, open_connection
+from db_writer import WriteQueue
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "writer.db")
+    conn = open_connection(path)
+    conn.execute("CREATE TABLE notes (body TEXT)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def writer(path):
+    writer = WriteQueue(path)
+    yield writer
+    writer.stop()
+
+
+@pytest.fixture
+def pool(path):
+    pool = ConnectionPool(path, size=2)
+    yield pool
+    pool.close()
+
+
+def count(pool):
+    with pool.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+
+
+def test_every_connection_gets_the_storage_pragmas(pool, monkeypatch):
+    monkeypatch.setenv("DB_SYNCHRONOUS", "FULL")
+    monkeypatch.setenv("DB_BUSY_TIMEOUT_MS", "1234")
+
+    with pool.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 2
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 1234
+        assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+
+
+def test_invalid_pragma_values_are_refused(path, monkeypatch):
+    monkeypatch.setenv("DB_JOURNAL_MODE", "WAL; DROP TABLE notes")
+    with pytest.raises(ValueError):
+        open_connection(path)
+
+
+def test_write_is_committed_and_returns_its_result(writer, pool):
+    row_id = writer.run(lambda conn: conn.execute("INSERT INTO notes VALUES ('kept')").lastrowid)
+
+    assert row_id == 1
+    assert count(pool) == 1
+    assert writer.stats()["completed"] == 1
+
+
+def test_failed_write_is_rolled_back_and_raises(writer, pool):
+    def write(conn):
+        conn.execute("INSERT INTO notes VALUES ('thrown away')")
+        raise ValueError("nope")
+
+    with pytest.raises(ValueError, match="nope"):
+        writer.run(write)
+
+    assert count(pool) == 0
+    assert writer.stats()["failed"] == 1
+    # and the writer keeps going
+    writer.run(lambda conn: conn.execute("INSERT INTO notes VALUES ('kept')"))
+    assert count(pool) == 1
+
+
+def test_write_can_run_another_write(writer, pool):
+    def write(conn):
+        conn.execute("INSERT INTO notes VALUES ('outer')")
+        return writer.run(lambda inner: inner.execute("INSERT INTO notes VALUES ('inner')").lastrowid)
+
+    assert writer.run(write, timeout=5) == 2
+    assert count(pool) == 2
+
+
+def test_concurrent_writes_all_land(writer, pool):
+    def worker():
+        for _ in range(25):
+            writer.run(lambda conn: conn.execute("INSERT INTO notes VALUES ('x')"))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert count(pool) == 200
+
+
+def test_readers_dont_wait_for_an_open_write(writer, pool):
+    writing = threading.Event()
+    release = threading.Event()
+
+    def write(conn):
+        conn.execute("INSERT INTO notes VALUES ('in flight')")
+        writing.set()
+        release.wait(5)
+
+    future = writer.submit(write)
+    assert writing.wait(5)
+    try:
+        # the write's transaction is still open, and a reader sees what was there before it
+        assert count(pool) == 0
+    finally:
+        release.set()
+    future.result(5)
+    assert count(pool) == 1
@@ -0,0 +1,90 @@
+"""Streaming exports of log entries as NDJSON or a JSON array."""
+import json
+import pytest
+import db_handler as dbHandler
+from db_pool import get_pool
+
+
+@pytest.fixture
+def projects(client, project_id, add_logs):
+    other = client.post("/api/projects", data={"project_name": "other"}).get_json()["project_id"]
+    add_logs(project_id, [{"day": day, "minutes": day * 10, "notes": f"entry {day}"} for day in range(1, 8)])
+    add_logs(other, [{"day": 9, "notes": "other project"}])
+    return project_id, other
+
+
+def export(client, path, **params):
+    response = client.get(path, query_string=params)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert response.is_streamed
+    return response
+
+
+def ndjson(response):
+    assert response.mimetype == "application/x-ndjson"
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_exports_every_entry_of_the_user(client, stranger, projects):
+    exported = ndjson(export(client, "/api/logs/export"))
+    assert len(exported) == 8
+    assert {entry["project_id"] for entry in exported} == set(projects)
+
+    # and nobody else's export includes any of them
+    assert ndjson(export(stranger, "/api/logs/export")) == []
+
+
+def test_exports_one_project_like_the_listing(client, projects):
+    project_id, _ = projects
+    exported = ndjson(export(client, f"/api/{project_id}/logs/export"))
+    listed = client.get(f"/api/{project_id}/logs", query_string={"limit": 500}).get_json()["logs"]
+
+    assert exported == listed
+
+
+def test_json_array_has_the_same_entries(client, projects):
+    project_id, _ = projects
+    response = export(client, f"/api/{project_id}/logs/export", format="json")
+
+    assert response.mimetype == "application/json"
+    assert json.loads(response.get_data()) == ndjson(export(client, f"/api/{project_id}/logs/export"))
+    assert 'filename="loperlog-logs.json"' in response.headers["Content-Disposition"]
+
+
+def test_empty_json_array_is_still_valid(client, project_id):
+    assert json.loads(export(client, f"/api/{project_id}/logs/export", format="json").get_data()) == []
+
+
+def test_export_takes_the_listing_filters(client, projects):
+    project_id, _ = projects
+    exported = ndjson(export(client, f"/api/{project_id}/logs/export", time_worked_min=40, notes_contains="entry"))
+
+    assert sorted(entry["time_worked_minutes"] for entry in exported) == [40, 50, 60, 70]
+
+
+@pytest.mark.parametrize("query, status", [
+    ({"format": "xml"}, 400),
+    ({"time_worked_min": "lots"}, 400),
+])
+def test_bad_export_parameters_are_refused(client, project_id, query, status):
+    assert client.get(f"/api/{project_id}/logs/export", query_string=query).status_code == status
+
+
+def test_missing_project_is_not_found(client):
+    assert client.get("/api/999999/logs/export").status_code == 404
+
+
+def test_rows_are_read_in_batches_while_iterating(client, projects):
+    project_id, _ = projects
+    in_use = get_pool().stats()["in_use"]
+
+    rows = dbHandler.iter_devlogs(project_id=project_id, batch_size=2)
+    # nothing is read before the iteration starts
+    assert get_pool().stats()["in_use"] == in_use
+
+    first = next(rows)
+    assert first["developer_notes"] == "entry 7"
+    assert get_pool().stats()["in_use"] == in_use + 1
+
+    rows.close()
+    assert get_pool().stats()["in_use"] == in_use
@@ -0,0 +1,168 @@
+"""The frontend's identity cache, with the frontend talking to the backend test app."""
+import importlib.util
+import os
+import sys
+import time
+import jwt
+import pytest
+import backend_client
+import cache
+import identity
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the frontend's main.py, not the backend's one on the path
+spec = importlib.util.spec_from_file_location("frontend_main", os.path.join(ROOT, "src", "frontend", "main.py"))
+frontend_main = importlib.util.module_from_spec(spec)
+# Flask finds the templates relative to the module it's registered as
+sys.modules["frontend_main"] = frontend_main
+spec.loader.exec_module(frontend_main)
+
+API = frontend_main.DEFAULT_API_ENDPOINT
+
+
+class BackendResponse:
+    """The bits of a `requests` response the frontend uses, for a backend test client response"""
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.content = response.get_data()
+        self.text = response.get_data(as_text=True)
+        self.ok = response.status_code < 400
+        self._json = response.get_json(silent=True)
+
+    def json(self):
+        return self._json
+
+
+@pytest.fixture
+def calls(app, monkeypatch):
+    """Sends the frontend's API calls to the backend test app, and records their paths"""
+    calls = []
+
+    def api_request(api_endpoint, method, path, token=None, params=None, **kwargs):
+        backend = app.test_client()
+        if token:
+            backend.set_cookie(backend_client.ACCESS_COOKIE_NAME, token)
+        calls.append(path)
+        return BackendResponse(backend.open(path, method=method, query_string=params, **kwargs))
+
+    monkeypatch.setattr(backend_client, "api_request", api_request)
+    monkeypatch.setattr(frontend_main, "api_request", api_request)
+    return calls
+
+
+@pytest.fixture
+def token(client):
+    return client.get_cookie(backend_client.ACCESS_COOKIE_NAME).value
+
+
+@pytest.fixture
+def browser(token):
+    browser = frontend_main.app.test_client()
+    browser.set_cookie(backend_client.ACCESS_COOKIE_NAME, token)
+    return browser
+
+
+def test_cache_expires_entries(monkeypatch):
+    identities = identity.IdentityCache(maxsize=4, ttl=10)
+    identities.set("token", {"user_id": 1})
+    assert identities.get("token") == {"user_id": 1}
+
+    now = time.monotonic()
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now + 11)
+    assert identities.get("token") is None
+
+
+def test_cache_evicts_the_least_recently_used():
+    identities = identity.IdentityCache(maxsize=2, ttl=60)
+    identities.set("a", {"user_id": 1})
+    identities.set("b", {"user_id": 2})
+    identities.get("a")
+    identities.set("c", {"user_id": 3})
+
+    assert identities.get("b") is None
+    assert identities.get("a") == {"user_id": 1}
+    assert identities.stats()["evictions"] == 1
+
+
+def test_repeated_page_loads_ask_whoami_once(browser, calls, client):
+    for _ in range(3):
+        page = browser.get("/settings")
+        assert page.status_code == 200
+        assert client.user["username"] in page.get_data(as_text=True)
+
+    assert calls.count("/api/whoami") == 1
+    assert calls.count("/api/projects") == 3
+
+
+def test_logout_forgets_the_identity(browser, calls, token):
+    browser.get("/settings")
+    assert identity.lookup(API, token) is not None
+
+    assert browser.post("/logout", headers={"Origin": "http://localhost"}).status_code == 200
+    assert identity.lookup(API, token) is None
+    assert "/api/logout" in calls
+
+
+@pytest.mark.parametrize("headers", [
+    {},
+    {"Origin": "https://evil.example"},
+    {"Referer": "https://evil.example/logout-everyone.html"},
+])
+def test_logout_from_another_site_is_refused(browser, calls, token, headers):
+    browser.get("/settings")
+
+    assert browser.post("/logout", headers=headers).status_code == 403
+    assert identity.lookup(API, token) is not None
+    assert "/api/logout" not in calls
+
+
+def test_username_change_forgets_the_identity(browser, calls, client):
+    browser.get("/settings")
+    new_username = f"{client.user['username']}-renamed"
+
+    changed = browser.post("/settings", data={"action": "update_username", "username": new_username})
+    assert changed.status_code == 200
+
+    assert new_username in browser.get("/settings").get_data(as_text=True)
+    assert calls.count("/api/whoami") == 2
+
+
+def test_account_deletion_forgets_the_identity(browser, calls, token):
+    browser.get("/settings")
+
+    deleted = browser.post("/settings", data={"action": "delete_user"})
+    assert deleted.status_code == 302
+    assert identity.lookup(API, token) is None
+
+
+def test_revoked_token_is_not_served_from_the_cache(browser, calls, client, token):
+    browser.get("/settings")
+    client.post("/api/logout")
+
+    assert browser.get("/settings").status_code == 302
+    assert identity.lookup(API, token) is None
+
+
+def test_identity_can_come_from_the_token(browser, calls, client, token, monkeypatch):
+    monkeypatch.setattr(identity, "IDENTITY_SOURCE", "token")
+
+    assert browser.get("/settings").status_code == 200
+    assert "/api/whoami" not in calls
+    assert identity.lookup(API, token) == {
+        "user_id": client.user["user_id"],
+        "username": client.user["username"],
+        "email": client.user["email"],
+    }
+
+
+def test_untrusted_tokens_are_not_decoded(client, token):
+    claims = jwt.decode(token, options={"verify_signature": False})
+    forged = jwt.encode(claims, "a-key-that-isnt-the-backends-one-at-all", algorithm="HS256")
+    expired = jwt.encode({**claims, "exp": int(time.time()) - 60}, os.environ["JWT_SECRET_KEY"], algorithm="HS256")
+
+    assert identity.decode_identity(token)["user_id"] == client.user["user_id"]
+    assert identity.decode_identity(forged) is None
+    assert identity.decode_identity(expired) is None
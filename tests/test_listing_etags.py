@@ -0,0 +1,72 @@
+"""ETags and 304s on the projects and logs listings."""
+
+
+def get(client, path, etag=None, **params):
+    headers = {"If-None-Match": etag} if etag else {}
+    return client.get(path, query_string=params, headers=headers)
+
+
+def test_unchanged_logs_listing_is_304(client, project_id, add_logs):
+    add_logs(project_id, [{"day": 1}])
+    path = f"/api/{project_id}/logs"
+
+    first = get(client, path)
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"] == "private, no-cache"
+    etag = first.headers["ETag"]
+
+    again = get(client, path, etag)
+    assert again.status_code == 304
+    assert again.get_data() == b""
+    assert again.headers["ETag"] == etag
+
+
+def test_changes_to_the_logs_change_the_etag(client, project_id, add_logs):
+    path = f"/api/{project_id}/logs"
+    etag = get(client, path).headers["ETag"]
+
+    add_logs(project_id, [{"day": 1}])
+    added = get(client, path, etag)
+    assert added.status_code == 200
+    assert len(added.get_json()["logs"]) == 1
+
+    log_id = added.get_json()["logs"][0]["log_id"]
+    etag = added.headers["ETag"]
+    assert client.delete(f"/api/{project_id}/logs/{log_id}").status_code == 200
+    assert get(client, path, etag).status_code == 200
+
+
+def test_renaming_the_project_changes_the_logs_etag(client, project_id, add_logs):
+    add_logs(project_id, [{"day": 1}])
+    path = f"/api/{project_id}/logs"
+    etag = get(client, path).headers["ETag"]
+
+    client.put(f"/api/projects/{project_id}", data={"project_name": "renamed"})
+    renamed = get(client, path, etag)
+    assert renamed.status_code == 200
+    assert renamed.get_json()["logs"][0]["project_name"] == "renamed"
+
+
+def test_every_query_has_its_own_etag(client, project_id, add_logs):
+    add_logs(project_id, [{"day": day} for day in range(1, 4)])
+    path = f"/api/{project_id}/logs"
+    etag = get(client, path).headers["ETag"]
+
+    assert get(client, path, etag, limit=1).status_code == 200
+    assert get(client, path, etag, time_worked_min=30).status_code == 200
+    assert get(client, path, etag).status_code == 304
+
+
+def test_projects_listing_is_304_until_a_project_changes(client, project_id):
+    etag = get(client, "/api/projects").headers["ETag"]
+    assert get(client, "/api/projects", etag).status_code == 304
+
+    client.post("/api/projects", data={"project_name": "second"})
+    created = get(client, "/api/projects", etag)
+    assert created.status_code == 200
+    assert len(created.get_json()) == 2
+
+
+def test_etags_are_per_user(client, stranger, project_id):
+    etag = get(client, "/api/projects").headers["ETag"]
+    assert get(stranger, "/api/projects", etag).status_code == 200
@@ -0,0 +1,79 @@
+"""Paging through GET /api/<project_id>/logs with limit and cursor."""
+import pytest
+
+
+def all_pages(client, project_id, **params):
+    """Follows next_cursor until the last page and returns every page's log_ids"""
+    pages = []
+    cursor = None
+    while True:
+        query = {**params, **({"cursor": cursor} if cursor else {})}
+        page = client.get(f"/api/{project_id}/logs", query_string=query)
+        assert page.status_code == 200, page.get_json()
+        body = page.get_json()
+        pages.append([log["log_id"] for log in body["logs"]])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return pages
+        assert len(pages) < 100, "the cursor doesn't move forward"
+
+
+@pytest.fixture
+def logs(client, project_id, add_logs):
+    # entries added within the same second share a log_timestamp, so the log_id has to break the ties
+    add_logs(project_id, [{"day": 1, "minutes": minutes, "notes": f"fixed the parser {minutes}"} for minutes in range(23)])
+    listed = client.get(f"/api/{project_id}/logs", query_string={"limit": 500}).get_json()
+    assert listed["next_cursor"] is None
+    return listed["logs"]
+
+
+def test_newest_first_with_log_id_breaking_ties(logs):
+    keys = [(log["log_timestamp"], log["log_id"]) for log in logs]
+    assert len(keys) == 23
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_pages_cover_every_entry_once(client, project_id, logs):
+    pages = all_pages(client, project_id, limit=5)
+
+    assert [len(page) for page in pages] == [5, 5, 5, 5, 3]
+    assert [log_id for page in pages for log_id in page] == [log["log_id"] for log in logs]
+
+
+def test_last_full_page_has_no_cursor(client, project_id, logs):
+    assert all_pages(client, project_id, limit=23) == [[log["log_id"] for log in logs]]
+
+
+def test_pages_keep_the_filters(client, project_id, logs):
+    pages = all_pages(client, project_id, limit=4, time_worked_min=10)
+
+    expected = [log["log_id"] for log in logs if log["time_worked_minutes"] >= 10]
+    assert [log_id for page in pages for log_id in page] == expected
+
+
+def test_search_pages_cover_every_match_once(client, project_id, logs):
+    pages = all_pages(client, project_id, limit=4, q="parser")
+
+    listed = [log_id for page in pages for log_id in page]
+    assert sorted(listed) == sorted(log["log_id"] for log in logs)
+    assert len(listed) == len(set(listed))
+
+
+def test_columnar_pages_have_a_cursor_too(client, project_id, logs):
+    page = client.get(f"/api/{project_id}/logs", query_string={"limit": 5, "shape": "columnar"}).get_json()
+
+    assert len(page["rows"]) == 5
+    cursor = page["next_cursor"]
+    second = client.get(f"/api/{project_id}/logs", query_string={"limit": 5, "cursor": cursor}).get_json()
+    assert [log["log_id"] for log in second["logs"]] == [log["log_id"] for log in logs[5:10]]
+
+
+@pytest.mark.parametrize("query", [
+    {"limit": "many"},
+    {"limit": 0},
+    {"cursor": "not a cursor"},
+    {"cursor": "WyJhIiwiYiJd"},
+])
+def test_bad_limit_or_cursor_is_refused(client, project_id, query):
+    response = client.get(f"/api/{project_id}/logs", query_string=query)
+    assert response.status_code == 400
@@ -0,0 +1,75 @@
+"""Schema migrations, on a database that already has data in it."""
+import logging
+import sqlite3 as sql
+import pytest
+import migrations
+
+log = logging.getLogger("tests.migrations")
+
+
+@pytest.fixture
+def conn():
+    conn = sql.connect(":memory:")
+    yield conn
+    conn.close()
+
+
+def add_logs(conn, count):
+    conn.execute("INSERT INTO users (username, email, password_hash) VALUES ('dev', 'dev@example.com', 'x')")
+    conn.execute("INSERT INTO projects (project_name, created_by) VALUES ('loperlog', 1)")
+    conn.executemany(
+        """
+        INSERT INTO log_entries (user_id, project_id, start_time, end_time, time_worked_minutes, developer_notes)
+        VALUES (1, 1, '2025-01-01 09:00:00', '2025-01-01 10:00:00', 60, ?)
+        """,
+        [(f"note {i} about the parser",) for i in range(count)],
+    )
+    conn.commit()
+
+
+def test_migrates_an_empty_database(conn):
+    assert migrations.migrate(conn, log) == migrations.latest_version()
+    assert migrations.pending_migrations(conn) == []
+
+
+def test_search_index_backfills_existing_logs_in_batches(conn):
+    migrations.migrate(conn, log, target=2)
+    add_logs(conn, 25)
+
+    migrations.migrate(conn, log, batch_size=4)
+
+    assert conn.execute("SELECT COUNT(*) FROM log_entries_fts").fetchone()[0] == 25
+    matches = conn.execute("SELECT rowid FROM log_entries_fts WHERE log_entries_fts MATCH 'parser'").fetchall()
+    assert len(matches) == 25
+
+
+def test_search_index_backfill_skips_rows_already_indexed(conn):
+    migrations.migrate(conn, log, target=2)
+    add_logs(conn, 10)
+    ctx = migrations.MigrationContext(conn, log, batch_size=3)
+    conn.isolation_level = None
+    conn.execute("BEGIN IMMEDIATE")
+    migrations._search_index(ctx)
+    conn.execute("COMMIT")
+
+    # running it again (e.g. after it was interrupted) doesn't index anything twice
+    conn.execute("BEGIN IMMEDIATE")
+    migrations._search_index(ctx)
+    conn.execute("COMMIT")
+
+    assert conn.execute("SELECT COUNT(*) FROM log_entries_fts").fetchone()[0] == 10
+
+
+def test_search_index_backfill_looks_rows_up_by_rowid(conn):
+    migrations.migrate(conn, log, target=2)
+    add_logs(conn, 5)
+    statements = []
+    conn.set_trace_callback(statements.append)
+    migrations.migrate(conn, log)
+    conn.set_trace_callback(None)
+
+    backfill = next(statement for statement in statements if statement.lstrip().startswith("INSERT INTO log_entries_fts"))
+    plan = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {backfill}")]
+    # reading the whole index again for every batch makes the backfill quadratic
+    assert "SCAN log_entries_fts VIRTUAL TABLE INDEX 0:" not in plan
+    assert "SCAN log_entries_fts VIRTUAL TABLE INDEX 0:=" in plan
@@ -0,0 +1,70 @@
+"""The bounded password hashing pool."""
+import threading
+import time
+import pytest
+import password_hasher
+from exceptions import PasswordHasherBusyException
+
+
+@pytest.fixture
+def hasher():
+    hasher = password_hasher.PasswordHasher(workers=1, max_pending=2, rounds=4, timeout=0.2)
+    yield hasher
+    hasher.shutdown()
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_hash_and_check(hasher):
+    password_hash = hasher.hash("hunter2")
+    assert password_hasher.hash_rounds(password_hash) == 4
+    assert hasher.check("hunter2", password_hash)
+    assert not hasher.check("hunter3", password_hash)
+
+
+def test_slow_hash_times_out_as_busy(hasher):
+    with pytest.raises(PasswordHasherBusyException) as raised:
+        hasher._run(time.sleep, 1.0)
+    assert raised.value.error_code == "PASSWORD_HASHER_TIMEOUT"
+    assert raised.value.retry_after >= 1
+    assert hasher.stats()["timed_out"] == 1
+
+
+def test_timed_out_work_holds_its_slot_until_it_is_done(hasher):
+    for _ in range(2):
+        with pytest.raises(PasswordHasherBusyException):
+            hasher._run(time.sleep, 1.0)
+    # the first sleep is still running and the second one is queued behind it
+    assert 1 <= hasher.stats()["pending"] <= 2
+
+    wait_for(lambda: hasher.stats()["pending"] == 0)
+    assert hasher.hash("hunter2")
+
+
+def test_rejects_beyond_max_pending(hasher):
+    hasher.timeout = 10
+    busy = [threading.Thread(target=hasher._run, args=(time.sleep, 0.5)) for _ in range(2)]
+    for thread in busy:
+        thread.start()
+    wait_for(lambda: hasher.stats()["pending"] == 2)
+
+    with pytest.raises(PasswordHasherBusyException) as raised:
+        hasher.hash("hunter2")
+    assert raised.value.error_code == "PASSWORD_HASHER_BUSY"
+    assert hasher.stats()["rejected"] == 1
+
+    for thread in busy:
+        thread.join()
+    assert hasher.stats()["pending"] == 0
+
+
+def test_check_and_upgrade_rehashes_with_the_new_cost(hasher):
+    old_hash = password_hasher.PasswordHasher(workers=0, rounds=5).hash("hunter2")
+    correct, new_hash = hasher.check_and_upgrade("hunter2", old_hash)
+    assert correct and password_hasher.hash_rounds(new_hash) == 4
+    assert hasher.check_and_upgrade("wrong", old_hash) == (False, None)
@@ -0,0 +1,62 @@
+"""Project existence checks and the project cache behind them."""
+import db_handler as dbHandler
+from db_pool import get_connection
+
+
+def next_project_id():
+    with get_connection() as conn:
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'projects'").fetchone()
+    return (row[0] if row else 0) + 1
+
+
+def test_project_exists_checks_the_owner(client, project_id):
+    user_id = client.user["user_id"]
+
+    assert dbHandler.project_exists(project_id)
+    assert dbHandler.project_exists(project_id, user_id)
+    assert dbHandler.project_exists(project_id, str(user_id))
+    assert not dbHandler.project_exists(project_id, user_id + 1000)
+    assert not dbHandler.project_exists(next_project_id())
+
+
+def test_cached_project_is_not_read_again(client, project_id, monkeypatch):
+    dbHandler.clear_project_cache()
+    assert dbHandler.fetch_project(project_id)["project_name"] == "loperlog"
+
+    def no_database():
+        raise AssertionError("the project should have come from the cache")
+
+    monkeypatch.setattr(dbHandler, "get_connection", no_database)
+    assert dbHandler.project_exists(project_id)
+    assert dbHandler.fetch_project(project_id)["project_name"] == "loperlog"
+
+
+def test_cached_copies_cant_be_changed_by_the_caller(client, project_id):
+    dbHandler.fetch_project(project_id)["project_name"] = "changed"
+    assert dbHandler.fetch_project(project_id)["project_name"] == "loperlog"
+
+
+def test_creating_a_project_invalidates_it(client):
+    project_id = next_project_id()
+    assert not dbHandler.project_exists(project_id)
+
+    created = client.post("/api/projects", data={"project_name": "new"})
+    assert created.get_json()["project_id"] == project_id
+    assert dbHandler.project_exists(project_id)
+
+
+def test_updating_a_project_invalidates_it(client, project_id):
+    assert dbHandler.fetch_project(project_id)["project_name"] == "loperlog"
+
+    updated = client.put(f"/api/projects/{project_id}", data={"project_name": "renamed"})
+    assert updated.status_code == 200
+    assert dbHandler.fetch_project(project_id)["project_name"] == "renamed"
+
+
+def test_deleting_a_project_invalidates_it(client, project_id):
+    assert client.get(f"/api/{project_id}/logs").status_code == 200
+
+    deleted = client.delete(f"/api/projects/{project_id}")
+    assert deleted.status_code == 200
+    assert not dbHandler.project_exists(project_id)
+    assert client.get(f"/api/{project_id}/logs").status_code == 404
@@ -0,0 +1,124 @@
+"""The 2FA setup QR code, rendered off the request path and served from a memo."""
+import threading
+import uuid
+from urllib.parse import parse_qs, urlsplit
+import pyotp
+import pytest
+import provisioning
+from cache import MISSING
+
+
+@pytest.fixture
+def registered(app):
+    """A user that registered but hasn't verified their 2FA code yet, with their client"""
+    client = app.test_client()
+    username = f"qr-{uuid.uuid4().hex[:12]}"
+    response = client.post("/api/register", data={
+        "email": f"{username}@example.com",
+        "username": username,
+        "password": "correct horse battery staple",
+    })
+    assert response.status_code == 201
+    return client, response.get_json()
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """Counts the QR codes that actually get rendered"""
+    rendered = []
+    render_qr = provisioning.render_qr
+
+    def counting(uri, fmt):
+        rendered.append((uri, fmt))
+        return render_qr(uri, fmt)
+
+    monkeypatch.setattr(provisioning, "render_qr", counting)
+    return rendered
+
+
+def test_register_hands_out_the_uri_instead_of_an_image(registered):
+    _, user = registered
+
+    uri = urlsplit(user["provisioning_uri"])
+    assert uri.scheme == "otpauth"
+    assert parse_qs(uri.query)["secret"] == [user["totp_secret"]]
+    assert parse_qs(uri.query)["issuer"] == [provisioning.ISSUER_NAME]
+    assert "qr_code" not in user
+    assert user["qr_code_url"].startswith(f"/api/register/{user['user_id']}/qr.svg?token=")
+
+
+@pytest.mark.parametrize("fmt, url_key, magic", [
+    ("svg", "qr_code_url", b"<?xml"),
+    ("png", "qr_code_png_url", b"\x89PNG"),
+])
+def test_qr_code_is_served_with_caching_headers(registered, fmt, url_key, magic):
+    client, user = registered
+
+    response = client.get(user[url_key])
+    assert response.status_code == 200
+    assert response.mimetype == provisioning.FORMATS[fmt]
+    assert response.get_data().startswith(magic)
+    assert response.headers["Cache-Control"] == f"private, max-age={provisioning.QR_TTL_SECONDS}"
+
+    etag = response.headers["ETag"]
+    again = client.get(user[url_key], headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.get_data() == b""
+
+
+def test_qr_code_needs_its_token(registered, app):
+    client, user = registered
+    other_user = user["user_id"] + 1000
+    token = provisioning.make_token(other_user, app.config["SECRET_KEY"])
+
+    assert client.get(f"/api/register/{user['user_id']}/qr.svg").status_code == 404
+    assert client.get(f"/api/register/{user['user_id']}/qr.svg?token=forged").status_code == 404
+    assert client.get(f"/api/register/{user['user_id']}/qr.svg?token={token}").status_code == 404
+
+
+def test_qr_code_is_rendered_once(renders):
+    uri = provisioning.provisioning_uri(pyotp.random_base32(), "memo@example.com")
+    user_id = uuid.uuid4().int
+
+    provisioning.prepare(user_id, uri)
+    first = provisioning.get_qr(user_id, uri, "svg")
+    assert provisioning.get_qr(user_id, uri, "svg") == first
+    assert renders == [(uri, "svg")]
+
+    provisioning.get_qr(user_id, uri, "png")
+    assert renders == [(uri, "svg"), (uri, "png")]
+
+
+def test_slow_render_is_a_retryable_503(registered, monkeypatch):
+    client, user = registered
+    finish = threading.Event()
+
+    def slow_render(uri, fmt):
+        finish.wait(5)
+        return b"<svg/>"
+
+    monkeypatch.setattr(provisioning, "render_qr", slow_render)
+    monkeypatch.setattr(provisioning, "QR_RENDER_TIMEOUT_SECONDS", 0.05)
+    provisioning.forget(user["user_id"])
+
+    busy = client.get(user["qr_code_url"])
+    assert busy.status_code == 503
+    assert busy.headers["Retry-After"] == "1"
+
+    # the render carried on in the background, so the retry is served from the memo
+    finish.set()
+    assert client.get(user["qr_code_url"]).get_data() == b"<svg/>"
+
+
+def test_qr_code_is_gone_once_2fa_is_verified(registered):
+    client, user = registered
+    assert client.get(user["qr_code_url"]).status_code == 200
+
+    verified = client.post("/api/register/verify_2fa", data={
+        "user_id": user["user_id"],
+        "totp_code": pyotp.TOTP(user["totp_secret"]).now(),
+    })
+    assert verified.status_code == 200
+
+    assert provisioning._rendered.get((user["user_id"], "svg")) is MISSING
+    assert client.get(user["qr_code_url"]).status_code == 404
@@ -0,0 +1,33 @@
+"""Every log listing, search and hot lookup query has to be answered from an index.
+
+A filter that loses its index, or a listing that starts sorting in a temporary
+B-tree, only shows once there are enough rows to hurt, so the plans are checked here
+instead. See `query_plan_check.py` for the query shapes.
+"""
+import pytest
+import query_plan_check
+
+
+@pytest.fixture(scope="module")
+def conn():
+    conn = query_plan_check.scratch_database()
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize(
+    "query, params, allowed",
+    [pytest.param(query, params, allowed, id=name) for name, query, params, allowed in query_plan_check.all_queries()],
+)
+def test_query_plan_uses_indexes(conn, query, params, allowed):
+    assert query_plan_check.plan_problems(conn, query, params, allowed) == []
+
+
+@pytest.mark.parametrize("key", query_plan_check.FILTER_VALUES)
+def test_filter_is_applied(key):
+    # a filter the query builder doesn't know is silently dropped, and its plan never checked
+    unfiltered, _ = query_plan_check.dbHandler._build_devlogs_query(user_id=1, project_id=1, filters={})
+    filtered, _ = query_plan_check.dbHandler._build_devlogs_query(
+        user_id=1, project_id=1, filters={key: query_plan_check.FILTER_VALUES[key]}
+    )
+    assert filtered != unfiltered
@@ -0,0 +1,54 @@
+"""JSON encoding of API responses: orjson has to give the same output as Flask's own encoder."""
+import datetime
+import pytest
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+import db_handler as dbHandler
+import response_benchmark
+import responses
+
+pytestmark = pytest.mark.skipif(responses.orjson is None, reason="orjson isn't installed")
+
+
+@pytest.fixture(scope="module")
+def app():
+    return Flask(__name__)
+
+
+@pytest.fixture
+def providers(app):
+    return DefaultJSONProvider(app), responses.OrjsonProvider(app)
+
+
+def logs(rows=200):
+    # more than 9 users and projects, so numeric and string order of their ids differ
+    logs = response_benchmark.synthetic_logs(rows, projects=25)
+    for log in logs:
+        log["user_id"] = log["log_id"] % 12 + 1
+    return logs
+
+
+@pytest.mark.parametrize("shape", ["rows", "columnar"])
+def test_orjson_encodes_listings_like_the_standard_library(providers, shape):
+    listed = logs()
+    payload = {"logs": listed} if shape == "rows" else dbHandler.columnar_devlogs(listed)
+    payload["next_cursor"] = "abc"
+
+    standard, fast = (provider.response(payload).get_data() for provider in providers)
+    assert fast == standard
+
+
+def test_orjson_encodes_dates_like_the_standard_library(providers):
+    payload = {"when": datetime.datetime(2025, 1, 2, 3, 4, 5), "day": datetime.date(2025, 1, 2)}
+    standard, fast = (provider.response(payload).get_data() for provider in providers)
+    assert fast == standard
+
+
+def test_columnar_lists_users_and_projects_once():
+    listed = logs()
+    columnar = dbHandler.columnar_devlogs(listed)
+
+    assert len(columnar["rows"]) == len(listed)
+    assert set(columnar["users"]) == {str(log["user_id"]) for log in listed}
+    assert set(columnar["projects"]) == {str(log["project_id"]) for log in listed}
+    assert "username" not in columnar["columns"] and "project_name" not in columnar["columns"]
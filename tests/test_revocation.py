@@ -0,0 +1,71 @@
+"""Revoked tokens, shared between processes through the database."""
+import time
+import uuid
+import pytest
+from revocation import RevocationStore
+
+
+def jti():
+    return uuid.uuid4().hex
+
+
+@pytest.fixture
+def stores(app):
+    """Two stores on the same database, like two backend workers"""
+    return RevocationStore(sync_interval=0.2), RevocationStore(sync_interval=0.2)
+
+
+def test_own_revocations_count_immediately(stores):
+    store, _ = stores
+    token = jti()
+    assert not store.is_revoked(token)
+
+    store.revoke(token, time.time() + 60)
+    assert store.is_revoked(token)
+
+
+def test_other_processes_pick_revocations_up_after_a_sync(stores):
+    here, there = stores
+    token, other = jti(), jti()
+    assert not there.is_revoked(token)
+
+    here.revoke(token, time.time() + 60)
+    time.sleep(0.25)
+
+    assert there.is_revoked(token)
+    assert not there.is_revoked(other)
+
+
+def test_unrevoked_tokens_dont_touch_the_database(stores):
+    store, _ = stores
+    store.revoke(jti(), time.time() + 60)
+
+    for _ in range(50):
+        assert not store.is_revoked(jti())
+
+    stats = store.stats()
+    assert stats["checks"] == 50
+    # a Bloom filter false positive is possible, but not for most of them
+    assert stats["filtered"] >= 45
+
+
+def test_expired_revocations_are_purged(stores):
+    store, other = stores
+    expired, current = jti(), jti()
+    store.revoke(expired, time.time() - 1)
+    store.revoke(current, time.time() + 60)
+
+    assert store.purge_expired() >= 1
+    assert not store.is_revoked(expired)
+    assert store.is_revoked(current)
+    assert other.is_revoked(current)
+
+
+def test_logged_out_token_is_refused(client):
+    token = client.get_cookie("access_token_cookie").value
+    assert client.get("/api/whoami").status_code == 200
+
+    assert client.post("/api/logout").status_code == 200
+    # logging out deletes the cookie, so the revoked token has to be put back by hand
+    client.set_cookie("access_token_cookie", token)
+    assert client.get("/api/whoami").status_code == 401
@@ -0,0 +1,102 @@
+"""The production supervisor in the project root's main.py, with stand-in workers."""
+import asyncio
+import importlib.util
+import os
+import socket
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# main.py of the project root, not the backend's one on the path
+spec = importlib.util.spec_from_file_location("supervisor", os.path.join(ROOT, "main.py"))
+supervisor = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(supervisor)
+
+
+@pytest.fixture(autouse=True)
+def quick_reloads(monkeypatch):
+    monkeypatch.setattr(supervisor, "RELOAD_STARTUP_SECONDS", 0.3)
+
+
+@pytest.fixture
+def sock():
+    sock = socket.create_server(("127.0.0.1", 0))
+    yield sock
+    sock.close()
+
+
+class RecordingSlot(supervisor.WorkerSlot):
+    """Remembers every worker it started"""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.spawned = []
+
+    async def spawn(self):
+        proc, output = await super().spawn()
+        self.spawned.append(proc)
+        return proc, output
+
+
+def worker(fail_if_exists=None):
+    code = "import os, sys, time\n"
+    if fail_if_exists:
+        code += f"if os.path.exists({fail_if_exists!r}): sys.exit(3)\n"
+    return [sys.executable, "-c", code + "time.sleep(60)"]
+
+
+async def started(slot):
+    while slot.proc is None:
+        await asyncio.sleep(0.01)
+
+
+async def stopped(slot, task):
+    slot.stop()
+    await asyncio.wait_for(task, 10)
+    for proc in slot.spawned:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+
+
+def test_overlapping_reloads_leave_one_worker(sock):
+    async def scenario():
+        slot = RecordingSlot("backend", 1, worker(), sock)
+        task = asyncio.create_task(slot.supervise())
+        await started(slot)
+
+        # a second HUP while the first reload is still waiting for its worker
+        await asyncio.gather(slot.reload(), slot.reload())
+        await asyncio.sleep(0.2)
+        running = [proc for proc in slot.spawned if proc.returncode is None]
+        current = slot.proc
+
+        await stopped(slot, task)
+        return running, current
+
+    running, current = asyncio.run(scenario())
+    assert running == [current]
+
+
+def test_reload_keeps_the_old_worker_if_the_new_one_dies(sock, tmp_path):
+    flag = tmp_path / "broken"
+
+    async def scenario():
+        slot = RecordingSlot("backend", 1, worker(fail_if_exists=str(flag)), sock)
+        task = asyncio.create_task(slot.supervise())
+        await started(slot)
+        old = slot.proc
+        # past its check before the new one is broken
+        await asyncio.sleep(0.5)
+
+        flag.touch()
+        await slot.reload()
+        kept = slot.proc is old and old.returncode is None
+
+        await stopped(slot, task)
+        return kept, len(slot.spawned)
+
+    kept, spawned = asyncio.run(scenario())
+    assert kept
+    assert spawned == 2